@@ -0,0 +1,43 @@
+# =============================================================================
+# loopback.py — Throwaway GhostNetwork nodes for benchmarks and tests
+# =============================================================================
+#
+# Each node gets its own home folder under ``root`` with a fresh salt file, so
+# identity.get_hardware_locked_identity derives a new identity per run. Nodes
+# read their trust list from a shared ``peers`` dict that trust() fills in.
+#
+# =============================================================================
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from core.identity import get_hardware_locked_identity
+from core.network_manager import GhostNetwork
+
+
+def make_node(root, name, peers, port=0, **kwargs):
+    """A GhostNetwork on loopback (ephemeral port by default), with a throwaway identity."""
+    home = os.path.join(root, name)
+    os.makedirs(home, exist_ok=True)
+    salt_path = os.path.join(home, "salt.bin")
+    with open(salt_path, "wb") as f:
+        f.write(os.urandom(64))
+    identity = get_hardware_locked_identity(name, "loopback", salt_path)
+    kwargs.setdefault("receive_dir", os.path.join(home, "received"))
+    node = GhostNetwork(
+        name, None, identity["identity_pub_hex"], identity["sync_priv"], port=port,
+        identity_priv_key=identity["identity_priv"], peer_source=lambda: peers, **kwargs
+    )
+    node.identity = identity
+    return node
+
+
+def trust(peers, alias, node, projects=()):
+    peers[alias] = {"ghost_id": node.ghost_id, "public_key": node.sync_pub_hex,
+                    "permissions": {"projects": list(projects), "inventory": []}}
+
+
+def target_of(alias, node):
+    return {"alias": alias, "ip": "127.0.0.1", "port": node.port,
+            "ghost_id": node.ghost_id, "public_key": node.sync_pub_hex}
@@ -0,0 +1,116 @@
+# =============================================================================
+# matchmaker_load.py — Room-join load test for the matchmaker
+# Usage: python -m benchmarks.matchmaker_load --rooms 10000 --concurrency 500
+# =============================================================================
+#
+# Starts a GhostMatchmaker on localhost in a separate process (or targets one
+# with --host/--port) and pairs up 2 x --rooms clients, reporting joins/sec,
+# match latency percentiles and failures.
+#
+# =============================================================================
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from core.matchmaker import GhostMatchmaker, request_match
+
+
+def _run_server(port, stats_port, ready):
+    async def main():
+        matchmaker = GhostMatchmaker(host="127.0.0.1", port=port, max_per_ip=0, stats_port=stats_port)
+        server = await matchmaker.serve()
+        ready.set()
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
+
+
+async def _join(host, port, room_id, ghost_id, latencies, failures):
+    started = time.perf_counter()
+    try:
+        partner = await request_match(host, room_id, ghost_id, port=port, timeout=30)
+        if partner and partner.get("ghost_id"):
+            latencies.append(time.perf_counter() - started)
+        else:
+            failures.append("no match")
+    except Exception as e:
+        failures.append(type(e).__name__)
+
+
+async def _run_load(host, port, rooms, concurrency, stagger):
+    gate = asyncio.Semaphore(concurrency)
+    latencies, failures = [], []
+
+    async def room(i):
+        async with gate:
+            room_id = f"bench-{i:08x}"
+            first = asyncio.create_task(_join(host, port, room_id, f"a{i}", latencies, failures))
+            await asyncio.sleep(stagger)
+            await _join(host, port, room_id, f"b{i}", latencies, failures)
+            await first
+
+    started = time.perf_counter()
+    await asyncio.gather(*(room(i) for i in range(rooms)))
+    return time.perf_counter() - started, latencies, failures
+
+
+def _percentile(values, pct):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matchmaker room-join load test")
+    parser.add_argument("--rooms", type=int, default=10000, help="rooms to fill (2 joins each)")
+    parser.add_argument("--concurrency", type=int, default=500, help="rooms in flight at once")
+    parser.add_argument("--stagger", type=float, default=0.005, help="seconds between the two joins of a room")
+    parser.add_argument("--host", default=None, help="existing matchmaker to target instead of a local one")
+    parser.add_argument("--port", type=int, default=19999)
+    parser.add_argument("--stats-port", type=int, default=19998, help="matchmaker stats endpoint (local instance)")
+    args = parser.parse_args()
+
+    server = None
+    host = args.host or "127.0.0.1"
+    if not args.host:
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(target=_run_server, args=(args.port, args.stats_port, ready), daemon=True)
+        server.start()
+        if not ready.wait(10):
+            sys.exit("Matchmaker did not come up")
+
+    server_stats = None
+    try:
+        elapsed, latencies, failures = asyncio.run(
+            _run_load(host, args.port, args.rooms, args.concurrency, args.stagger)
+        )
+        if server:
+            with urllib.request.urlopen(f"http://127.0.0.1:{args.stats_port}/", timeout=5) as resp:
+                server_stats = json.loads(resp.read())
+    finally:
+        if server:
+            server.terminate()
+
+    joins = len(latencies) + len(failures)
+    print(f"joins:        {joins} ({len(failures)} failed)")
+    print(f"elapsed:      {elapsed:.2f}s")
+    print(f"joins/sec:    {joins / elapsed:.0f}")
+    print(f"match p50:    {_percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"match p95:    {_percentile(latencies, 95) * 1000:.1f} ms")
+    print(f"match p99:    {_percentile(latencies, 99) * 1000:.1f} ms")
+    if failures:
+        kinds = {k: failures.count(k) for k in set(failures)}
+        print(f"failures:     {kinds}")
+    if server_stats:
+        print(f"server stats: {json.dumps(server_stats)}")
+
+
+if __name__ == "__main__":
+    main()
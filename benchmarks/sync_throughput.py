@@ -0,0 +1,165 @@
+# =============================================================================
+# sync_throughput.py — GhostNetwork transfer benchmark over loopback
+# Usage: python -m benchmarks.sync_throughput --profiles small,medium,large --loss 0,0.01,0.05
+# =============================================================================
+#
+# Boots two GhostNetwork nodes in this process with throwaway identities
+# (benchmarks.loopback, shared with the tests), trusts them to each other and
+# pushes synthetic project files from A to B. Each run reports throughput,
+# per-stream latency, CPU per MB (both nodes, same process) and the retransmit
+# rate. Packet loss and reordering are injected by LossyTransport,
+# which wraps the sender's socket in-process, so no root or netem is needed.
+#
+# =============================================================================
+
+import argparse
+import asyncio
+import base64
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.loopback import make_node, target_of, trust
+from core.network_manager import CHUNK_SIZE
+
+# name -> (file count, file size). Sizes are plaintext; files are written base64
+# encoded like the vault's Fernet tokens, so compression behaves realistically.
+PROFILES = {
+    "small": (200, 2 * 1024),
+    "medium": (20, 256 * 1024),
+    "large": (2, 16 * 1024 * 1024),
+}
+
+
+class LossyTransport:
+    """
+    Stands in for the sender's DatagramTransport: drops a share of datagrams and
+    holds some back by ``delay`` seconds so they land out of order.
+    """
+
+    def __init__(self, transport, loop, loss=0.0, reorder=0.0, delay=0.005, seed=1):
+        self.transport = transport
+        self.loop = loop
+        self.loss = loss
+        self.reorder = reorder
+        self.delay = delay
+        self.random = random.Random(seed)
+        self.dropped = 0
+        self.reordered = 0
+
+    def sendto(self, data, addr):
+        roll = self.random.random()
+        if roll < self.loss:
+            self.dropped += 1
+        elif roll < self.loss + self.reorder:
+            self.reordered += 1
+            self.loop.call_later(self.delay, self.transport.sendto, data, addr)
+        else:
+            self.transport.sendto(data, addr)
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+
+def _write_files(root, profile):
+    count, size = PROFILES[profile]
+    folder = os.path.join(root, f"out_{profile}")
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"{profile}_{i:04d}.enc")
+        with open(path, "wb") as f:
+            f.write(base64.urlsafe_b64encode(os.urandom(size * 3 // 4)))
+        paths.append(path)
+    return paths
+
+
+def _percentile(values, pct):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _run_case(sender, receiver, target, paths, loss, reorder, repeat):
+    shim = LossyTransport(sender.transport, sender.loop, loss=loss, reorder=reorder)
+    sender.loop.call_soon_threadsafe(setattr, sender, "transport", shim)
+    sender.submit(asyncio.sleep(0)).result()
+
+    results = []
+    try:
+        for _ in range(repeat):
+            cpu, wall = time.process_time(), time.perf_counter()
+            stats = sender.sync_files([target], paths).result()
+            results.append((stats, time.process_time() - cpu, time.perf_counter() - wall))
+    finally:
+        sender.loop.call_soon_threadsafe(setattr, sender, "transport", shim.transport)
+    return results, shim
+
+
+def _report(profile, loss, reorder, results, shim):
+    stats = [r[0] for r in results]
+    sent = sum(s["bytes"] for s in stats)
+    wall = sum(r[2] for r in results)
+    cpu = sum(r[1] for r in results)
+    chunks = sum(max(1, -(-t["bytes"] // CHUNK_SIZE)) for s in stats for t in s["transfers"])
+    retransmits = sum(s["retransmits"] for s in stats)
+    latencies = [t["seconds"] for s in stats for t in s["transfers"] if t["ok"]]
+    failed = sum(len(s["failed"]) for s in stats)
+    mb = sent / (1024 * 1024)
+
+    print(f"{profile:>7} loss={loss:<5.1%} reorder={reorder:<5.1%} "
+          f"{mb / wall if wall else 0:7.1f} MB/s  "
+          f"p50 {_percentile(latencies, 50) * 1000:7.1f} ms  p95 {_percentile(latencies, 95) * 1000:7.1f} ms  "
+          f"cpu {cpu * 1000 / mb if mb else 0:6.1f} ms/MB  "
+          f"retx {retransmits / chunks if chunks else 0:6.2%}  "
+          f"failed {failed}  (dropped {shim.dropped}, reordered {shim.reordered})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GhostNetwork sync throughput benchmark")
+    parser.add_argument("--profiles", default="small,medium,large", help=f"comma list of {', '.join(PROFILES)}")
+    parser.add_argument("--loss", default="0,0.01,0.05", help="comma list of datagram loss rates")
+    parser.add_argument("--reorder", type=float, default=0.02, help="share of datagrams delivered late (lossy runs)")
+    parser.add_argument("--repeat", type=int, default=3, help="syncs per case, over one pooled session")
+    parser.add_argument("--port", type=int, default=25555, help="first of two sync ports")
+    parser.add_argument("--upload-limit", type=int, default=0, help="sender upload cap in bytes/s (0 = none)")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="ghost_bench_")
+    peers = {}
+    sender = make_node(root, "bench_a", peers, port=args.port)
+    receiver = make_node(root, "bench_b", peers, port=args.port + 1)
+    trust(peers, "A", sender)
+    trust(peers, "B", receiver)
+    target = target_of("B", receiver)
+
+    sender.upload_limit = args.upload_limit
+    sender.start()
+    receiver.start()
+    try:
+        # Cold start: handshake plus one tiny file, then the same on the pooled session
+        probe = _write_files(root, "small")[:1]
+        for label in ("cold", "warm"):
+            started = time.perf_counter()
+            sender.sync_files([target], probe).result()
+            print(f"{label} single-file sync: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        for profile in args.profiles.split(","):
+            paths = _write_files(root, profile.strip())
+            for loss in (float(x) for x in args.loss.split(",")):
+                reorder = args.reorder if loss else 0.0
+                results, shim = _run_case(sender, receiver, target, paths, loss, reorder, args.repeat)
+                _report(profile.strip(), loss, reorder, results, shim)
+        print(f"receiver: rx_dropped={receiver.rx_dropped} rx_rejected={receiver.rx_rejected}")
+    finally:
+        sender.stop()
+        receiver.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
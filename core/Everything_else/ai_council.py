@@ -1,9 +1,18 @@
 # =============================================================
 # AI COUNCIL v7.3 — FULL PRODUCTION SCRIPT (FIXED INDENTS)
 # =============================================================
-import json, os, re
+import json, os, re, queue, threading
+from collections import OrderedDict
 from cryptography.fernet import Fernet
-from model_registry import load_model_from_config
+from Everything_else.model_registry import load_model_from_config, resolve_model, stream_batch, config_fingerprint, MODEL_PRELOADER, PREFIX_CACHE, BATCHING
+from Everything_else.expert_router import ExpertRouter
+from Everything_else.council_cache import council_cache
+
+# Run independent experts concurrently (see run_council_streaming)
+PARALLEL_EXPERTS = os.environ.get("JYNX_PARALLEL_EXPERTS", "0") == "1"
+# In parallel mode, decode experts that share a weights file as one batch
+BATCHED_EXPERTS = os.environ.get("JYNX_BATCHED_EXPERTS", "1") == "1"
+EXPERT_CALL = {"max_tokens": 800, "temperature": 0.7, "stop": ["User:", "You:", "Operator:", "Instruction:"]}
 
 # --- CONFIGURATION & MAPPING ---
 PRETTY_NAMES = {
@@ -61,6 +70,9 @@ FIELD_DESCRIPTIONS = {
     "jynx_expert_mental_health": "therapeutic resilience",
 }
 
+# Picks experts from the request itself; the summarizer is only asked when it's unsure
+ROUTER = ExpertRouter({k: v for k, v in FIELD_DESCRIPTIONS.items() if k in EXPERT_MAP.values()})
+
 # --- NEURAL MAPPING HELPERS ---
 def get_user_profile_context(username, fernet):
     try:
@@ -84,13 +96,148 @@ def get_user_profile_context(username, fernet):
     except Exception: pass
     return f"\n[OPERATOR NEURAL MAP]\nCallsign: {username}\n"
 
+def _pick_experts(text):
+    """Expert ids named in the summarizer's output, first three, in EXPERT_MAP order."""
+    search_text = text.lower()
+    expert_ids = [model_id for keyword, model_id in EXPERT_MAP.items() if keyword in search_text]
+    return list(dict.fromkeys(expert_ids))[:3]
+
+def _transcript(profile_block, user_prompt, notes):
+    """
+    What every stage's prompt opens with: the profile, the request and the notes so
+    far. Notes are only ever appended, so one stage's transcript starts the next
+    one's and the verdict's.
+    """
+    return f"""{profile_block}
+User Request: "{user_prompt}"
+
+Council Notes:
+{notes}"""
+
+def _expert_prompt(expert_id, transcript, lead):
+    expert_name = PRETTY_NAMES.get(expert_id, expert_id)
+    field = FIELD_DESCRIPTIONS.get(expert_id, "expertise")
+    standing = "You are the lead expert for this request." if lead else "Build on the notes above."
+    return f"""{transcript}
+Persona: You are the {expert_name}, an expert in {field}. {standing}
+
+Task:
+1. Provide a new perspective from your expertise in {field}.
+2. Bring new ideas and ensure a unique contribution.
+3. Try your best, no wrong answers.
+Response:"""
+
+def _expert_tokens(expert_id, profile_block, transcript, lead):
+    """Streams one expert's answer as text tokens."""
+    llm_fn, _ = load_model_from_config(expert_id)
+    expert_prompt = _expert_prompt(expert_id, transcript, lead)
+    for chunk in llm_fn(expert_prompt, stream_override=True, prefix=(profile_block, transcript), persist=profile_block, **EXPERT_CALL):
+        token = chunk if isinstance(chunk, str) else chunk.get("choices", [{}])[0].get("text") or chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
+        if token:
+            yield token
+
+def _run_experts_parallel(expert_ids, profile_block, transcript, lead):
+    """
+    One thread per weights file: experts on different models run side by side. Experts
+    sharing a loaded instance are decoded together as one batch (BATCHED_EXPERTS), or
+    take turns on it if this llama_cpp can't batch or the batch context doesn't fit. Events from all threads come out of
+    one queue in arrival order.
+    """
+    groups = OrderedDict()
+    for expert_id in expert_ids:
+        try:
+            weights = resolve_model(expert_id)[0]["model_path"]
+        except Exception:
+            weights = expert_id
+        groups.setdefault(weights, []).append(expert_id)
+
+    events = queue.Queue()
+
+    def run_expert(expert_id, tokens):
+        expert_name = PRETTY_NAMES.get(expert_id, expert_id)
+        events.put(("expert_start", expert_name))
+        expert_buffer = ""
+        try:
+            for token in tokens:
+                expert_buffer += token
+                events.put(("expert_token", expert_name, token))
+        except Exception as e:
+            expert_buffer += f"[{expert_name} error: {e}]"
+            events.put(("expert_token", expert_name, f"[error: {e}]"))
+        events.put(("expert_done", expert_name, expert_buffer))
+
+    def run_group(group):
+        streams = None
+        if BATCHED_EXPERTS and BATCHING and len(group) > 1:
+            try:
+                call = dict(EXPERT_CALL, prefix=(profile_block, transcript))
+                streams = stream_batch([(expert_id, _expert_prompt(expert_id, transcript, lead), call) for expert_id in group])
+            except Exception as e:
+                print(f"[Jynx] Batched decoding unavailable, experts take turns: {e}")
+        if streams:
+            readers = [threading.Thread(target=run_expert, args=(expert_id, stream), daemon=True, name="jynx-expert")
+                       for expert_id, stream in zip(group, streams)]
+            for reader in readers: reader.start()
+            for reader in readers: reader.join()
+        else:
+            for expert_id in group:
+                run_expert(expert_id, _expert_tokens(expert_id, profile_block, transcript, lead))
+        events.put(None)
+
+    for group in groups.values():
+        threading.Thread(target=run_group, args=(group,), daemon=True, name="jynx-expert").start()
+
+    running = len(groups)
+    while running:
+        event = events.get()
+        if event is None:
+            running -= 1
+        else:
+            yield event
+
 # --- MAIN ENGINE ---
-def run_council_streaming(user_prompt, image_path=None, username="Operator", fernet=None):
-    previous_notes = ""
+def run_council_streaming(user_prompt, image_path=None, username="Operator", fernet=None, parallel=None, use_cache=True):
+    """
+    Yields the council's events. With ``parallel`` (default: JYNX_PARALLEL_EXPERTS)
+    the experts don't see each other's notes and run concurrently, their tokens
+    interleaved as ("expert_token", name, token); the verdict waits for all of them.
+
+    A logged-in user's finished runs are cached: the same request with the same
+    image, profile and models replays the recorded events. ``use_cache=False`` runs
+    the council anyway and replaces the recorded answer.
+    """
+    parallel = PARALLEL_EXPERTS if parallel is None else parallel
     user_context = get_user_profile_context(username, fernet) if fernet else f"\n[OPERATOR NEURAL MAP]\nCallsign: {username}\n"
 
+    cache, key = council_cache(username, fernet), None
+    if cache:
+        try:
+            key = cache.key(user_prompt, image_path, user_context, config_fingerprint(list(PRETTY_NAMES)),
+                            parallel=parallel, router=ROUTER.threshold)
+        except OSError as e:
+            print(f"[Jynx] Council cache skipped: {e}")
+    if key and use_cache:
+        events = cache.load(key)
+        if events is not None:
+            print(f"[Jynx] Council cache hit, replaying {len(events)} events")
+            yield from events
+            return
+
+    events = []
+    for event in _run_council(user_prompt, image_path, user_context, parallel):
+        events.append(event)
+        yield event
+    # Only complete runs are kept; an expert that failed shouldn't be replayed
+    if key and events[-1][0] == "done" and not any(e[0] == "expert_token" and str(e[2]).startswith("[error:") for e in events):
+        cache.save(key, events)
+
+def _run_council(user_prompt, image_path, user_context, parallel):
+    previous_notes = ""
+    routed, confidence = ROUTER.route(user_prompt)
+
     # === 0. VISION ===
     if image_path:
+        MODEL_PRELOADER.ahead(routed or ["jynx_summarizer"])      # loads while vision runs
         yield ("expert_start", "Vision Expert")
         vision_prompt = f"{user_context}\nAnalyze visual data for: {user_prompt}"
         try:
@@ -105,13 +252,27 @@ def run_council_streaming(user_prompt, image_path=None, username="Operator", fer
         except Exception as e:
             previous_notes += f"Vision Error: {str(e)}\n"
 
-    # === 1. SUMMARIZER & ROUTING ===
-    summarizer_prompt = f"""
+    # Every stage opens with the transcript (profile block, request, notes so far) and
+    # only appends to it, so the model keeps the last stage's start evaluated and
+    # reads just the notes added since; the profile block is kept across sessions
+    profile_block = f"""
 [SYSTEM DATA: USER PROFILE]
 {user_context}
 [END PROFILE]
+"""
 
-TASK: Analyze the "Current Input" below. 
+    # === 1. ROUTING ===
+    if routed:
+        # The request named its fields clearly enough: skip the summarizer pass
+        expert_ids = routed
+        MODEL_PRELOADER.ahead(expert_ids)
+        routing_note = f"\n**Experts:** {', '.join(PRETTY_NAMES.get(e, e) for e in expert_ids)} (matched {confidence:.0%})"
+        yield ("summary", routing_note)
+        yield ("summary_done", routing_note)
+    else:
+        transcript = _transcript(profile_block, user_prompt, previous_notes)
+        summarizer_prompt = f"""{transcript}
+TASK: Analyze the "User Request" above.
 1. Provide a 1-sentence summary of what the user is asking.
 2. Select the 3 most relevant experts from the ALLOWED list.
 
@@ -120,70 +281,59 @@ ALLOWED EXPERTS: Logic, Math, Coding, Emotion, Survival, Finance, Psychology, Me
 EXACT OUTPUT FORMAT:
 ***SUMMARY*** <brief summary>
 ***EXPERTS*** <list of experts>
-
-Current Input: "{user_prompt}"
 Response:"""
 
-    llm_fn, _ = load_model_from_config("jynx_summarizer")
-    summary_buffer = ""
-    for chunk in llm_fn(summarizer_prompt, stream_override=True, max_tokens=200, temperature=0.1):
-        token = chunk.get("choices", [{}])[0].get("text") or chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
-        if token:
-            summary_buffer += token
-            display_token = token.replace("***SUMMARY***", "**Target:**").replace("***EXPERTS***", "\n**Experts:**")
-            yield ("summary", display_token)
-    yield ("summary_done", summary_buffer)
-
-    # === 2. ROBUST EXPERT SELECTION (FUZZY) ===
-    expert_ids = []
-    search_text = summary_buffer.lower()
-    for keyword, model_id in EXPERT_MAP.items():
-        if keyword in search_text:
-            expert_ids.append(model_id)
-
-    expert_ids = list(dict.fromkeys(expert_ids))[:3]
-    if not expert_ids:
-        expert_ids = ["jynx_expert_logic", "jynx_expert_psychology"]
-
-    # === 3. SEQUENTIAL EXPERT LOOP ===
-    for expert_id in expert_ids:
-        expert_name = PRETTY_NAMES.get(expert_id, expert_id)
-        field = FIELD_DESCRIPTIONS.get(expert_id, "expertise")
-        yield ("expert_start", expert_name)
-
-        expert_prompt = f"""{user_context}
-Persona: You are the {expert_name}, an expert in {field}. 
-
-Previous Insights: 
-{previous_notes or "You are the lead expert for this request."}
-
-User Request: "{user_prompt}"
+        llm_fn, _ = load_model_from_config("jynx_summarizer")
+        summary_buffer = ""
+        predicted = []
+        for chunk in llm_fn(summarizer_prompt, stream_override=True, max_tokens=200, temperature=0.1, prefix=(profile_block, transcript), persist=profile_block):
+            token = chunk.get("choices", [{}])[0].get("text") or chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
+            if token:
+                summary_buffer += token
+                # Start loading experts as soon as the summarizer names them
+                named = _pick_experts(summary_buffer.partition("***EXPERTS***")[2])
+                if named != predicted:
+                    predicted = named
+                    MODEL_PRELOADER.ahead(predicted)
+                display_token = token.replace("***SUMMARY***", "**Target:**").replace("***EXPERTS***", "\n**Experts:**")
+                yield ("summary", display_token)
+        yield ("summary_done", summary_buffer)
 
-Task:
-1. Provide a new perspective from your expertise in {field}.
-2. Bring new ideas and ensure a unique contribution.
-3. Try your best, no wrong answers.
-Response:"""
+        # === 2. ROBUST EXPERT SELECTION (FUZZY) ===
+        expert_ids = _pick_experts(summary_buffer)
+        if not expert_ids:
+            expert_ids = ["jynx_expert_logic", "jynx_expert_psychology"]
 
-        llm_fn, _ = load_model_from_config(expert_id)
-        expert_buffer = ""
-        for chunk in llm_fn(expert_prompt, stream_override=True, max_tokens=800, temperature=0.7, stop=["User:", "You:", "Operator:", "Instruction:"]):
-            token = chunk if isinstance(chunk, str) else chunk.get("choices", [{}])[0].get("text") or chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
-            if token:
+    # === 3. EXPERTS ===
+    if parallel:
+        outputs = {}
+        transcript = _transcript(profile_block, user_prompt, previous_notes)
+        for event in _run_experts_parallel(expert_ids, profile_block, transcript, not previous_notes):
+            if event[0] == "expert_done":
+                outputs[event[1]] = event[2]
+            yield event
+        for expert_id in expert_ids:
+            expert_name = PRETTY_NAMES.get(expert_id, expert_id)
+            previous_notes += f"[{expert_name}]: {outputs.get(expert_name, '')}\n\n"
+    else:
+        for expert_id in expert_ids:
+            expert_name = PRETTY_NAMES.get(expert_id, expert_id)
+            yield ("expert_start", expert_name)
+            expert_buffer = ""
+            transcript = _transcript(profile_block, user_prompt, previous_notes)
+            for token in _expert_tokens(expert_id, profile_block, transcript, not previous_notes):
                 expert_buffer += token
                 yield ("expert_token", expert_name, token)
-        
-        previous_notes += f"[{expert_name}]: {expert_buffer}\n\n"
-        yield ("expert_done", expert_name, expert_buffer)
+
+            previous_notes += f"[{expert_name}]: {expert_buffer}\n\n"
+            yield ("expert_done", expert_name, expert_buffer)
 
     # === 4. FINAL VERDICT ===
     yield ("verdict_start", "")
-    verdict_prompt = f"""{user_context}
+    transcript = _transcript(profile_block, user_prompt, previous_notes)
+    verdict_prompt = f"""{transcript}
 Review the Council's notes and provide a final synthesis.
 
-Notes:
-{previous_notes}
-
 Format:
 **Final Verdict:** [1-2 concise paragraphs]
 **Actionable Takeaways:**
@@ -193,8 +343,12 @@ Format:
 Verdict:"""
     
     llm_fn, _ = load_model_from_config("jynx_summarizer")
-    for chunk in llm_fn(verdict_prompt, stream_override=True, max_tokens=600, temperature=0.2):
+    for chunk in llm_fn(verdict_prompt, stream_override=True, max_tokens=600, temperature=0.2, prefix=(profile_block, transcript), persist=profile_block):
         token = chunk.get("choices", [{}])[0].get("text") or chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
         if token:
             yield ("verdict_token", token)
+
+    stats = PREFIX_CACHE.stats()
+    print(f"[Jynx] Prefix cache: {stats['hit_rate']:.0%} hit rate, {stats['tokens_saved']} tokens reused, "
+          f"{stats['tokens_evaluated']} evaluated, {stats['bytes'] / 1048576:.1f} MB held")
     yield ("done", "")
\ No newline at end of file
@@ -0,0 +1,79 @@
+# council_cache.py
+
+import hashlib
+import json
+import os
+from core.paths import USER_DATA
+from Everything_else.encrypted_store import EncryptedFileStore
+
+# Finished council runs, replayed when the same request comes in again. Entries are
+# Fernet-encrypted with the user's key and evicted least recently used first.
+COUNCIL_CACHE_BYTES = int(os.environ.get("JYNX_COUNCIL_CACHE_MB", 64)) * 1024 * 1024
+CACHE_SUFFIX = ".council"
+CACHE_VERSION = 2           # bump when the council's prompts or event format change
+
+
+def normalize_prompt(prompt):
+    """Case and spacing don't change what the council is asked."""
+    return " ".join((prompt or "").casefold().split())
+
+
+def file_hash(path):
+    if not path:
+        return None
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class CouncilCache(EncryptedFileStore):
+    """
+    Recorded event streams of finished council runs, one encrypted file per key,
+    least recently used first out once the folder is over its byte cap.
+    """
+    suffix = CACHE_SUFFIX
+    label = "council cache entry"
+
+    def __init__(self, fernet, directory, capacity=COUNCIL_CACHE_BYTES):
+        super().__init__(fernet, directory, capacity)
+
+    @staticmethod
+    def key(prompt, image_path, profile, models, **settings):
+        """Everything a run's output depends on: request, image, profile, models and council settings."""
+        parts = {
+            "version": CACHE_VERSION,
+            "prompt": normalize_prompt(prompt),
+            "image": file_hash(image_path),
+            "profile": hashlib.sha256(profile.encode("utf-8")).hexdigest(),
+            "models": models,
+            "settings": settings,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def load(self, key):
+        """The stored events for ``key`` as tuples, or None."""
+        def decode(raw):
+            record = json.loads(raw)
+            if record["key"] != key:
+                raise ValueError("key mismatch")
+            return [tuple(event) for event in record["events"]]
+        return self._read(self._file(key), decode)
+
+    def save(self, key, events):
+        raw = json.dumps({"key": key, "events": [list(event) for event in events]}).encode()
+        self._write(self._file(key), raw)
+
+
+_caches = {}
+
+
+def council_cache(username, fernet):
+    """The cache for a logged-in user; None without a key to encrypt it with."""
+    if fernet is None:
+        return None
+    cache = _caches.get(username)
+    if cache is None or cache.fernet is not fernet:
+        cache = _caches[username] = CouncilCache(fernet, os.path.join(USER_DATA, f"{username}_council_cache"))
+    return cache
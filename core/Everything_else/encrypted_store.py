@@ -0,0 +1,84 @@
+# encrypted_store.py
+
+import os
+import threading
+
+
+class EncryptedFileStore:
+    """
+    A folder of Fernet-encrypted files, one per entry, capped in bytes. Reading a
+    hit refreshes its mtime; once the folder is over ``capacity`` the least recently
+    used files go. Unreadable files (wrong key, truncated, failing ``decode``) are
+    dropped on sight. Subclasses name the files and encode the entries.
+    """
+    suffix = ".bin"
+    label = "entry"             # for log lines
+
+    def __init__(self, fernet, directory, capacity):
+        self.fernet = fernet
+        self.directory = directory
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _file(self, name):
+        return os.path.join(self.directory, name[:40] + self.suffix)
+
+    def _read(self, path, decode):
+        """``decode(plaintext)`` for the file at ``path``, or None (and the file dropped) if it fails."""
+        try:
+            with open(path, "rb") as f:
+                value = decode(self.fernet.decrypt(f.read()))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"[Jynx] Dropping unreadable {self.label}: {type(e).__name__} {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        os.utime(path)      # recency for eviction
+        self.hits += 1
+        return value
+
+    def _write(self, path, raw):
+        with self._lock:
+            try:
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(self.fernet.encrypt(raw))
+                os.replace(tmp_path, path)
+                self.writes += 1
+                self._evict()
+            except Exception as e:
+                print(f"[Jynx] Could not store {self.label}: {e}")
+
+    def _evict(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.capacity: break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(self.suffix):
+                    self._remove(entry.path)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
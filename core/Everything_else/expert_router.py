@@ -0,0 +1,137 @@
+# expert_router.py
+
+import math
+import os
+import re
+from collections import Counter
+
+# Below this confidence the router defers to the summarizer model
+ROUTER_THRESHOLD = float(os.environ.get("JYNX_ROUTER_THRESHOLD", 0.5))
+RELATIVE_CUTOFF = 0.5       # runners-up must cover at least half as much as the best match
+MIN_TERMS = 2               # request terms a field must know before the router picks it
+FULL_EVIDENCE_TERMS = 3     # terms every picked field knows for full confidence; fewer scale it down
+
+# Field descriptions are a few abstract words; requests name concrete things
+# ("budget", "fever", "firewall"). Each expert's document is its description plus these.
+ROUTING_KEYWORDS = {
+    "jynx_expert_logic": "logic logical reason reasoning argument fallacy premise conclusion deduce deduction "
+                         "proof prove paradox contradiction valid puzzle riddle syllogism consistent inference",
+    "jynx_expert_math": "math mathematics calculate calculation equation formula number percent percentage "
+                        "probability statistic average median algebra geometry calculus integral "
+                        "derivative solve ratio estimate odds",
+    "jynx_expert_coding": "code coding program programming software bug debug function class python javascript "
+                          "script api database sql algorithm compile error exception refactor git app website "
+                          "server backend frontend",
+    "jynx_expert_emotion": "feel feeling emotion emotional sad angry happy lonely hurt upset love heartbreak "
+                           "grief cry jealous frustrated excited empathy relationship breakup",
+    "jynx_expert_survival": "survival survive wilderness camping shelter water food fire emergency disaster "
+                            "storm flood outage evacuate prepper supplies first aid hike hiking lost stranded "
+                            "tactical risk",
+    "jynx_expert_finance": "money finance financial budget salary income expense saving save invest investment "
+                           "stock stocks crypto bitcoin market price loan debt mortgage tax retirement bank "
+                           "inflation economy profit rent cost",
+    "jynx_expert_psychology": "psychology behavior behaviour habit motivation personality bias cognitive "
+                              "procrastination mindset manipulation persuasion memory decision trait narcissist",
+    "jynx_expert_medical": "medical health doctor symptom symptoms pain fever disease illness injury medicine "
+                           "medication dose diagnosis treatment infection blood heart diet sleep nutrition "
+                           "vitamin surgery pregnant",
+    "jynx_expert_cyber": "cyber security hack hacker hacking malware virus phishing password encryption "
+                         "firewall vpn network exploit vulnerability breach privacy router wifi ransomware "
+                         "forensics",
+    "jynx_expert_history": "history historical war ancient empire century medieval revolution civilization "
+                           "dynasty ww2 wwii king queen past origin era",
+    "jynx_expert_sarcasm": "people crowd social friend friends coworker boss family party conversation "
+                           "awkward small talk group dating society",
+    "jynx_expert_politics": "politics political government election vote president policy law congress "
+                            "parliament party democracy power state diplomacy regulation",
+    "jynx_expert_conspiracy": "conspiracy cover secret secretly hidden classified leak surveillance agency "
+                              "propaganda disinformation whistleblower ufo",
+    "jynx_expert_mental_health": "mental health anxiety depression depressed anxious stress stressed burnout panic "
+                                 "therapy therapist trauma ptsd overwhelmed suicidal self care cope coping "
+                                 "resilience",
+}
+
+STOPWORDS = set("""
+a an and are as at be been but by can could do does did for from get got had has have how i if in into
+is it its just like me my of on or our should so some than that the their them then there these they
+this to too up us was we were what when where which who why will with would you your about any also
+need want help tell know think make much many more most very really please give best way thing things
+ve ll re don doesn didn isn can cannot
+""".split())
+
+
+def _stem(word):
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def tokenize(text):
+    return [_stem(w) for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS and len(w) > 1]
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {t: v / norm for t, v in vector.items()} if norm else {}
+
+
+def _coverage(query, terms):
+    """Share of a normalized query's weight that falls on ``terms``."""
+    return sum(w * w for t, w in query.items() if t in terms)
+
+
+class ExpertRouter:
+    """
+    TF-IDF router: a request's terms are weighted by how few fields use them, and an
+    expert's score is the share of that weight its field covers. "network" leans
+    cyber while "health" is split between medical and mental health.
+
+    A field is picked when it knows at least MIN_TERMS of the request's terms and
+    covers at least half as much as the best match. Confidence is how far the weakest
+    picked field is ahead of the best one left out, scaled by how many terms that
+    weakest pick knows. "Election, government policy and the stock market" goes to
+    politics and finance, while a lone "fever" or "I feel lost" (one word each for
+    emotion and survival) goes to the summarizer.
+    """
+
+    def __init__(self, fields, keywords=ROUTING_KEYWORDS, threshold=ROUTER_THRESHOLD, max_experts=3):
+        self.threshold = threshold
+        self.max_experts = max_experts
+        self.terms = {eid: set(tokenize(f"{desc} {keywords.get(eid, '')}")) for eid, desc in fields.items()}
+        counts = Counter(term for terms in self.terms.values() for term in terms)
+        self.idf = {term: math.log((1 + len(self.terms)) / (1 + n)) + 1 for term, n in counts.items()}
+        self.unknown_idf = math.log(1 + len(self.terms)) + 1
+
+    def _query(self, text):
+        # Words no field knows get the highest idf: they dilute the match instead of vanishing
+        counts = Counter(tokenize(text))
+        return _normalize({t: (1 + math.log(n)) * self.idf.get(t, self.unknown_idf) for t, n in counts.items()})
+
+    def scores(self, text):
+        query = self._query(text)
+        return {eid: _coverage(query, terms) for eid, terms in self.terms.items()}
+
+    def route(self, text):
+        """
+        Returns (expert ids, confidence): up to max_experts picked fields and the
+        weakest pick's margin over the best field left out (1 - outside / weakest),
+        scaled down when that pick knows fewer than FULL_EVIDENCE_TERMS of the
+        request's terms. No ids below the threshold or when no field qualifies.
+        """
+        query = self._query(text)
+        support = {eid: sum(1 for term in query if term in terms) for eid, terms in self.terms.items()}
+        scores = {eid: _coverage(query, terms) for eid, terms in self.terms.items()}
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best = ranked[0][1]
+        picked = [eid for eid, score in ranked
+                  if support[eid] >= MIN_TERMS and score >= best * RELATIVE_CUTOFF][:self.max_experts]
+        if not picked:
+            return [], 0.0
+        weakest = picked[-1]
+        outside = max((score for eid, score in ranked if eid not in picked), default=0.0)
+        margin = max(0.0, 1 - outside / scores[weakest])
+        confidence = min(1.0, support[weakest] / FULL_EVIDENCE_TERMS) * margin
+        if confidence < self.threshold:
+            return [], confidence
+        return picked, confidence
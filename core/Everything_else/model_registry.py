@@ -1,23 +1,157 @@
 import os
 import gc
-import yaml
+import queue
+import codecs
+import json
 import time
+import yaml
 import base64
+import numpy as np
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import llama_cpp
 from llama_cpp import Llama
+from llama_cpp.llama import LlamaState
+try:
+    from llama_cpp._internals import LlamaBatch, LlamaContext, LlamaModel, LlamaSampler
+except ImportError:                        # private module; see batching_supported()
+    LlamaBatch = LlamaContext = LlamaModel = LlamaSampler = None
 from llama_cpp.llama_chat_format import MoondreamChatHandler
-from core.paths import MODELS_DIR
+from core.paths import MODELS_DIR, USER_DATA
+from Everything_else.encrypted_store import EncryptedFileStore
+
+# --- 1. CONFIG REGISTRY ---
+
+# Many models.yaml entries are one GGUF file with a different persona and sampling.
+# Each entry is split into what needs a load (weights) and what is only a per-call
+# setting (runtime params, persona), so switching between such entries never
+# touches the loaded model.
+SAMPLING_KEYS = ("temperature", "top_p", "top_k", "min_p", "repeat_penalty",
+                 "presence_penalty", "frequency_penalty")
+CALL_KEYS = ("max_tokens", "stop") + SAMPLING_KEYS
+INT_KEYS = ("n_ctx", "max_tokens", "generation_token_limit", "n_gpu_layers", "top_k")
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class ModelConfig:
+    """One validated models.yaml entry."""
+
+    def __init__(self, model_id, raw):
+        if not isinstance(raw, dict):
+            raise ConfigError(f"'{model_id}' must be a mapping")
+        if not isinstance(raw.get("path"), str) or not raw["path"].strip():
+            raise ConfigError(f"'{model_id}' has no weights path")
+        for key in INT_KEYS + SAMPLING_KEYS:
+            value = raw.get(key)
+            if value is None: continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or (key in INT_KEYS and value != int(value)):
+                raise ConfigError(f"'{model_id}': {key} must be a number, got {value!r}")
+        stop = raw.get("stop")
+        if stop is not None and not (isinstance(stop, list) and all(isinstance(x, str) for x in stop)):
+            raise ConfigError(f"'{model_id}': stop must be a list of strings")
+
+        self.model_id = model_id
+        self.raw = raw
+        self.path = raw["path"]
+        self.clip_path = raw.get("clip_path")
+        self.model_path = os.path.realpath(os.path.join(MODELS_DIR, self.path))
+        self.abs_clip_path = os.path.realpath(os.path.join(MODELS_DIR, self.clip_path)) if self.clip_path else None
+        self.n_ctx = int(raw.get("n_ctx", raw.get("max_tokens", 4096)))
+        self.n_gpu_layers = int(raw.get("n_gpu_layers", -1))
+        self.stream = bool(raw.get("stream", True))
+        self.max_tokens = int(raw.get("max_tokens", 512))
+        self.stop = stop or get_stop_sequence(model_id)
+        self.sampling = {k: raw[k] for k in SAMPLING_KEYS if k in raw}
+        self.persona = raw.get("persona") or raw.get("system_prompt")
+
+    @property
+    def weights_key(self):
+        return self.model_path, self.abs_clip_path
+
+    def as_dict(self):
+        return dict(self.raw)
+
+
+class ConfigRegistry:
+    """
+    models.yaml parsed once, validated and indexed by model id. Every lookup stats
+    the file and reparses only when its mtime or size moved; an edit that breaks
+    the file keeps the last good version in use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = None
+        self._models = None
+        self._groups = {}
+        self._context = {}
+        self._lock = threading.Lock()
+
+    def _current(self):
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stamp != self._stamp:
+                try:
+                    self._parse()
+                except Exception as e:
+                    if self._models is None: raise
+                    print(f"[Jynx] Config Error: {e} (keeping the previous models.yaml)")
+                self._stamp = stamp
+            return self._models
+
+    def _parse(self):
+        with open(self.path, "r") as f:
+            data = yaml.safe_load(f) or {}
+        entries = data.get("models") if isinstance(data, dict) else None
+        if not isinstance(entries, dict):
+            raise ConfigError(f"{self.path} has no 'models' mapping")
+
+        models, groups = {}, {}
+        for model_id, raw in entries.items():
+            try:
+                config = ModelConfig(str(model_id), raw)
+            except ConfigError as e:
+                print(f"[Jynx] Config Error: {e}")
+                continue
+            models[config.model_id] = config
+            groups.setdefault(config.weights_key, []).append(config.model_id)
+        self._models = models
+        self._groups = groups
+        # Entries sharing weights share one instance, sized for the largest of them
+        self._context = {key: max(models[i].n_ctx for i in ids) for key, ids in groups.items()}
 
-# --- 1. CORE UTILITIES ---
+    def get(self, model_id):
+        config = self._current().get(model_id)
+        if config is None:
+            raise ValueError(f"Model '{model_id}' not found in {self.path}")
+        return config
+
+    def all(self):
+        return dict(self._current())
+
+    def shared_context(self, config):
+        self._current()
+        return self._context.get(config.weights_key, config.n_ctx)
+
+    def shared_weights(self):
+        self._current()
+        return {key[0]: list(ids) for key, ids in self._groups.items()}
+
+
+CONFIGS = ConfigRegistry(os.path.join(MODELS_DIR, "models.yaml"))
+
+# --- 2. CORE UTILITIES ---
 
 def get_model_config(model_id):
     """Safely retrieves model settings from the YAML config."""
-    config_path = os.path.join(MODELS_DIR, "models.yaml")
     try:
-        with open(config_path, "r") as f:
-            all_configs = yaml.safe_load(f).get("models", {})
-        if model_id not in all_configs:
-            raise ValueError(f"Model '{model_id}' not found in {config_path}")
-        return all_configs[model_id]
+        return CONFIGS.get(model_id).as_dict()
     except Exception as e:
         print(f"[Jynx] Config Error: {e}")
         return {}
@@ -33,65 +167,498 @@ def encode_image(image_path):
         print(f"[Jynx] Image error: {e}")
         return None
 
-# --- 2. LIFECYCLE MANAGEMENT ---
+def resolve_model(model_id):
+    """
+    Returns (weights, runtime, persona) for a models.yaml entry. The context size is
+    the largest any entry on the same weights asks for, so the shared instance is
+    loaded once at a size that fits all of them.
+    """
+    config = CONFIGS.get(model_id)
+    weights = {
+        "model_path": config.model_path,
+        "clip_path": config.abs_clip_path,
+        "n_ctx": CONFIGS.shared_context(config),
+        "n_gpu_layers": config.n_gpu_layers,
+    }
+    runtime = {"stream": config.stream, "max_tokens": config.max_tokens, "stop": list(config.stop)}
+    runtime.update(config.sampling)
+    return weights, runtime, config.persona
+
+def shared_weights():
+    """Weights file -> the model ids that run on it."""
+    return CONFIGS.shared_weights()
+
+def config_fingerprint(model_ids):
+    """
+    Hash of everything that shapes what these entries generate: their resolved
+    settings and persona, and each weights file by size and mtime. Missing entries
+    count as missing, so adding one later changes the hash too.
+    """
+    hasher = hashlib.sha256()
+    for model_id in sorted(set(model_ids)):
+        try:
+            weights, runtime, persona = resolve_model(model_id)
+            hasher.update(json.dumps([model_id, weights, runtime, persona], sort_keys=True, default=str).encode())
+            for path in filter(None, (weights["model_path"], weights["clip_path"])):
+                stat = os.stat(path)
+                hasher.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except (ValueError, OSError):
+            hasher.update(f"{model_id}:missing".encode())
+    return hasher.hexdigest()
+
+# --- 3. LIFECYCLE MANAGEMENT ---
+
+# Loaded models stay resident, keyed by their resolved weights file. By default only
+# one does, since a second GGUF can push a small machine into swap; with
+# JYNX_MAX_MODELS raised, a council run (summarizer, experts, summarizer again, then
+# back to jynx_default) reads each GGUF off the drive once and the preloader can load
+# the next expert while the current one runs. Least recently used models go first
+# when either limit is hit.
+MAX_RESIDENT_MODELS = int(os.environ.get("JYNX_MAX_MODELS", 1))
+MODEL_RAM_BUDGET = int(os.environ.get("JYNX_MODEL_RAM_MB", 0)) * 1024 * 1024   # 0 = no budget
+WARMUP_PROMPT = "User: ready?\nAssistant:"
+
+
+class ModelPool:
+    """
+    LRU pool of Llama instances, shared by the chat page, the council and the planner.
+    Evicted models are dropped rather than closed: a stream still holding one keeps
+    working, and its memory is released when that last reference goes.
+    """
+
+    def __init__(self, max_models=MAX_RESIDENT_MODELS, ram_budget=MODEL_RAM_BUDGET):
+        self.max_models = max(1, max_models)
+        self.ram_budget = ram_budget
+        self._resident = OrderedDict()     # key -> {"llm", "size", "n_ctx", "extra"}
+        self._loading = {}                 # key -> Event, so two callers never load one file twice
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
 
-ACTIVE_LLM = None
+    def acquire(self, model_path, clip_path=None, n_ctx=4096, n_gpu_layers=-1, warmup=False):
+        key = (os.path.realpath(model_path), os.path.realpath(clip_path) if clip_path else None)
+        while True:
+            with self._lock:
+                entry = self._resident.get(key)
+                if entry and entry["n_ctx"] >= n_ctx:
+                    self._resident.move_to_end(key)
+                    self.hits += 1
+                    return entry["llm"]
+                pending = self._loading.get(key)
+                if pending is None:
+                    # Missing, or resident with a context too small for this caller: (re)load it
+                    self._loading[key] = threading.Event()
+                    if entry:
+                        n_ctx = max(n_ctx, entry["n_ctx"])
+                        self._drop(key)
+                    break
+            pending.wait()
 
-def unload_previous_model():
-    global ACTIVE_LLM
-    if ACTIVE_LLM is not None:
         try:
-            ACTIVE_LLM.close()
-        except: pass
-        ACTIVE_LLM = None
-    gc.collect()
-    time.sleep(0.1)
+            size = _weights_size(*key)
+            with self._lock:
+                self._make_room(size)
+            llm = Llama(
+                model_path=key[0],
+                chat_handler=MoondreamChatHandler(clip_model_path=key[1]) if key[1] else None,
+                n_ctx=n_ctx,
+                n_gpu_layers=n_gpu_layers,
+                verbose=False
+            )
+            if warmup:
+                # Still unpublished: callers waiting on this load get an instance that's ready
+                _warm_up(llm)
+            with self._lock:
+                self._resident[key] = {"llm": llm, "size": size, "n_ctx": n_ctx, "extra": 0}
+                self.loads += 1
+            print(f"[Jynx] Loaded {os.path.basename(key[0])} ({size / 1048576:.0f} MB, {len(self._resident)} resident)")
+            return llm
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+    def _make_room(self, incoming, keep=None):
+        """Evicts least recently used models until ``incoming`` more bytes fit; ``keep`` is growing, not loading."""
+        while True:
+            victims = [key for key in self._resident if key != keep]
+            if not victims or not (
+                (keep is None and len(self._resident) >= self.max_models)
+                or (self.ram_budget and self.used() + incoming > self.ram_budget)
+            ):
+                return
+            self._drop(victims[0])
+            self.evictions += 1
+
+    def reserve(self, key, llm, extra):
+        """
+        Counts ``extra`` bytes (a batch context, say) against the budget as part of a
+        resident model, evicting others to fit them. False if ``llm`` is no longer the
+        resident instance or the model and its extra can't fit even on their own.
+        """
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is None or entry["llm"] is not llm:
+                return False
+            if self.ram_budget and entry["size"] + extra > self.ram_budget:
+                return False
+            self._resident.move_to_end(key)
+            self._make_room(extra, keep=key)
+            entry["size"] += extra
+            entry["extra"] += extra
+            return True
+
+    def release(self, key, llm):
+        """Returns whatever reserve() added to ``llm``'s share, if it's still resident."""
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None and entry["llm"] is llm:
+                entry["size"] -= entry["extra"]
+                entry["extra"] = 0
+
+    def _drop(self, key):
+        entry = self._resident.pop(key)
+        PREFIX_CACHE.drop(key)
+        BATCH_ENGINES.drop(key)
+        print(f"[Jynx] Evicted {os.path.basename(key[0])}")
+        del entry
+        gc.collect()
+
+    def is_resident(self, model_path, clip_path=None):
+        with self._lock:
+            return (model_path, clip_path) in self._resident or (model_path, clip_path) in self._loading
+
+    def used(self):
+        return sum(e["size"] for e in self._resident.values())
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._resident):
+                PREFIX_CACHE.drop(key)
+                BATCH_ENGINES.drop(key)
+            self._resident.clear()
+        gc.collect()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "resident": [os.path.basename(k[0]) for k in self._resident],
+                "bytes": self.used(),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+def _weights_size(model_path, clip_path):
+    """Bytes the weights map into memory; close enough to rank models against a RAM budget."""
+    size = os.path.getsize(model_path)
+    if clip_path:
+        size += os.path.getsize(clip_path)
+    return size
+
+
+def _warm_up(llm):
+    """One-token generation: touches every layer, so the mmap is paged in before the first real prompt."""
+    try:
+        llm(prompt=WARMUP_PROMPT, max_tokens=1)
+    except Exception as e:
+        print(f"[Jynx] Warmup failed: {e}")
+
+
+MODEL_POOL = ModelPool()
+
+
+def unload_models():
+    """Drops every resident model, e.g. before handing the RAM to something else."""
+    MODEL_POOL.clear()
+
+# --- 4. PREFIX STATE CACHE ---
+
+# Council stages all open with the same profile block, and later stages extend it
+# with the notes so far. Snapshots of the evaluated KV state for such prefixes let
+# the next prompt that starts with one load it and evaluate only its own suffix.
+PREFIX_CACHE_BYTES = int(os.environ.get("JYNX_PREFIX_CACHE_MB", 512)) * 1024 * 1024
+MIN_PREFIX_TOKENS = 32      # below this a snapshot costs more than re-evaluating
+
+
+class PrefixCache:
+    """
+    llama.cpp state snapshots keyed by (weights, prefix token hash), LRU within a byte
+    budget. A lookup takes the longest cached prefix of the requested one, so a stage
+    whose prefix grew by the latest notes still skips everything before them.
+    """
+
+    def __init__(self, capacity=PREFIX_CACHE_BYTES):
+        self.capacity = capacity
+        self._entries = OrderedDict()      # (weights key, hash) -> (tokens, state, size)
+        self._lock = threading.Lock()
+        self.hits = 0                      # the whole prefix was already evaluated
+        self.partial = 0                   # a shorter cached prefix was reused
+        self.misses = 0
+        self.tokens_saved = 0
+        self.tokens_evaluated = 0
+        self.store = None                  # PromptStateStore, once a user is logged in
+
+    def prime(self, llm, weights_key, prompt, prefixes, persist=None):
+        """
+        Leaves ``llm`` holding the evaluated longest of ``prefixes`` (nested starts of
+        ``prompt``, shortest first, all as the model will see them), so the completion
+        call that follows only evaluates the rest. What the instance still holds from
+        its last call is kept unless a snapshot reaches further. Each prefix gets its
+        own snapshot; the ``persist`` one also goes to the on-disk store, if attached.
+        """
+        tokens = llm.tokenize(prompt.encode("utf-8"), special=True)
+        # Tokens can merge across a boundary; only the part both agree on is shared
+        lengths = {p: _common_length(tokens, llm.tokenize(p.encode("utf-8"), special=True))
+                   for p in list(prefixes) + ([persist] if persist else [])}
+        bounds = sorted(b for b in set(lengths.values()) if b >= MIN_PREFIX_TOKENS)
+        if not bounds:
+            return
+        length = bounds[-1]
+        target = tuple(tokens[:length])
+        stable = lengths.get(persist, 0) if self.store else 0
+        stable = stable if stable >= MIN_PREFIX_TOKENS else 0
+
+        live = _common_length(llm._input_ids, target)
+        if live == length:
+            self._count(hit=length)                     # still there from the last call
+            return
+
+        if stable > live and not self._has(weights_key, target[:stable]):
+            state = self.store.load(llm, weights_key, target[:stable])
+            if state is not None:
+                self._store(weights_key, target[:stable], state)
+
+        best = self._longest(weights_key, target)
+        if best and len(best[0]) > live:
+            llm.load_state(best[1])
+            reused = len(best[0])
+        else:
+            llm.n_tokens = live                         # the next eval drops whatever follows it
+            reused = live
+        for bound in bounds:
+            if bound <= reused: continue
+            llm.eval(list(target[llm.n_tokens:bound]))
+            state = llm.save_state()
+            self._store(weights_key, target[:bound], state)
+            if bound == stable:
+                self.store.save(llm, weights_key, target[:bound], state)
+        self._count(hit=reused if reused == length else 0, partial=reused if 0 < reused < length else 0,
+                    evaluated=length - reused)
+
+    def _has(self, weights_key, tokens):
+        with self._lock:
+            return (weights_key, _token_hash(tokens)) in self._entries
+
+    def _longest(self, weights_key, target):
+        with self._lock:
+            best_key, best = None, None
+            for key, entry in self._entries.items():
+                if key[0] != weights_key or len(entry[0]) > len(target): continue
+                if (best is None or len(entry[0]) > len(best[0])) and target[:len(entry[0])] == entry[0]:
+                    best_key, best = key, entry
+            if best_key:
+                self._entries.move_to_end(best_key)
+            return best
+
+    def _store(self, weights_key, tokens, state):
+        size = _state_size(state)
+        if size > self.capacity: return
+        key = (weights_key, _token_hash(tokens))
+        with self._lock:
+            self._entries[key] = (tokens, state, size)
+            self._entries.move_to_end(key)
+            while sum(e[2] for e in self._entries.values()) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def _count(self, hit=0, partial=0, evaluated=0):
+        with self._lock:
+            if hit: self.hits += 1
+            elif partial: self.partial += 1
+            else: self.misses += 1
+            self.tokens_saved += hit or partial
+            self.tokens_evaluated += evaluated
+
+    def drop(self, weights_key):
+        """Snapshots only fit the instance that made them; called when it leaves the pool."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == weights_key]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.partial + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e[2] for e in self._entries.values()),
+                "hits": self.hits,
+                "partial": self.partial,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.partial) / lookups if lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+                "tokens_evaluated": self.tokens_evaluated,
+                "disk": self.store.stats() if self.store else None,
+            }
+
+
+def _token_hash(tokens):
+    return hashlib.sha256(np.asarray(tokens, dtype=np.int32).tobytes()).hexdigest()
+
+def _state_size(state):
+    return state.llama_state_size + state.scores.nbytes + state.input_ids.nbytes
+
+def _common_length(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y: break
+        n += 1
+    return n
+
+
+PREFIX_CACHE = PrefixCache()
 
-# --- 3. THE LOADER ---
+# --- 5. PERSISTENT PREFIX STATES ---
 
-def load_model_from_config(model_id):
-    global ACTIVE_LLM
+# The operator preamble the council opens every stage with (see persist= on a loaded
+# call) is the same from one session to the next; its evaluated state is kept on
+# disk, encrypted with the user's key, so the first prompt after a restart doesn't
+# prefill it again.
+STATE_STORE_BYTES = int(os.environ.get("JYNX_STATE_CACHE_MB", 1024)) * 1024 * 1024
+STATE_SUFFIX = ".state"
+FINGERPRINT_SPAN = 4 * 1024 * 1024
+
+
+class PromptStateStore(EncryptedFileStore):
+    """
+    Encrypted llama.cpp states on disk, keyed by model fingerprint and prefix hash.
+    Least recently used files go once the folder exceeds its byte cap. Writes run on
+    a background thread so the prompt that produced the state isn't held up.
+    """
+    suffix = STATE_SUFFIX
+    label = "prompt state"
+
+    def __init__(self, fernet, directory, capacity=STATE_STORE_BYTES):
+        super().__init__(fernet, directory, capacity)
+        self._fingerprints = {}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jynx-state")
+
+    def _fingerprint(self, llm, weights_key):
+        """
+        Model identity without hashing gigabytes: size, head and tail of the weights,
+        plus what shapes the state (context size, llama.cpp version).
+        """
+        # The pool reloads a file with a larger context when asked, so both make the key
+        key = (weights_key, llm.n_ctx())
+        if key not in self._fingerprints:
+            hasher = hashlib.sha256()
+            for path in filter(None, weights_key):
+                size = os.path.getsize(path)
+                hasher.update(str(size).encode())
+                with open(path, "rb") as f:
+                    hasher.update(f.read(FINGERPRINT_SPAN))
+                    f.seek(max(0, size - FINGERPRINT_SPAN))
+                    hasher.update(f.read(FINGERPRINT_SPAN))
+            hasher.update(f"{llm.n_ctx()}|{llama_cpp.__version__}".encode())
+            self._fingerprints[key] = hasher.hexdigest()
+        return self._fingerprints[key]
+
+    def _path(self, llm, weights_key, tokens):
+        name = hashlib.sha256(f"{self._fingerprint(llm, weights_key)}|{_token_hash(tokens)}".encode()).hexdigest()
+        return self._file(name)
+
+    def load(self, llm, weights_key, tokens):
+        def decode(raw):
+            header_len = int.from_bytes(raw[:4], "big")
+            header = json.loads(raw[4:4 + header_len])
+            if header["tokens"] != list(tokens):
+                raise ValueError("prefix mismatch")
+            body = raw[4 + header_len:]
+            row = header["vocab"] * 4
+            input_ids = np.zeros(llm.input_ids.shape, dtype=np.intc)
+            input_ids[:len(tokens)] = tokens
+            return LlamaState(
+                input_ids=input_ids,
+                # Logits are recomputed by the suffix decode after a load; one row stands in
+                scores=np.frombuffer(body[:row], dtype=np.single).reshape(1, -1).copy(),
+                n_tokens=header["n_tokens"],
+                llama_state=body[row:],
+                llama_state_size=len(body) - row,
+                seed=header["seed"],
+            )
+        return self._read(self._path(llm, weights_key, tokens), decode)
+
+    def save(self, llm, weights_key, tokens, state):
+        path = self._path(llm, weights_key, tokens)
+        self._writer.submit(self._save, path, list(tokens), state)
+
+    def _save(self, path, tokens, state):
+        try:
+            scores = state.scores[-1:] if len(state.scores) else np.zeros((1, 0), dtype=np.single)
+            header = json.dumps({"tokens": tokens, "n_tokens": state.n_tokens, "seed": state.seed,
+                                 "vocab": scores.shape[1]}).encode()
+            raw = len(header).to_bytes(4, "big") + header + scores.astype(np.single).tobytes() + state.llama_state
+        except Exception as e:
+            print(f"[Jynx] Could not store {self.label}: {e}")
+            return
+        self._write(path, raw)
+
+
+def enable_state_store(username, fernet):
+    """Turns on the on-disk prompt state cache for a logged-in user."""
+    PREFIX_CACHE.store = PromptStateStore(fernet, os.path.join(USER_DATA, f"{username}_prompt_state"))
+
+# --- 6. THE LOADER ---
+
+def _call_params(runtime, kwargs):
+    """Per-call values (passed by council) win over the entry's own settings; stop lists add up."""
+    params = {k: v for k, v in runtime.items() if k in CALL_KEYS}
+    params.update({k: v for k, v in kwargs.items() if k in CALL_KEYS and v is not None})
+    params["stop"] = list(dict.fromkeys(runtime["stop"] + list(kwargs.get("stop") or [])))
+    return params
+
+def _shared_prefixes(prompt, prefix):
+    """The starts of ``prompt`` a caller marked as shared with other calls (one or nested), shortest first."""
+    marked = [prefix] if isinstance(prefix, str) else prefix or []
+    return sorted((p for p in marked if p and prompt.startswith(p)), key=len)
+
+def _text_prompt(persona, prompt, shared=""):
+    """
+    The prompt as the model sees it. The persona goes after ``shared``, the start of
+    ``prompt`` other calls open with too, so entries with different personas on one
+    weights file still share it.
+    """
+    text = f"{shared}{persona}\n\n{prompt[len(shared):]}" if persona else prompt
+    return f"User: {text}\nAssistant:"
+
+def load_model_from_config(model_id, warmup=False):
     config = get_model_config(model_id)
     if not config:
         raise RuntimeError(f"Could not load config for {model_id}")
 
-    model_path = os.path.join(MODELS_DIR, config["path"])
-    clip_path = config.get("clip_path")
-    abs_clip_path = os.path.join(MODELS_DIR, clip_path) if clip_path else None
-    
-    unload_previous_model()
+    try:
+        weights, runtime, persona = resolve_model(model_id)
 
-    # Use specialized Moondream handler if it's a vision model
-    chat_handler = MoondreamChatHandler(clip_model_path=abs_clip_path) if abs_clip_path else None
+        # Entries sharing a GGUF file share the loaded instance; only the settings below differ
+        llm = MODEL_POOL.acquire(warmup=warmup, **weights)
+        abs_clip_path = weights["clip_path"]
+        weights_key = (weights["model_path"], weights["clip_path"])
 
-    try:
-        # Pull context from config
-        n_ctx = config.get("max_tokens", 4096)
-        
-        llm = Llama(
-            model_path=model_path,
-            chat_handler=chat_handler, 
-            n_ctx=n_ctx,
-            n_gpu_layers=config.get("n_gpu_layers", -1),
-            verbose=False
-        )
-        ACTIVE_LLM = llm
-        
-        def call(prompt, stream_override=None, image_path=None, **kwargs):
-            stream = config.get("stream", True) if stream_override is None else stream_override
-            # Get max_tokens from kwargs (passed by council) or fallback to config
-            m_tokens = kwargs.get("max_tokens", config.get("max_tokens", 512))
+        def call(prompt, stream_override=None, image_path=None, prefix=None, persist=None, **kwargs):
+            stream = runtime["stream"] if stream_override is None else stream_override
+            params = _call_params(runtime, kwargs)
+            text = f"{persona}\n\n{prompt}" if persona else prompt
     
             if image_path and abs_clip_path:
                 b64_data = encode_image(image_path)
                 if b64_data:
                     response = llm.create_chat_completion(
                         messages=[{"role": "user", "content": [
-                            {"type": "text", "text": prompt},
+                            {"type": "text", "text": text},
                             {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_data}"}}
                         ]}],
                         stream=stream,
-                        max_tokens=m_tokens
+                        **params
                     )
 
                     if stream:
@@ -104,11 +671,20 @@ def load_model_from_config(model_id):
                     return response['choices'][0]['message']['content']
 
             # Standard text inference logic
+            # The caller marked the start of its prompt (or nested starts) as shared with other calls
+            # (``persist`` marks the one that stays the same across sessions)
+            prefixes = _shared_prefixes(prompt, prefix)
+            full_prompt = _text_prompt(persona, prompt, prefixes[-1] if prefixes else "")
+            if prefixes:
+                stable = "User: " + persist if persist and prefixes[-1].startswith(persist) else None
+                try:
+                    PREFIX_CACHE.prime(llm, weights_key, full_prompt, ["User: " + p for p in prefixes], stable)
+                except Exception as e:
+                    print(f"[Jynx] Prefix cache skipped: {e}")
             return llm(
-                prompt=f"User: {prompt}\nAssistant:", 
+                prompt=full_prompt, 
                 stream=stream, 
-                stop=get_stop_sequence(model_id),
-                max_tokens=m_tokens
+                **params
             )
 
         return call, config
@@ -116,6 +692,377 @@ def load_model_from_config(model_id):
         print(f"[Jynx] Launch Failed for {model_id}: {e}")
         raise
 
+# --- 7. PRELOADING ---
+
+class ModelPreloader:
+    """
+    Loads and warms models on a background thread, ahead of need. Each request
+    returns a Future of load_model_from_config's (call, config); asking again for a
+    model that's still queued returns the same Future.
+    """
+
+    def __init__(self, pool=MODEL_POOL):
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jynx-preload")
+        self._pending = {}
+        self._lock = threading.RLock()
+
+    def preload(self, model_id, warmup=True):
+        with self._lock:
+            future = self._pending.get(model_id)
+            if future is None:
+                future = self._executor.submit(load_model_from_config, model_id, warmup)
+                self._pending[model_id] = future
+                future.add_done_callback(lambda f: self._forget(model_id, f))
+            return future
+
+    def _forget(self, model_id, future):
+        with self._lock:
+            if self._pending.get(model_id) is future:
+                del self._pending[model_id]
+        if future.exception():
+            print(f"[Jynx] Preload of {model_id} failed: {future.exception()}")
+
+    def ahead(self, model_ids, keep=1):
+        """
+        Preloads models a caller is about to need, in order. Stops before it would
+        push out the ``keep`` most recently used models (e.g. the summarizer the
+        council comes back to for its verdict).
+
+        Only does anything with JYNX_MAX_MODELS >= 2. With a single slot the only
+        model it could push out is the one in use, and every council stage loads
+        its model the moment the previous one finishes anyway.
+        """
+        budget = self.pool.max_models - keep
+        for model_id in dict.fromkeys(model_ids):
+            try:
+                weights, _, _ = resolve_model(model_id)
+            except Exception:
+                continue
+            if self.pool.is_resident(weights["model_path"], weights["clip_path"]):
+                continue
+            if budget <= 0:
+                break
+            budget -= 1
+            self.preload(model_id)
+
+
+MODEL_PRELOADER = ModelPreloader()
+
+# --- 8. BATCHED DECODING ---
+
+# Experts on one GGUF file used to take turns on it. On CPU a single sequence
+# leaves most of each pass over the weights unused, so the batch engine decodes
+# all running sequences together: every llama_decode carries one new token per
+# sequence (plus prompt chunks of newly joined ones) and one pass serves them all.
+BATCH_SEQUENCES = int(os.environ.get("JYNX_BATCH_SEQUENCES", 4))
+
+# The engine drives llama.cpp through llama_cpp._internals, which is private and has
+# changed shape between releases (this is written against 0.3.x). Batching is only
+# offered when everything it calls is there; otherwise experts take turns.
+BATCH_API = {
+    "LlamaContext": ("decode", "kv_cache_seq_rm", "close"),
+    "LlamaBatch": ("reset", "close"),
+    "LlamaModel": ("token_eot", "token_to_piece"),
+    "LlamaSampler": ("add_penalties", "add_greedy", "add_top_k", "add_top_p", "add_min_p",
+                     "add_temp", "add_dist", "sample", "close"),
+}
+BATCH_FUNCTIONS = ("llama_context_default_params", "llama_model_n_layer", "llama_model_n_embd",
+                   "llama_model_n_head", "llama_model_n_head_kv")
+
+
+def batching_supported():
+    classes = {"LlamaContext": LlamaContext, "LlamaBatch": LlamaBatch,
+               "LlamaModel": LlamaModel, "LlamaSampler": LlamaSampler}
+    if not all(cls is not None and all(hasattr(cls, m) for m in BATCH_API[name]) for name, cls in classes.items()):
+        return False
+    if not all(hasattr(llama_cpp, name) for name in BATCH_FUNCTIONS):
+        return False
+    return hasattr(getattr(llama_cpp, "llama_context_params", None), "n_seq_max")
+
+
+BATCHING = batching_supported()
+
+
+def _kv_bytes(llm, n_tokens):
+    """Approximate f16 K and V cache for ``n_tokens`` positions on this model."""
+    model = llm._model.model
+    n_head = max(1, llama_cpp.llama_model_n_head(model))
+    n_embd_kv = llama_cpp.llama_model_n_embd(model) * llama_cpp.llama_model_n_head_kv(model) // n_head
+    return 2 * 2 * llama_cpp.llama_model_n_layer(model) * n_tokens * n_embd_kv
+
+
+class _Sequence:
+    """One submitted prompt: tokens still to evaluate, its sampler and the queue its reader drains."""
+
+    def __init__(self, tokens, sampler, max_tokens, stop):
+        self.pending = list(tokens)        # prompt tokens, later the one just sampled
+        self.sampler = sampler
+        self.max_tokens = max_tokens
+        self.stop = [s for s in stop if s]
+        self.hold = max((len(s) for s in self.stop), default=1) - 1
+        self.seq_id = None
+        self.n_past = 0
+        self.logits_index = -1
+        self.generated = 0
+        self.text = ""
+        self.emitted = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.out = queue.Queue()
+        self.cancelled = False
+
+    def reader(self):
+        try:
+            while True:
+                item = self.out.get()
+                if item is None: return
+                if isinstance(item, Exception): raise item
+                yield item
+        finally:
+            self.cancelled = True          # a reader that stops early frees its slot
+
+
+class BatchEngine:
+    """
+    Lock-step decoder for one loaded model. It runs on its own llama.cpp context
+    with room for ``n_seq`` sequences, next to the model's regular one, so plain
+    calls on the pooled instance (and their prefix cache) aren't disturbed.
+    Sequences join and leave between steps; a worker thread does all the decoding.
+    """
+
+    def __init__(self, llm, n_seq=BATCH_SEQUENCES):
+        self.llm = llm
+        self.n_seq = max(1, n_seq)
+        self.n_ctx = llm.n_ctx()           # per sequence, as much as the regular context
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = self.n_ctx * self.n_seq
+        params.n_batch = llm.context_params.n_batch
+        params.n_ubatch = llm.context_params.n_ubatch
+        params.n_seq_max = self.n_seq
+        params.n_threads = llm.context_params.n_threads
+        params.n_threads_batch = llm.context_params.n_threads_batch
+        if hasattr(params, "kv_unified"):
+            params.kv_unified = True       # one KV buffer, shared by whichever sequences are running
+        self.n_batch = params.n_batch
+        self.ctx = LlamaContext(model=llm._model, params=params, verbose=False)
+        self.batch = LlamaBatch(n_tokens=self.n_batch, embd=0, n_seq_max=self.n_seq, verbose=False)
+        self._eog = {llm.token_eos(), llm._model.token_eot()}
+        self._incoming = queue.Queue()
+        self._free = list(range(self.n_seq))
+        self._closed = False
+        self.steps = 0
+        self.tokens = 0
+        threading.Thread(target=self._run, daemon=True, name="jynx-batch").start()
+
+    def submit(self, prompt, max_tokens=512, stop=(), **sampling):
+        """Queues one prompt (as the model sees it); returns a generator of its text pieces."""
+        if self._closed:
+            raise RuntimeError("Batch engine closed")
+        tokens = self.llm.tokenize(prompt.encode("utf-8"), special=True)
+        if len(tokens) >= self.n_ctx:
+            raise ValueError(f"Requested tokens ({len(tokens)}) exceed context window of {self.n_ctx}")
+        max_tokens = min(max_tokens or self.n_ctx, self.n_ctx - len(tokens))
+        seq = _Sequence(tokens, self._sampler(sampling), max_tokens, stop)
+        self._incoming.put(seq)
+        return seq.reader()
+
+    def _sampler(self, sampling):
+        """The same chain Llama builds for a completion call, minus the custom hooks."""
+        sampler = LlamaSampler()
+        sampler.add_penalties(
+            n_vocab=self.llm.n_vocab(),
+            penalty_last_n=self.llm.last_n_tokens_size,
+            penalty_repeat=sampling.get("repeat_penalty", 1.0),
+            penalty_freq=sampling.get("frequency_penalty", 0.0),
+            penalty_present=sampling.get("presence_penalty", 0.0),
+        )
+        temperature = sampling.get("temperature", 0.8)
+        if temperature == 0.0:
+            sampler.add_greedy()
+            return sampler
+        if temperature > 0.0:
+            sampler.add_top_k(sampling.get("top_k", 40))
+            sampler.add_top_p(sampling.get("top_p", 0.95), 1)
+            sampler.add_min_p(sampling.get("min_p", 0.05), 1)
+            sampler.add_temp(temperature)
+        sampler.add_dist(int.from_bytes(os.urandom(4), "little"))
+        return sampler
+
+    def close(self):
+        """Stops taking prompts; the worker exits once the running ones finish."""
+        self._closed = True
+        self._incoming.put(None)
+
+    # --- WORKER ---
+
+    def _run(self):
+        waiting, active = deque(), []
+        while not (self._closed and not waiting and not active):
+            # Idle: block for work. Busy: take whatever arrived since the last step
+            try:
+                block = not waiting and not active
+                while True:
+                    seq = self._incoming.get(block=block)
+                    block = False
+                    if seq is not None:
+                        waiting.append(seq)
+            except queue.Empty:
+                pass
+            while waiting and self._free:
+                seq = waiting.popleft()
+                seq.seq_id = self._free.pop()
+                active.append(seq)
+
+            for seq in [s for s in active if s.cancelled]:
+                self._finish(seq, active)
+            if not active: continue
+
+            self._fill(active)
+            try:
+                self.ctx.decode(self.batch)
+            except Exception as e:
+                for seq in list(active):
+                    self._finish(seq, active, error=RuntimeError(f"Batched decode failed: {e}"))
+                continue
+            self.steps += 1
+
+            for seq in list(active):
+                if seq.logits_index >= 0:
+                    self._advance(seq, active)
+
+        # Closed: refuse whatever slipped in after the last step, then free the context
+        while not self._incoming.empty():
+            seq = self._incoming.get()
+            if seq is not None:
+                seq.out.put(RuntimeError("Batch engine closed"))
+        self.batch.close()
+        self.ctx.close()
+
+    def _fill(self, active):
+        """One step's batch: decoding sequences first (a token each), then prompt chunks."""
+        self.batch.reset()
+        b, n = self.batch.batch, 0
+        for seq in sorted(active, key=lambda s: len(s.pending)):
+            take = seq.pending[:self.n_batch - n]
+            seq.logits_index = -1
+            if not take: continue
+            for i, token in enumerate(take):
+                b.token[n + i] = token
+                b.pos[n + i] = seq.n_past + i
+                b.seq_id[n + i][0] = seq.seq_id
+                b.n_seq_id[n + i] = 1
+                b.logits[n + i] = False
+            n += len(take)
+            seq.n_past += len(take)
+            del seq.pending[:len(take)]
+            if not seq.pending:             # prompt done (or the last sampled token fed): sample next
+                b.logits[n - 1] = True
+                seq.logits_index = n - 1
+        b.n_tokens = n
+
+    def _advance(self, seq, active):
+        token = seq.sampler.sample(self.ctx, seq.logits_index)
+        if token in self._eog:
+            return self._finish(seq, active)
+        seq.generated += 1
+        self.tokens += 1
+        seq.text += seq.decoder.decode(self.llm._model.token_to_piece(token))
+        cut = min((i for i in (seq.text.find(s) for s in seq.stop) if i >= 0), default=-1)
+        if cut >= 0:
+            seq.text = seq.text[:cut]
+            return self._finish(seq, active)
+        # Hold back anything that could still turn out to be the start of a stop string
+        safe = len(seq.text) - seq.hold
+        if safe > seq.emitted:
+            seq.out.put(seq.text[seq.emitted:safe])
+            seq.emitted = safe
+        if seq.generated >= seq.max_tokens:
+            return self._finish(seq, active)
+        seq.pending = [token]
+
+    def _finish(self, seq, active, error=None):
+        if not error and len(seq.text) > seq.emitted:
+            seq.out.put(seq.text[seq.emitted:])
+        seq.out.put(error)
+        active.remove(seq)
+        self.ctx.kv_cache_seq_rm(seq.seq_id, -1, -1)
+        self._free.append(seq.seq_id)
+        seq.sampler.close()
+
+    def stats(self):
+        return {"steps": self.steps, "tokens": self.tokens,
+                "tokens_per_step": self.tokens / self.steps if self.steps else 0.0}
+
+
+class BatchEngines:
+    """
+    One BatchEngine per pooled model, created on first use and dropped with the model.
+    An engine's context holds a KV cache for every sequence it runs, so the pool counts
+    it against the RAM budget as part of the model and makes room for it first.
+    """
+
+    def __init__(self, n_seq=BATCH_SEQUENCES, pool=None):
+        self.n_seq = n_seq
+        self.pool = pool
+        self._engines = {}                 # pool key -> BatchEngine
+        self._lock = threading.Lock()
+
+    def get(self, weights, llm):
+        key = (os.path.realpath(weights["model_path"]),
+               os.path.realpath(weights["clip_path"]) if weights["clip_path"] else None)
+        pool = self.pool or MODEL_POOL
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None and engine.llm is llm:
+                return engine
+            stale = self._engines.pop(key, None)
+        if stale:
+            stale.close()
+
+        # The pool's lock is taken before ours when it drops a model, never after
+        if not pool.reserve(key, llm, _kv_bytes(llm, llm.n_ctx() * self.n_seq)):
+            raise MemoryError(f"No room for a batch context next to {os.path.basename(key[0])}")
+        try:
+            engine = BatchEngine(llm, self.n_seq)
+        except Exception:
+            pool.release(key, llm)
+            raise
+        with self._lock:
+            if key in self._engines:       # another caller got there first
+                engine.close()
+                return self._engines[key]
+            self._engines[key] = engine
+            return engine
+
+    def drop(self, weights_key):
+        with self._lock:
+            engine = self._engines.pop(weights_key, None)
+        if engine:
+            engine.close()
+
+
+BATCH_ENGINES = BatchEngines()
+
+def stream_batch(requests):
+    """
+    Starts several generations at once and returns one text-token generator per
+    request, in order. ``requests`` are (model_id, prompt, kwargs) with the kwargs a
+    loaded call takes (max_tokens, stop, sampling, prefix). Requests on the same
+    weights decode together; callers usually read each generator on its own thread.
+    Raises if this llama_cpp can't batch or there's no room for the batch context.
+    """
+    if not BATCHING:
+        raise RuntimeError(f"llama_cpp {llama_cpp.__version__} lacks the internals batched decoding uses")
+    streams = []
+    for model_id, prompt, kwargs in requests:
+        weights, runtime, persona = resolve_model(model_id)
+        llm = MODEL_POOL.acquire(**weights)
+        params = _call_params(runtime, kwargs)
+        engine = BATCH_ENGINES.get(weights, llm)
+        shared = _shared_prefixes(prompt, kwargs.get("prefix"))
+        streams.append(engine.submit(_text_prompt(persona, prompt, shared[-1] if shared else ""), **params))
+    return streams
+
 def get_visual_description(image_path):
     """Helper for internal description requests."""
     try:
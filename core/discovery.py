@@ -0,0 +1,125 @@
+# discovery.py
+
+import threading
+import time
+
+PEER_TTL = 45               # seconds without a broadcast or pong before an address is dropped
+RTT_SMOOTHING = 0.25        # EWMA weight of the newest RTT sample
+PING_TIMEOUT = 5
+
+# Announce fast while the neighbourhood is changing, back off once it settles
+ANNOUNCE_FAST = 1
+ANNOUNCE_SLOW = 30
+FAST_ANNOUNCES = 5
+
+
+class PeerAddress:
+    """One reachable (ip, port) for a ghost_id, with liveness and latency."""
+
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+        self.first_seen = time.monotonic()
+        self.last_seen = self.first_seen
+        self.rtt = None
+
+    def as_dict(self):
+        return {
+            "ip": self.ip,
+            "port": self.port,
+            "rtt_ms": round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            "age": round(time.monotonic() - self.last_seen, 1),
+        }
+
+
+class DiscoveryRegistry:
+    """
+    Live view of the LAN: ghost_id -> addresses, refreshed by discovery broadcasts
+    and ping/pong. Written from the network loop, read from the UI, hence the lock.
+    """
+
+    def __init__(self, ttl=PEER_TTL):
+        self.ttl = ttl
+        self._peers = {}
+        self._pings = {}
+        self._lock = threading.Lock()
+        self._announces = 0
+        self._interval = ANNOUNCE_FAST
+
+    # --- UPDATES (network loop) ---
+
+    def observe(self, ghost_id, ip, port):
+        """Records a sighting. Returns True when the address is new."""
+        with self._lock:
+            addresses = self._peers.setdefault(ghost_id, {})
+            entry = addresses.get((ip, port))
+            if entry:
+                entry.last_seen = time.monotonic()
+                return False
+            addresses[(ip, port)] = PeerAddress(ip, port)
+            self._reset_announces()
+            return True
+
+    def ping_sent(self, nonce, ghost_id, ip, port):
+        with self._lock:
+            self._pings[nonce] = (ghost_id, ip, port, time.monotonic())
+
+    def pong_received(self, nonce):
+        """Matches a pong to its ping and folds the sample into the address RTT."""
+        with self._lock:
+            pending = self._pings.pop(nonce, None)
+            if not pending: return None
+            ghost_id, ip, port, sent_at = pending
+            entry = self._peers.get(ghost_id, {}).get((ip, port))
+            if not entry: return None
+            sample = time.monotonic() - sent_at
+            entry.rtt = sample if entry.rtt is None else (1 - RTT_SMOOTHING) * entry.rtt + RTT_SMOOTHING * sample
+            entry.last_seen = time.monotonic()
+            return sample
+
+    def evict_stale(self):
+        """Drops addresses not seen within the TTL (and peers left with none)."""
+        now = time.monotonic()
+        removed = []
+        with self._lock:
+            for ghost_id in list(self._peers):
+                addresses = self._peers[ghost_id]
+                for key in [k for k, a in addresses.items() if now - a.last_seen > self.ttl]:
+                    del addresses[key]
+                    removed.append((ghost_id, key))
+                if not addresses:
+                    del self._peers[ghost_id]
+            for nonce in [n for n, p in self._pings.items() if now - p[3] > PING_TIMEOUT]:
+                del self._pings[nonce]
+        return removed
+
+    def next_announce_interval(self):
+        """1s announces for the first few rounds after any change, then doubling up to ANNOUNCE_SLOW."""
+        with self._lock:
+            self._announces += 1
+            if self._announces > FAST_ANNOUNCES:
+                self._interval = min(self._interval * 2, ANNOUNCE_SLOW)
+            return self._interval
+
+    def _reset_announces(self):
+        self._announces = 0
+        self._interval = ANNOUNCE_FAST
+
+    # --- QUERIES (any thread) ---
+
+    def best_address(self, ghost_id):
+        """Fastest live (ip, port) for a ghost_id; unmeasured addresses rank after measured ones."""
+        with self._lock:
+            addresses = list(self._peers.get(ghost_id, {}).values())
+        if not addresses: return None
+        best = min(addresses, key=lambda a: (a.rtt is None, a.rtt or 0, -a.last_seen))
+        return best.ip, best.port
+
+    def live_addresses(self):
+        """[(ghost_id, ip, port), ...] for the pinger."""
+        with self._lock:
+            return [(gid, a.ip, a.port) for gid, addrs in self._peers.items() for a in addrs.values()]
+
+    def snapshot(self):
+        with self._lock:
+            return {gid: [a.as_dict() for a in addrs.values()] for gid, addrs in self._peers.items()}
@@ -1,49 +1,345 @@
 # matchmaker.py
 
-import socket
+import asyncio
+import collections
 import json
-import threading
+import time
 
 # This would run on a cheap VPS (like a $5 DigitalOcean or Linode box)
 MATCH_PORT = 9999
 
-class GhostMatchmaker:
+ROOM_TTL = 120          # seconds a lone peer may wait for its partner
+READ_TIMEOUT = 10       # seconds to send the join request after connecting
+MAX_FRAME = 4096        # bytes; join requests are tiny
+MAX_CONN_PER_IP = 16    # concurrent connections per source address (0 = unlimited)
+BACKLOG = 1024
+
+# Local-only stats endpoint for sizing the box: curl http://127.0.0.1:9998/
+STATS_HOST = "127.0.0.1"
+STATS_PORT = 9998
+RATE_WINDOW = 10        # seconds of joins averaged into joins/sec
+LATENCY_SAMPLES = 2048
+
+
+# UDP rendezvous: peers register their sync socket under a shared room id and
+# receive each other's NAT-mapped address. Entries live as long as a room.
+RENDEZVOUS_KIND = b"V"
+
+
+# --- FRAMING: 4-byte big-endian length + JSON body ---
+
+async def read_frame(reader):
+    length = int.from_bytes(await reader.readexactly(4), "big")
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame too large ({length} bytes)")
+    return json.loads(await reader.readexactly(length))
+
+
+async def write_frame(writer, message):
+    body = json.dumps(message).encode()
+    writer.write(len(body).to_bytes(4, "big") + body)
+    await writer.drain()
+
+
+# Datagrams use the same envelope as GhostNetwork frames (MAGIC | kind | header length | JSON)
+# so replies can be sent straight to a peer's sync socket.
+def pack_rendezvous(message):
+    head = json.dumps(message, separators=(",", ":")).encode()
+    return b"GD" + RENDEZVOUS_KIND + len(head).to_bytes(2, "big") + head
+
+
+def unpack_rendezvous(data):
+    if len(data) < 5 or data[:3] != b"GD" + RENDEZVOUS_KIND:
+        return None
+    head_len = int.from_bytes(data[3:5], "big")
+    try:
+        return json.loads(data[5:5 + head_len])
+    except ValueError:
+        return None
+
+
+class MatchStats:
+    """Counters for the stats endpoint. Loop-only, so no locking."""
+
     def __init__(self):
-        self.rooms = {} # Format: { "room_id": [peer1_info, peer2_info] }
+        self.started = time.monotonic()
+        self.joins = 0
+        self.matches = 0
+        self.expired = 0
+        self.rejected = 0
+        self.udp_registrations = 0
+        self._recent_joins = collections.deque()
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    def record_join(self):
+        now = time.monotonic()
+        self.joins += 1
+        self._recent_joins.append(now)
+        while self._recent_joins and self._recent_joins[0] < now - RATE_WINDOW:
+            self._recent_joins.popleft()
+
+    def record_match(self, latency):
+        self.matches += 1
+        self._latencies.append(latency)
+
+    def snapshot(self, rooms, connections):
+        now = time.monotonic()
+        while self._recent_joins and self._recent_joins[0] < now - RATE_WINDOW:
+            self._recent_joins.popleft()
+        ordered = sorted(self._latencies)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 2) if ordered else None
+
+        return {
+            "uptime": round(now - self.started, 1),
+            "joins": self.joins,
+            "joins_per_sec": round(len(self._recent_joins) / RATE_WINDOW, 2),
+            "matches": self.matches,
+            "expired_rooms": self.expired,
+            "rejected": self.rejected,
+            "udp_registrations": self.udp_registrations,
+            "waiting_rooms": rooms,
+            "open_connections": connections,
+            "match_latency_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99)},
+        }
+
+
+class RoomStore:
+    """
+    In-memory rooms. Every method is synchronous and only runs on the matchmaker's
+    event loop, so join() is atomic: two peers joining the same room at once can
+    never both find it empty.
+    """
+
+    def __init__(self, ttl, stats):
+        self.ttl = ttl
+        self.stats = stats
+        self.rooms = {} # Format: { "room_id": {"info": peer_info, "partner": Future, "created": t} }
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def join(self, room_id, info):
+        """
+        Join-or-wait. Returns ("match", partner_info) when someone was already
+        waiting, otherwise ("wait", room) with a future that resolves to the
+        partner info (or None on expiry / replacement).
+        """
+        self.stats.record_join()
+        room = self.rooms.get(room_id)
+        if room and room["info"]["ghost_id"] != info["ghost_id"] and not room["partner"].done():
+            # Partner found! Wake the waiting side and hand both addresses out
+            del self.rooms[room_id]
+            room["partner"].set_result(info)
+            self.stats.record_match(time.monotonic() - room["created"])
+            return "match", room["info"]
+
+        if room and not room["partner"].done():
+            room["partner"].set_result(None) # Same peer re-joined; retire the old connection
+
+        room = {"info": info, "partner": asyncio.get_running_loop().create_future(), "created": time.monotonic()}
+        self.rooms[room_id] = room
+        return "wait", room
+
+    def leave(self, room_id, room):
+        """Removes a room if it is still the one this waiter created."""
+        if self.rooms.get(room_id) is room:
+            del self.rooms[room_id]
+            return True
+        return False
+
+    def expire(self):
+        cutoff = time.monotonic() - self.ttl
+        expired = [r for r, room in self.rooms.items() if room["created"] < cutoff]
+        for room_id in expired:
+            room = self.rooms.pop(room_id)
+            if not room["partner"].done():
+                room["partner"].set_result(None)
+        return len(expired)
+
+
+class _RendezvousProtocol(asyncio.DatagramProtocol):
+    def __init__(self, matchmaker):
+        self.matchmaker = matchmaker
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.matchmaker._on_rendezvous(data, addr, self.transport)
+
+
+class GhostMatchmaker:
+    def __init__(self, host='0.0.0.0', port=MATCH_PORT, room_ttl=ROOM_TTL, max_per_ip=MAX_CONN_PER_IP,
+                 stats_port=STATS_PORT):
+        self.host = host
+        self.port = port
+        self.room_ttl = room_ttl
+        self.max_per_ip = max_per_ip
+        self.stats_port = stats_port
+        self.stats = MatchStats()
+        self.rooms = RoomStore(room_ttl, self.stats)
+        self.connections = {} # Format: { "ip": open connection count }
+        self.endpoints = {} # Format: { "room_id": { "ghost_id": ((ip, port), last_seen, nonce) } }
+        self._server = None
+        self._stats_server = None
+        self._udp = None
 
     def start(self):
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server.bind(('0.0.0.0', MATCH_PORT))
-        server.listen(100)
-        print(f"Matchmaker online on port {MATCH_PORT}")
+        """Blocking entry point for the VPS."""
+        asyncio.run(self.serve_forever())
 
-        while True:
-            client, addr = server.accept()
-            threading.Thread(target=self.handle_client, args=(client, addr)).start()
+    async def serve(self):
+        self._server = await asyncio.start_server(self.handle_client, self.host, self.port, backlog=BACKLOG)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._udp, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _RendezvousProtocol(self), local_addr=(self.host, self.port)
+        )
+        if self.stats_port is not None:
+            self._stats_server = await asyncio.start_server(self._serve_stats, STATS_HOST, self.stats_port)
+            self.stats_port = self._stats_server.sockets[0].getsockname()[1]
+        asyncio.get_running_loop().create_task(self._evict_expired())
+        return self._server
+
+    async def serve_forever(self):
+        server = await self.serve()
+        print(f"Matchmaker online on port {self.port}")
+        async with server:
+            await server.serve_forever()
 
-    def handle_client(self, client, addr):
+    async def handle_client(self, reader, writer):
+        ip, port = writer.get_extra_info("peername")[:2]
+        if self.max_per_ip and self.connections.get(ip, 0) >= self.max_per_ip:
+            self.stats.rejected += 1
+            await self._reply_and_close(writer, {"status": "busy"})
+            return
+
+        self.connections[ip] = self.connections.get(ip, 0) + 1
         try:
-            data = client.recv(1024).decode()
-            request = json.loads(data)
-            room_id = request.get("room_id")
+            request = await asyncio.wait_for(read_frame(reader), READ_TIMEOUT)
+            room_id = str(request.get("room_id", ""))
+            if not room_id:
+                await write_frame(writer, {"status": "error", "reason": "room_id required"})
+                return
             my_info = {
                 "ghost_id": request.get("ghost_id"),
-                "ip": addr[0],
-                "port": addr[1]
+                "ip": ip,
+                "port": port
             }
 
-            if room_id not in self.rooms:
-                self.rooms[room_id] = [my_info]
-                # Wait for a partner to join
-                client.send(json.dumps({"status": "waiting"}).encode())
+            outcome, result = self.rooms.join(room_id, my_info)
+            if outcome == "match":
+                await write_frame(writer, {"status": "match", "partner": result})
             else:
-                # Partner found!
-                partner_info = self.rooms[room_id][0]
-                client.send(json.dumps({"status": "match", "partner": partner_info}).encode())
-                # Clean up the room immediately
-                del self.rooms[room_id]
+                await self._wait_for_partner(room_id, result, reader, writer)
 
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
         except Exception as e:
             print(f"Match error: {e}")
         finally:
-            client.close()
\ No newline at end of file
+            self.connections[ip] -= 1
+            if not self.connections[ip]:
+                del self.connections[ip]
+            writer.close()
+
+    async def _wait_for_partner(self, room_id, room, reader, writer):
+        """Keeps the first peer connected until a partner joins, it hangs up, or the room expires."""
+        partner = room["partner"]
+        await write_frame(writer, {"status": "waiting", "ttl": self.room_ttl})
+
+        hangup = asyncio.ensure_future(reader.read(1))
+        try:
+            done, _ = await asyncio.wait({partner, hangup}, timeout=self.room_ttl, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            hangup.cancel()
+            self.rooms.leave(room_id, room)
+
+        if hangup in done:
+            return # Waiter gave up on its own
+        if partner.done() and partner.result():
+            await write_frame(writer, {"status": "match", "partner": partner.result()})
+        else:
+            self.stats.expired += 1
+            await write_frame(writer, {"status": "expired"})
+
+    async def _evict_expired(self):
+        """Backstop for rooms whose waiter never woke up (e.g. a stalled socket)."""
+        while True:
+            await asyncio.sleep(max(self.room_ttl / 4, 1))
+            self.rooms.expire()
+            cutoff = time.monotonic() - self.room_ttl
+            for room_id in list(self.endpoints):
+                members = self.endpoints[room_id]
+                for gid in [g for g, (_, seen, _) in members.items() if seen < cutoff]:
+                    del members[gid]
+                if not members:
+                    del self.endpoints[room_id]
+
+    def _on_rendezvous(self, data, addr, transport):
+        """Registers a peer's mapped UDP address and, once its partner is known, tells both sides."""
+        message = unpack_rendezvous(data)
+        if not message or message.get("op") != "register": return
+        room_id, ghost_id = str(message.get("room_id", "")), message.get("ghost_id")
+        if not room_id or not ghost_id: return
+
+        members = self.endpoints.setdefault(room_id, {})
+        if ghost_id not in members:
+            self.stats.udp_registrations += 1
+        # Each side's nonce is echoed back only to it, so peers can tell our answers from spoofed ones
+        nonce = message.get("nonce")
+        members[ghost_id] = (addr, time.monotonic(), nonce)
+        while len(members) > 2:
+            del members[min(members, key=lambda g: members[g][1])]
+
+        for other_id, (other_addr, _, other_nonce) in members.items():
+            if other_id == ghost_id: continue
+            transport.sendto(pack_rendezvous({"op": "peer", "room_id": room_id, "ghost_id": other_id,
+                                              "ip": other_addr[0], "port": other_addr[1], "nonce": nonce}), addr)
+            transport.sendto(pack_rendezvous({"op": "peer", "room_id": room_id, "ghost_id": ghost_id,
+                                              "ip": addr[0], "port": addr[1], "nonce": other_nonce}), other_addr)
+
+    async def _serve_stats(self, reader, writer):
+        """Minimal HTTP/1.0 responder: any request gets the current counters as JSON."""
+        try:
+            await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+            body = json.dumps(self.stats.snapshot(len(self.rooms), sum(self.connections.values()))).encode()
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _reply_and_close(self, writer, message):
+        try:
+            await write_frame(writer, message)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+# --- CLIENT SIDE ---
+
+async def request_match(host, room_id, ghost_id, port=MATCH_PORT, timeout=ROOM_TTL + READ_TIMEOUT):
+    """
+    Joins a room and waits for the partner. Returns the partner info dict
+    ({ghost_id, ip, port}) or None if the room expired or the server refused.
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), READ_TIMEOUT)
+    try:
+        await write_frame(writer, {"room_id": room_id, "ghost_id": ghost_id})
+        reply = await asyncio.wait_for(read_frame(reader), READ_TIMEOUT)
+        if reply.get("status") == "waiting":
+            reply = await asyncio.wait_for(read_frame(reader), timeout)
+        return reply.get("partner") if reply.get("status") == "match" else None
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    GhostMatchmaker().start()
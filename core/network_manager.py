@@ -1,24 +1,880 @@
+import asyncio
 import socket
 import threading
 import os
 import time
 import json
-import base64
-from cryptography.fernet import Fernet
+import zlib
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from core.paths import EVERYTHING_ELSE
 from core.peers_manager import load_peers
-from core.identity import derive_shared_secret
+from core.identity import derive_shared_secret, generate_shared_room_id
+from core.discovery import DiscoveryRegistry
+from core.matchmaker import MATCH_PORT
+from core.staging import StagedFile, atomic_write, fsync_dir, sweep_staging
+from core.shaping import PrioritySender, TokenBucket, PRIORITY_CONTROL, PRIORITY_SMALL, PRIORITY_BULK
+from core.secure_channel import (
+    SecureChannel, new_ephemeral, ephemeral_secret, transcript_hash, derive_session_keys, sign, verify, public_hex
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GHOST_PORT = 5555
+DISCOVERY_PORT = 5556
+PING_INTERVAL = 5
+
+# Internet rendezvous. GHOST_MATCHMAKER is "host" or "host:port" of a matchmaker VPS;
+# without it only LAN discovery and manual IPs are available.
+MATCHMAKER = os.environ.get("GHOST_MATCHMAKER", "")
+RENDEZVOUS_INTERVAL = 2     # seconds between UDP registrations while the partner is absent
+RENDEZVOUS_TIMEOUT = 120
+ADVERTISE_INTERVAL = 20     # passive registration for every trusted peer, so they can dial us
+PUNCH_INTERVAL = 0.2
+PUNCH_ATTEMPTS = 25
+KEEPALIVE_INTERVAL = 15     # well under typical 30s+ NAT UDP mapping timeouts
+KEEPALIVE_MISSES = 2        # unanswered keepalive rounds before a punched path is forgotten
+
+# Pooled peer sessions: one key set, one codec and one NAT mapping per peer, reused across syncs
+HEARTBEAT_INTERVAL = 15
+HEARTBEAT_MISSES = 3
+SESSION_IDLE_TTL = 600
+CHANNEL_IDLE_TTL = 2 * SESSION_IDLE_TTL     # responders outlive the sender's pool entry
+TRUSTED_PEERS_TTL = 300     # cache of the trusted-peer list used to vet handshakes
+
+# Bandwidth caps in bytes/s (0 = unlimited). The download cap is advertised in the
+# handshake and the sending side paces itself to it.
+UPLOAD_LIMIT = int(os.environ.get("GHOST_UPLOAD_LIMIT", 0))
+DOWNLOAD_LIMIT = int(os.environ.get("GHOST_DOWNLOAD_LIMIT", 0))
+
+# Receive pipeline limits. Datagrams beyond RX_QUEUE_LIMIT are dropped instead of
+# spawning more work, and decrypt / disk I/O never use more than their pool size.
+RX_QUEUE_LIMIT = 2048
+RX_WORKERS = 4
+CRYPTO_WORKERS = 2
+DISK_WORKERS = 1
+RX_SOCKET_BUFFER = 4 * 1024 * 1024
+
+# Transfer scheduling. Files are split into CHUNK_SIZE frames, each sealed on its own,
+# and the receiver answers every FIN with the list of chunks it is still missing.
+CHUNK_SIZE = 8192
+MAX_PARALLEL_STREAMS = 4
+SMALL_FILE_LIMIT = 1024 * 1024   # streams up to this size (and bundles) jump ahead of bulk ones
+MAX_CHUNKS_PER_FILE = 65536
+SEND_BURST = 32
+SEND_WINDOW = 256               # chunks a stream may have in flight beyond what the receiver confirmed
+WINDOW_UPDATE = 64              # the receiver reports its progress every this many chunks
+ACK_TIMEOUT = 1.0
+FIN_RETRIES = 3
+MAX_ACK_ROUNDS = 8
+MAX_NACKS_PER_ACK = 512
+FIN_SETTLE = 0.02               # a FIN can overtake chunks still in our rx queue; recheck this often
+INCOMING_TTL = 60
+WRITE_COALESCE = 1024 * 1024    # in-order chunks are staged to disk in runs of at least this size
+COMPLETED_MEMORY = 1024
+
+# Swarm downloads: a file is fetched by content hash in pieces of SWARM_PIECE_CHUNKS chunks
+# (more for big files, so the piece-hash list in a HAVE stays under SWARM_MAX_PIECES),
+# each piece from whichever holder is free and each one verified on arrival.
+SWARM_PIECE_CHUNKS = 64
+SWARM_MAX_PIECES = 256
+SWARM_PIECE_RETRIES = 3
+SWARM_PIECE_TIMEOUT = 2.0       # plus a little per chunk, see SwarmDownload._fetch_piece
+SWARM_UPLOAD_SLOTS = 4          # GET requests served at once
+
+# Small files are packed into bundles so a sync of many tiny projects costs one stream.
+BUNDLE_FILE_LIMIT = 64 * 1024
+BUNDLE_MAX_BYTES = 4 * 1024 * 1024
+
+# Wire format: MAGIC | kind (1 byte) | header length (2 bytes) | JSON header | payload
+FRAME_MAGIC = b"GD"
+FRAME_CHUNK = b"C"
+FRAME_FIN = b"F"
+FRAME_ACK = b"A"
+FRAME_HELLO = b"H"
+FRAME_PING = b"Q"
+FRAME_PONG = b"R"
+FRAME_PUNCH = b"P"
+FRAME_RENDEZVOUS = b"V"   # matchmaker -> peer, see matchmaker.pack_rendezvous
+FRAME_WHO_HAS = b"W"      # swarm: {"qid", "sha256"}, answered by an ACK carrying the piece list
+FRAME_GET = b"G"          # swarm: {"did", "sha256", "seqs"}
+FRAME_PIECE = b"D"        # swarm: {"did", "seq", "z"?} | chunk
+FRAME_CATALOG = b"K"      # {"qid", "since", "scope"}, answered by an ACK carrying a SyncCatalog page
+FRAME_SEALED = b"S"       # {"sid", "e", "c"} | AEAD(inner C / F / A frame), see secure_channel
+
+# Per-session compression. Codecs are listed best first and the receiver picks the
+# first one it also supports. Chunks that don't shrink below COMPRESS_MIN_RATIO of
+# their size are sent raw.
+CODECS = (["zstd"] if zstandard else []) + ["zlib"]
+COMPRESS_MIN_RATIO = 0.9
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def pack_frame(kind, header, payload=b""):
+    head = json.dumps(header, separators=(",", ":")).encode()
+    return FRAME_MAGIC + kind + len(head).to_bytes(2, "big") + head + payload
+
+
+def unpack_frame(data):
+    """Returns (kind, header, payload) or None for anything that isn't a GhostDrive frame."""
+    if len(data) < 5 or data[:2] != FRAME_MAGIC:
+        return None
+    head_len = int.from_bytes(data[3:5], "big")
+    try:
+        header = json.loads(data[5:5 + head_len])
+    except ValueError:
+        return None
+    return data[2:3], header, data[5 + head_len:]
+
+
+def pack_bundle(files):
+    """
+    Packs [(name, data), ...] into one archive:
+    index length (4 bytes) | JSON index of name/offset/size | concatenated file bodies
+    """
+    index, offset = [], 0
+    for name, data in files:
+        index.append({"name": name, "offset": offset, "size": len(data)})
+        offset += len(data)
+    head = json.dumps(index, separators=(",", ":")).encode()
+    return len(head).to_bytes(4, "big") + head + b"".join(data for _, data in files)
+
+
+def unpack_bundle(blob):
+    head_len = int.from_bytes(blob[:4], "big")
+    body = memoryview(blob)[4 + head_len:]
+    for entry in json.loads(blob[4:4 + head_len]):
+        start = entry["offset"]
+        if start + entry["size"] > len(body):
+            raise ValueError("Bundle index points past the end of the archive")
+        yield entry["name"], bytes(body[start:start + entry["size"]])
+
+
+class _IncomingTransfer:
+    """
+    Reassembly state for one file stream from one peer. Chunks below ``flushed`` are
+    already in the staging file; ``ready`` counts the in-order run waiting after it.
+    """
+
+    def __init__(self, total, stage_name):
+        self.total = total
+        self.stage_name = stage_name
+        self.chunks = {}
+        self.flushed = 0
+        self.ready = 0
+        self.staged = None
+        self.reported = 0           # chunk count in the last progress ACK
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+
+    def has(self, seq):
+        return seq < self.flushed or seq in self.chunks
+
+    def add(self, seq, data):
+        self.chunks[seq] = data
+        while self.flushed + self.ready in self.chunks:
+            self.ready += 1
+
+    def take_run(self):
+        run = b"".join(self.chunks.pop(i) for i in range(self.flushed, self.flushed + self.ready))
+        self.flushed += self.ready
+        self.ready = 0
+        return run
+
+    def missing(self):
+        return [i for i in range(self.flushed, self.total) if i not in self.chunks]
+
+    def received(self):
+        return self.flushed + len(self.chunks)
+
+
+class _SendWindow:
+    """
+    Sender's view of how many chunks of one stream have landed, fed by the receiver's
+    progress ACKs. Streams keep at most SEND_WINDOW chunks unconfirmed, so the sender
+    runs at the pace the receiver drains its queue instead of overflowing it.
+    """
+
+    def __init__(self, channel=None):
+        self.channel = channel      # only progress sealed on this channel moves the window
+        self.received = 0
+        self._changed = asyncio.Event()
+
+    def update(self, received):
+        if isinstance(received, int) and received > self.received:
+            self.received = received
+            self._changed.set()
+
+    async def wait(self, timeout):
+        """Waits for the next progress report. False if none came within ``timeout``."""
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class _GhostServerProtocol(asyncio.DatagramProtocol):
+    """Main sync socket. Only queues datagrams; the rx workers do the real work."""
+
+    def __init__(self, network):
+        self.network = network
+
+    def datagram_received(self, data, addr):
+        self.network._enqueue_datagram(data, addr)
+
+    def error_received(self, exc):
+        print(f"Server error: {exc}")
+
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+    """LAN discovery listener for GHOST_DISCOVERY broadcasts."""
+
+    def __init__(self, network):
+        self.network = network
+
+    def datagram_received(self, data, addr):
+        self.network._handle_discovery(data, addr)
+
+
+def compress_chunk(codec, data):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress_chunk(codec, data, limit=CHUNK_SIZE):
+    """Inflates one chunk, refusing anything that grows past ``limit`` bytes."""
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported codec '{codec}'")
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=limit)
+    inflater = zlib.decompressobj()
+    out = inflater.decompress(data, limit)
+    if inflater.unconsumed_tail:
+        raise ValueError("Chunk inflates past the chunk size")
+    return out
+
+
+def _pack_chunks(raw_data, codec=None):
+    """
+    Splits and optionally compresses a payload. Returns [(data, codec_or_None), ...],
+    the on-wire byte count and the payload's sha256 (the receiver verifies it).
+    """
+    packed, wire_bytes = [], 0
+    for i in range(0, len(raw_data), CHUNK_SIZE):
+        chunk, used = raw_data[i:i + CHUNK_SIZE], None
+        if codec:
+            squeezed = compress_chunk(codec, chunk)
+            if len(squeezed) <= len(chunk) * COMPRESS_MIN_RATIO:
+                chunk, used = squeezed, codec
+        wire_bytes += len(chunk)
+        packed.append((chunk, used))
+    return packed, wire_bytes, hashlib.sha256(raw_data).hexdigest()
+
+
+def piece_layout(size):
+    """(chunks per piece, piece count) for a file size. Every holder derives the same layout."""
+    chunks = max(1, -(-size // CHUNK_SIZE))
+    piece_chunks = max(SWARM_PIECE_CHUNKS, -(-chunks // SWARM_MAX_PIECES))
+    return piece_chunks, -(-chunks // piece_chunks)
+
+
+def describe_file(path):
+    """Content hash, size and truncated per-piece hashes of a file (disk pool)."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        piece_bytes = piece_layout(size)[0] * CHUNK_SIZE
+        whole, pieces = hashlib.sha256(), []
+        while True:
+            piece = f.read(piece_bytes)
+            if not piece and pieces: break
+            whole.update(piece)
+            pieces.append(hashlib.sha256(piece).hexdigest()[:32])
+            if len(piece) < piece_bytes: break
+    return {"sha256": whole.hexdigest(), "size": size, "pieces": pieces}
+
+
+def _read_chunks(path, seqs):
+    with open(path, "rb") as f:
+        chunks = []
+        for seq in seqs:
+            f.seek(seq * CHUNK_SIZE)
+            chunks.append((seq, f.read(CHUNK_SIZE)))
+        return chunks
+
+
+def _pack_pieces(codec, did, chunks):
+    """Compresses (per the channel's codec) one burst of swarm pieces into inner frames."""
+    frames = []
+    for seq, data in chunks:
+        header = {"did": did, "seq": seq}
+        if codec:
+            packed = compress_chunk(codec, data)
+            if len(packed) <= len(data) * COMPRESS_MIN_RATIO:
+                data, header["z"] = packed, codec
+        frames.append(pack_frame(FRAME_PIECE, header, data))
+    return frames
+
+
+def seal_frame(channel, inner):
+    """Wraps an inner frame for the wire. Every (re)transmission gets a fresh counter."""
+    epoch, counter, ciphertext = channel.seal(inner)
+    return pack_frame(FRAME_SEALED, {"sid": channel.sid, "e": epoch, "c": counter}, ciphertext)
+
+
+def _open_sealed(channel, header, payload):
+    """Authenticates a sealed frame and unpacks (and inflates) the inner frame, or returns None."""
+    try:
+        epoch, counter = int(header.get("e", 0)), int(header["c"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    inner = channel.open(epoch, counter, payload)
+    frame = unpack_frame(inner) if inner is not None else None
+    if not frame: return None
+    kind, inner_header, data = frame
+    if kind in (FRAME_CHUNK, FRAME_PIECE) and inner_header.get("z"):
+        data = decompress_chunk(inner_header["z"], data)
+    return kind, inner_header, data
+
+
+class PeerSession:
+    """
+    Long-lived link to one peer: the address it answers on (the NAT mapping), the
+    handshake's SecureChannel, the negotiated codec and a heartbeat. Every session
+    sends through the node's single bound socket, so a punched mapping stays valid.
+    """
+
+    def __init__(self, network, key, addr, peer_sync_hex, peer_ghost_id=None):
+        self.network = network
+        self.key = key
+        self.addr = addr
+        self.peer_sync_hex = peer_sync_hex
+        self.peer_ghost_id = peer_ghost_id
+        self.channel = None
+        self.codec = None
+        self.bucket = None          # the peer's advertised download cap
+        self.alive = False
+        self.last_used = time.monotonic()
+        self.syncs = 0
+        self._heartbeat = None
+
+    async def open(self):
+        """Punches, then runs the handshake (HELLO -> signed ACK) which also picks the codec."""
+        net = self.network
+        if net.identity_priv_key is None:
+            raise ConnectionError("No identity key loaded, can't authenticate the session")
+        net._punch(self.addr)
+
+        sid = os.urandom(8).hex()
+        eph_priv, eph_hex = new_ephemeral()
+        signature = sign(net.identity_priv_key, transcript_hash(sid, net.ghost_id, eph_hex))
+        hello = pack_frame(FRAME_HELLO, {"from": net.ghost_id, "sid": sid, "eph": eph_hex,
+                                         "sig": signature, "codecs": CODECS, "rx_rate": net.download_limit})
+        reply = await net._await_ack(sid, hello, self.addr)
+        if reply is None:
+            raise ConnectionError(f"{self.key} did not answer the handshake")
+
+        self.channel = await net.loop.run_in_executor(
+            net.crypto_pool, net._finish_handshake, sid, eph_priv, eph_hex, reply, self.peer_sync_hex, self.peer_ghost_id
+        )
+        net.channels[sid] = self.channel
+        codec = reply.get("codec")
+        self.codec = self.channel.codec = codec if codec in CODECS else None
+        rx_rate = reply.get("rx_rate")
+        if isinstance(rx_rate, int) and rx_rate > 0:
+            self.bucket = self.channel.bucket = TokenBucket(rx_rate)
+        self.alive = True
+        self._heartbeat = net.loop.create_task(self._heartbeat_loop())
+        return self
+
+    def touch(self):
+        self.last_used = time.monotonic()
+        self.syncs += 1
+
+    async def _heartbeat_loop(self):
+        """Pings the peer to keep the NAT mapping warm; closes after repeated silence or idleness."""
+        net = self.network
+        misses = 0
+        while self.alive and net.running:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if time.monotonic() - self.last_used > SESSION_IDLE_TTL:
+                break
+            nonce = os.urandom(6).hex()
+            pong = await net._await_ack(nonce, pack_frame(FRAME_PING, {"from": net.ghost_id, "nonce": nonce}), self.addr)
+            misses = 0 if pong else misses + 1
+            if misses >= HEARTBEAT_MISSES:
+                print(f"[SESSION] {self.key} stopped answering")
+                self.close(failed=True)
+                return
+        self.close()
+
+    def close(self, failed=False):
+        """
+        Leaves the pool; the channel itself is swept once idle, so in-flight ACKs still land.
+        A ``failed`` session also takes the punched path it ran over with it.
+        """
+        self.alive = False
+        if failed:
+            self.network._drop_path(self.key, self.addr)
+        if self.network.sessions.get(self.key) is self:
+            del self.network.sessions[self.key]
+        if self._heartbeat and self._heartbeat is not asyncio.current_task():
+            self._heartbeat.cancel()
+
+
+class TransferScheduler:
+    """
+    Runs several file streams concurrently and fans one file set out to several peers.
+    Each peer is reached through its pooled PeerSession, and at most ``max_streams``
+    files are on the wire at once across all peers.
+    """
+
+    def __init__(self, network, max_streams=MAX_PARALLEL_STREAMS):
+        self.network = network
+        self.max_streams = max_streams
+
+    async def run(self, targets, file_paths, on_progress=None, bundle=True):
+        net = self.network
+        started = time.monotonic()
+        gate = asyncio.Semaphore(self.max_streams)
+        items = await net.loop.run_in_executor(net.disk_pool, self._plan_items, file_paths, bundle)
+
+        sessions = await asyncio.gather(*(net.get_session(t) for t in targets), return_exceptions=True)
+
+        jobs, transfers = [], []
+        for target, session in zip(targets, sessions):
+            if isinstance(session, Exception):
+                print(f"Sync failed: {session}")
+                transfers.extend(self._unreachable(target, item, session) for item in items)
+                continue
+            for item in items:
+                jobs.append(self._guarded(gate, target, session, item, on_progress))
+
+        transfers += await asyncio.gather(*jobs)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        sent = sum(t["bytes"] for t in transfers if t["ok"])
+        return {
+            "files": sum(len(t["members"]) for t in transfers),
+            "ok": sum(len(t["members"]) for t in transfers if t["ok"]),
+            "streams": len(transfers),
+            "failed": [t for t in transfers if not t["ok"]],
+            "bytes": sent,
+            "seconds": elapsed,
+            "throughput": sent / elapsed,
+            "retransmits": sum(t["retransmits"] for t in transfers),
+            "compression_ratio": self._ratio(transfers),
+            "transfers": transfers,
+        }
+
+    @staticmethod
+    def _unreachable(target, item, error):
+        members = [os.path.basename(p) for p in item["paths"]]
+        return {"peer": target.get("alias") or target.get("ip"), "file": members[0], "members": members,
+                "bytes": 0, "wire_bytes": 0, "codec": None, "ok": False, "retransmits": 0,
+                "seconds": 0.0, "error": str(error)}
+
+    @staticmethod
+    def _ratio(transfers):
+        raw = sum(t["bytes"] for t in transfers)
+        return (sum(t["wire_bytes"] for t in transfers) / raw) if raw else 1.0
+
+    @staticmethod
+    def _plan_items(file_paths, bundle):
+        """Groups small files into bundles of at most BUNDLE_MAX_BYTES; big files stream alone."""
+        items, batch, batch_bytes = [], [], 0
+        for path in file_paths:
+            size = os.path.getsize(path)
+            if not bundle or size > BUNDLE_FILE_LIMIT:
+                items.append({"paths": [path], "bundle": False})
+                continue
+            if batch and batch_bytes + size > BUNDLE_MAX_BYTES:
+                items.append({"paths": batch, "bundle": True})
+                batch, batch_bytes = [], 0
+            batch.append(path)
+            batch_bytes += size
+        if len(batch) == 1:
+            items.append({"paths": batch, "bundle": False})
+        elif batch:
+            items.append({"paths": batch, "bundle": True})
+        return items
+
+    def _load_item(self, item):
+        net = self.network
+        if not item["bundle"]:
+            return net._read_file(item["paths"][0])
+        return pack_bundle([(os.path.basename(p), net._read_file(p)) for p in item["paths"]])
+
+    async def _guarded(self, gate, target, session, item, on_progress):
+        async with gate:
+            return await self._send_stream(target, session, item, on_progress)
+
+    async def _send_stream(self, target, session, item, on_progress):
+        net = self.network
+        addr = session.addr
+        peer = target.get("alias") or target.get("ip")
+        members = [os.path.basename(p) for p in item["paths"]]
+        name = members[0] if not item["bundle"] else f"bundle_{len(members)}"
+        report = {"peer": peer, "file": name, "members": members, "bytes": 0, "wire_bytes": 0,
+                  "codec": session.codec, "ok": False, "retransmits": 0, "seconds": 0.0}
+        started = time.monotonic()
+
+        def progress(pct):
+            if on_progress:
+                for member in members:
+                    on_progress(peer, member, pct)
+
+        try:
+            raw_data = await net.loop.run_in_executor(net.disk_pool, self._load_item, item)
+            chunks, wire_bytes, digest = await net.loop.run_in_executor(
+                net.crypto_pool, _pack_chunks, raw_data, session.codec
+            )
+            if len(chunks) > MAX_CHUNKS_PER_FILE:
+                raise ValueError(f"{name} is too large to sync")
+            report["bytes"] = len(raw_data)
+            report["wire_bytes"] = wire_bytes
+            report["ratio"] = (wire_bytes / len(raw_data)) if raw_data else 1.0
+
+            tid = os.urandom(8).hex()
+            total = len(chunks)
+            priority = PRIORITY_SMALL if item["bundle"] or len(raw_data) <= SMALL_FILE_LIMIT else PRIORITY_BULK
+            inner = []
+            for i, (data, codec) in enumerate(chunks):
+                header = {"tid": tid, "seq": i, "n": total}
+                if codec:
+                    header["z"] = codec
+                inner.append(pack_frame(FRAME_CHUNK, header, data))
+            fin_header = {"tid": tid, "n": total, "name": name, "sha256": digest}
+            if item["bundle"]:
+                fin_header["bundle"] = True
+            fin = pack_frame(FRAME_FIN, fin_header)
+
+            pending = range(total)
+            sent_before = bytearray(total)
+            window = net._windows[tid] = _SendWindow(session.channel)
+            try:
+                for attempt in range(MAX_ACK_ROUNDS):
+                    unsent = await self._send_round(session, inner, pending, sent_before, window, priority, report,
+                                                    progress if attempt == 0 else None)
+
+                    # FIN is control traffic; don't let it overtake our own queued chunks
+                    await net.sender.marker(priority)
+
+                    ack = await net._await_ack(tid, fin, addr, session.channel)
+                    if ack is None:
+                        # Likely restarted and lost our keys; the next sync handshakes afresh
+                        session.close(failed=True)
+                        raise TimeoutError("peer stopped answering")
+                    if ack.get("error"):
+                        raise ValueError(f"peer rejected {name}: {ack['error']}")
+                    if ack.get("done"):
+                        report["ok"] = True
+                        break
+                    # A round cut short by a stall still owes its unsent tail
+                    missing = {seq for seq in ack.get("missing", []) if 0 <= seq < total}
+                    pending = sorted(missing.union(unsent))
+                else:
+                    raise TimeoutError(f"gave up after {MAX_ACK_ROUNDS} retransmit rounds")
+            finally:
+                net._windows.pop(tid, None)
+        except Exception as e:
+            report["error"] = str(e)
+            print(f"Sync failed: {e}")
+
+        report["seconds"] = time.monotonic() - started
+        if report["ok"]: progress(100)
+        return report
+
+    async def _send_round(self, session, inner, pending, sent_before, window, priority, report, progress=None):
+        """
+        Sends one pass over ``pending``, paced by the receiver's progress reports. If the
+        receiver goes quiet with the window full, the round stops early so the FIN can
+        find out what got lost; returns the seqs it never sent.
+        """
+        net = self.network
+        base, sent = window.received, 0
+        for start in range(0, len(pending), SEND_BURST):
+            while sent - (window.received - base) > SEND_WINDOW - SEND_BURST:
+                if not await window.wait(ACK_TIMEOUT):
+                    return pending[start:]
+            burst = pending[start:start + SEND_BURST]
+            for seq in burst:
+                report["retransmits"] += sent_before[seq]
+                sent_before[seq] = 1
+                net._send_sealed(session.channel, inner[seq], session.addr, priority, session.bucket)
+            sent += len(burst)
+            await net.sender.room(priority)
+            if progress: progress(int((start + len(burst)) / len(pending) * 100))
+        return []
+
+
+class SwarmDownload:
+    """
+    Pulls one file, by content hash, from every holder at once. Pieces wait in one
+    queue and each holder's worker takes the next free piece, so faster peers simply
+    serve more of the file. A piece is hashed before it's accepted; one that fails
+    goes back in the queue and the peer that sent it is dropped from the swarm.
+    Verified pieces are written to the staging file in order.
+    """
+
+    def __init__(self, network, sha256, name, info):
+        self.network = network
+        self.sha256 = sha256
+        self.name = name
+        self.size = info["size"]
+        self.piece_hashes = info["pieces"]
+        self.piece_chunks, piece_count = piece_layout(self.size)
+        self.total_chunks = max(1, -(-self.size // CHUNK_SIZE))
+        self.did = os.urandom(8).hex()
+        self.queue = list(range(piece_count))
+        self.remaining = piece_count
+        self.assigned = {}          # piece -> peer_id it was requested from
+        self.partial = {}           # piece -> {seq: data}
+        self.waiters = {}
+        self.verified = {}          # piece -> bytes, waiting for its turn to be written
+        self.next_write = 0
+        self.staged = None
+        self.served = {}            # peer alias -> pieces delivered
+        self.bad_pieces = 0
+
+    def piece_seqs(self, piece):
+        start = piece * self.piece_chunks
+        return range(start, min(start + self.piece_chunks, self.total_chunks))
+
+    def on_piece(self, peer_id, seq, data):
+        piece = seq // self.piece_chunks
+        if self.assigned.get(piece) != peer_id or not 0 <= seq < self.total_chunks: return
+        chunks = self.partial.setdefault(piece, {})
+        chunks[seq] = data
+        waiter = self.waiters.get(piece)
+        if waiter and not waiter.done() and len(chunks) == len(self.piece_seqs(piece)):
+            waiter.set_result(True)
+
+    async def run(self, holders):
+        net = self.network
+        self.staged = await net.loop.run_in_executor(net.disk_pool, StagedFile, net.staging_dir, f"swarm_{self.did}")
+        try:
+            await asyncio.gather(*(self._worker(alias, session) for alias, session in holders))
+            if self.remaining:
+                raise ConnectionError(f"every holder dropped out, {self.remaining} pieces left")
+            if not await net.loop.run_in_executor(net.disk_pool, self.staged.finish, self.sha256):
+                raise ValueError(f"{self.name} failed verification")
+            await net.loop.run_in_executor(net.disk_pool, self.staged.commit, net._project_path(self.name))
+        except BaseException:
+            net.disk_pool.submit(self.staged.discard)
+            raise
+
+    async def _worker(self, alias, session):
+        while self.remaining:
+            if not self.queue:
+                # Endgame: the last pieces are in flight elsewhere and may yet come back
+                await asyncio.sleep(0.05)
+                continue
+            piece = self.queue.pop(0)
+            if await self._fetch_piece(session, piece):
+                self.remaining -= 1
+                self.served[alias] = self.served.get(alias, 0) + 1
+                continue
+            self.queue.append(piece)
+            print(f"[SWARM] Dropping {alias} from the swarm")
+            return
+
+    async def _fetch_piece(self, session, piece):
+        net = self.network
+        self.assigned[piece] = session.channel.peer_id
+        seqs = self.piece_seqs(piece)
+        try:
+            for _ in range(SWARM_PIECE_RETRIES):
+                have = self.partial.get(piece, {})
+                wanted = [seq for seq in seqs if seq not in have]
+                if not wanted: break
+                waiter = self.waiters[piece] = net.loop.create_future()
+                net._send_sealed(session.channel, pack_frame(FRAME_GET, {
+                    "did": self.did, "sha256": self.sha256, "seqs": wanted
+                }), session.addr)
+                try:
+                    await asyncio.wait_for(waiter, SWARM_PIECE_TIMEOUT + len(wanted) * 0.01)
+                except asyncio.TimeoutError:
+                    continue
+            chunks = self.partial.pop(piece, {})
+            if len(chunks) != len(seqs):
+                return False
+            data = b"".join(chunks[seq] for seq in seqs)
+            digest = await net.loop.run_in_executor(net.crypto_pool, lambda: hashlib.sha256(data).hexdigest()[:32])
+            if digest != self.piece_hashes[piece]:
+                self.bad_pieces += 1
+                return False
+            self.verified[piece] = data
+            await self._write_ready()
+            return True
+        finally:
+            self.waiters.pop(piece, None)
+            self.assigned.pop(piece, None)
+
+    async def _write_ready(self):
+        """Writes every verified piece that's next in line as one sequential write."""
+        net = self.network
+        run = []
+        while self.next_write in self.verified:
+            run.append(self.verified.pop(self.next_write))
+            self.next_write += 1
+        if run:
+            await net.loop.run_in_executor(net.disk_pool, self.staged.write, b"".join(run))
 
-GHOST_PORT = 5555 
 
 class GhostNetwork:
-    def __init__(self, username, fernet, ghost_id, sync_priv_key):
+    def __init__(self, username, fernet, ghost_id, sync_priv_key, port=GHOST_PORT, identity_priv_key=None,
+                 upload_limit=UPLOAD_LIMIT, download_limit=DOWNLOAD_LIMIT, peer_source=None, receive_dir=None,
+                 catalog=None):
+        """
+        ``peer_source`` is a callable returning the trusted-peer dict (defaults to the
+        encrypted peers file) and ``receive_dir`` overrides projects/<username>; both
+        exist so several nodes can share one process, e.g. in benchmarks. ``catalog``
+        is the SyncCatalog served to peers; without one the node advertises nothing.
+        """
         self.username = username
-        self.fernet = fernet 
+        self.fernet = fernet
         self.ghost_id = ghost_id
         self.sync_priv_key = sync_priv_key
+        self.sync_pub_hex = public_hex(sync_priv_key) if sync_priv_key else None
+        self.identity_priv_key = identity_priv_key   # Ed25519, signs our half of every handshake
+        self.port = port
+        self.peer_source = peer_source or (lambda: load_peers(username, fernet))
+        self.receive_dir = receive_dir or os.path.join(EVERYTHING_ELSE, "projects", username)
+        parent, leaf = os.path.split(os.path.normpath(self.receive_dir))
+        self.staging_dir = os.path.join(parent, ".staging", leaf)
+        self.upload_limit = upload_limit or 0
+        self.download_limit = download_limit or 0
+        self.running = False
+        self.registry = DiscoveryRegistry()
+        self.catalog = catalog
+
+        # Event loop state (owned by the network thread)
+        self.loop = None
+        self.transport = None
+        self._loop_thread = None
+        self._ready = threading.Event()
+        self._rx_queue = None
+        self._tasks = []
+        self._endpoints = []
+        self._broadcast_transport = None
+        self.sender = None
+        self.rx_dropped = 0
+
+        # Transfer state (only touched from the loop)
+        self._incoming = {}
+        self._completed = {}
+        self._ack_waiters = {}      # tid -> (future, channel the answer must be sealed on, None for HELLO / PING)
+        self._windows = {}          # tid -> _SendWindow of our outgoing streams
+        self.scheduler = TransferScheduler(self)
+
+        # NAT traversal: ghost_id -> punched (ip, port), kept once a signed handshake has gone
+        # over it and until it stops answering. Candidates are punched but not yet vouched for.
+        self.punched_paths = {}
+        self._candidates = {}
+        self._registrations = {}    # room_id -> (nonce, expected ghost_id) of our matchmaker registrations
+        self._rendezvous_waiters = {}
+        self._punch_waiters = {}
+        self._path_tasks = {}
+        self._keepalives = {}
+
+        # Session pool: peer key -> PeerSession; every handshaken channel by session id
+        self.sessions = {}
+        self._opening = {}
+        self.channels = {}
+        self.rx_rejected = 0
+
+        # Swarm: downloads in flight by id, and the hash index of files we share
+        self._downloads = {}
+        self._file_index = {}
+        self._upload_slots = None
+        self._trusted = (0.0, {})
+
+        self.crypto_pool = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS, thread_name_prefix="ghost-crypto")
+        self.disk_pool = ThreadPoolExecutor(max_workers=DISK_WORKERS, thread_name_prefix="ghost-disk")
+
+    # --- LOOP LIFECYCLE (thread-safe) ---
+
+    def start(self):
+        """Boots the network loop in one background thread. Safe to call from the UI."""
+        if self._loop_thread and self._loop_thread.is_alive():
+            return
         self.running = True
-        self.discovered_peers = {} 
+        self._ready.clear()
+        self._loop_thread = threading.Thread(target=self._run_loop, name="ghost-net", daemon=True)
+        self._loop_thread.start()
+        self._ready.wait(timeout=5)
+
+    def stop(self):
+        """Stops the loop, closes every endpoint and releases the worker pools."""
+        self.running = False
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.close_sessions)
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._loop_thread:
+            self._loop_thread.join(timeout=5)
+        self.crypto_pool.shutdown(wait=False)
+        self.disk_pool.shutdown(wait=False)
+
+    def submit(self, coro):
+        """Schedules a coroutine on the network loop from any thread (returns a concurrent Future)."""
+        if not self.loop:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._boot())
+        finally:
+            self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            # Everything still pending: boot tasks, keepalives, punches, transfers
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            for transport in self._endpoints:
+                transport.close()
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+
+    async def _boot(self):
+        self._rx_queue = asyncio.Queue(maxsize=RX_QUEUE_LIMIT)
+        self._upload_slots = asyncio.Semaphore(SWARM_UPLOAD_SLOTS)
+        self.sender = PrioritySender(self._transmit, self.upload_limit)
+        self._tasks = [self.loop.create_task(self._rx_worker()) for _ in range(RX_WORKERS)]
+        self._tasks.append(self.loop.create_task(self.sender.pump()))
+        await self.start_server()
+        await self.listen_for_peers()
+        self._tasks.append(self.loop.create_task(self.start_broadcast()))
+        self._tasks.append(self.loop.create_task(self._check_liveness()))
+        if MATCHMAKER and self.sync_pub_hex:
+            self._tasks.append(self.loop.create_task(self._advertise_rooms()))
+
+    def set_rate_limits(self, upload=None, download=None):
+        """Changes the caps (bytes/s, 0 = unlimited) from any thread. Download caps apply to new sessions."""
+        if upload is not None:
+            self.upload_limit = upload
+            if self.loop and self.sender:
+                self.loop.call_soon_threadsafe(self.sender.set_upload_limit, upload)
+        if download is not None:
+            self.download_limit = download
+
+    @property
+    def discovered_peers(self):
+        """ghost_id -> ip of the fastest live address (legacy view of the registry)."""
+        best = {gid: self.registry.best_address(gid) for gid in self.registry.snapshot()}
+        return {gid: addr[0] for gid, addr in best.items() if addr}
 
     def get_public_ip(self):
         """Fetches the WAN IP so the user can share it."""
@@ -35,97 +891,810 @@ class GhostNetwork:
             except:
                 return "127.0.0.1"
 
-    def start_server(self):
-        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # --- RECEIVER ---
+
+    async def start_server(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # Bursts of chunks arrive faster than the rx workers drain them
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RX_SOCKET_BUFFER)
+        except OSError: pass
         try:
-            server.bind(('0.0.0.0', GHOST_PORT))
-            while self.running:
-                data, addr = server.recvfrom(65535)
-                threading.Thread(target=self.handle_incoming_udp, args=(data, addr)).start()
+            sock.bind(('0.0.0.0', self.port))
+            self.port = sock.getsockname()[1]   # port 0 asks the OS for a free one
+            transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: _GhostServerProtocol(self), sock=sock
+            )
+            self.transport = transport
+            self._endpoints.append(transport)
+            self._tasks.append(self.loop.create_task(self._sweep_incoming()))
+            self.loop.run_in_executor(self.disk_pool, sweep_staging, self.staging_dir)
         except Exception as e:
+            sock.close()
             print(f"Server error: {e}")
 
-    def handle_incoming_udp(self, data, addr):
+    def _enqueue_datagram(self, data, addr):
         try:
-            # 1. Check for Hole Punch
-            if data == b"PUNCH": return
+            self._rx_queue.put_nowait((data, addr))
+        except asyncio.QueueFull:
+            self.rx_dropped += 1
+
+    async def _rx_worker(self):
+        while True:
+            data, addr = await self._rx_queue.get()
+            try:
+                await self.handle_incoming_udp(data, addr)
+            except Exception as e:
+                print(f"Transfer error: {e}")
+            finally:
+                self._rx_queue.task_done()
+
+    async def handle_incoming_udp(self, data, addr):
+        frame = unpack_frame(data)
+        if not frame: return
+        kind, header, payload = frame
+
+        if kind == FRAME_SEALED:
+            await self._on_sealed(header, payload, addr)
+        elif kind == FRAME_ACK:
+            self._on_ack(header)
+        elif kind == FRAME_HELLO:
+            await self._on_hello(header, addr)
+        elif kind == FRAME_PING:
+            self._send_frame(pack_frame(FRAME_PONG, {"from": self.ghost_id, "nonce": header.get("nonce")}), addr)
+        elif kind == FRAME_PONG:
+            self.registry.pong_received(header.get("nonce"))
+            self._on_ack({"tid": header.get("nonce")}) # session heartbeats wait on the nonce
+        elif kind == FRAME_PUNCH:
+            self._on_punch(header, addr)
+        elif kind == FRAME_RENDEZVOUS:
+            self._on_rendezvous(header)
+
+    async def _on_sealed(self, header, payload, addr):
+        """Data-path frames: the session id picks the keys, the AEAD tag vouches for the sender."""
+        channel = self.channels.get(header.get("sid"))
+        if channel is None: return
+        inner = await self.loop.run_in_executor(self.crypto_pool, _open_sealed, channel, header, payload)
+        if inner is None:
+            self.rx_rejected += 1
+            return
+        kind, inner_header, data = inner
+        if kind == FRAME_CHUNK:
+            self._on_chunk(channel, inner_header, data, addr)
+        elif kind == FRAME_FIN:
+            await self._on_fin(channel, inner_header, addr)
+        elif kind == FRAME_ACK:
+            self._on_ack(inner_header, channel)
+        elif kind == FRAME_PIECE:
+            download = self._downloads.get(inner_header.get("did"))
+            if download:
+                download.on_piece(channel.peer_id, int(inner_header.get("seq", -1)), data)
+        elif kind == FRAME_WHO_HAS:
+            await self._on_who_has(channel, inner_header, addr)
+        elif kind == FRAME_GET:
+            self.loop.create_task(self._serve_get(channel, inner_header, addr))
+        elif kind == FRAME_CATALOG:
+            await self._on_catalog_request(channel, inner_header, addr)
+
+    def _on_chunk(self, channel, header, data, addr):
+        key = (channel.peer_id, header.get("tid"))
+        if key in self._completed: return
+
+        transfer = self._incoming.get(key)
+        if transfer is None:
+            total = int(header.get("n", 0))
+            if not 0 < total <= MAX_CHUNKS_PER_FILE: return
+            transfer = self._incoming[key] = _IncomingTransfer(total, self._stage_name(key))
+
+        seq = int(header.get("seq", -1))
+        if not 0 <= seq < transfer.total or transfer.has(seq): return
+        transfer.last_seen = time.monotonic()
+        transfer.add(seq, data)
+        received = transfer.received()
+        if received - transfer.reported >= WINDOW_UPDATE:
+            # Progress report, so the sender opens its window as fast as we drain
+            transfer.reported = received
+            self._send_sealed(channel, pack_frame(FRAME_ACK, {"tid": key[1], "rx": received}), addr)
+        if transfer.ready * CHUNK_SIZE >= WRITE_COALESCE and not transfer.lock.locked():
+            self.loop.create_task(self._flush_transfer(transfer))
 
-            sender_id = data[:32].decode().strip()
-            header_json = data[32:160].decode().strip()
-            header = json.loads(header_json)
-            encrypted_payload = data[160:]
+    async def _flush_transfer(self, transfer, final=False):
+        """Appends the in-order run to the staging file as one sequential write (disk pool)."""
+        async with transfer.lock:
+            try:
+                if transfer.staged is None:
+                    transfer.staged = await self.loop.run_in_executor(
+                        self.disk_pool, StagedFile, self.staging_dir, transfer.stage_name
+                    )
+                while transfer.ready and (final or transfer.ready * CHUNK_SIZE >= WRITE_COALESCE):
+                    await self.loop.run_in_executor(self.disk_pool, transfer.staged.write, transfer.take_run())
+            except Exception as e:
+                if final: raise
+                print(f"Transfer error: {e}")
+
+    async def _on_fin(self, channel, header, addr):
+        key = (channel.peer_id, header.get("tid"))
+        ack = {"tid": key[1]}
 
-            peers = load_peers(self.username, self.fernet)
-            target_peer = next((p for p in peers.values() if p.get("ghost_id") == sender_id), None)
+        if key in self._completed:
+            self._send_sealed(channel, pack_frame(FRAME_ACK, dict(ack, done=True)), addr)
+            return
 
-            if not target_peer: return 
+        transfer = self._incoming.get(key)
+        if transfer is None:
+            total = int(header.get("n", 0))
+            if not 0 <= total <= MAX_CHUNKS_PER_FILE: return
+            transfer = self._incoming[key] = _IncomingTransfer(total, self._stage_name(key))
 
-            shared_secret = derive_shared_secret(self.sync_priv_key, target_peer.get("public_key"))
-            sync_fernet = Fernet(base64.urlsafe_b64encode(shared_secret[:32]))
+        missing, received = transfer.missing(), -1
+        while missing and transfer.received() != received:
+            # Only report what's really lost, not chunks queued behind this FIN
+            received = transfer.received()
+            await asyncio.sleep(FIN_SETTLE)
+            missing = transfer.missing()
+        if key not in self._incoming:
+            return  # a duplicate FIN completed it meanwhile
+        if missing:
+            self._send_sealed(channel, pack_frame(FRAME_ACK, dict(ack, done=False, missing=missing[:MAX_NACKS_PER_ACK])), addr)
+            return
 
-            decrypted_data = sync_fernet.decrypt(encrypted_payload)
-            filename = header.get("filename", "sync_file.enc")
-            save_path = os.path.join(EVERYTHING_ELSE, "projects", self.username, filename)
-            
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            with open(save_path, "wb") as f:
-                f.write(decrypted_data)
-            print(f"[SUCCESS] Received {filename}")
+        # Complete: claim it before awaiting so a duplicate FIN can't write twice
+        del self._incoming[key]
+        self._remember_completed(key)
+        filename = os.path.basename(header.get("name", "sync_file.enc")) or "sync_file.enc"
+        try:
+            await self._flush_transfer(transfer, final=True)
+            if not await self.loop.run_in_executor(self.disk_pool, transfer.staged.finish, header.get("sha256")):
+                self._completed.pop(key, None)
+                print(f"Transfer error: {filename} failed verification")
+                self._send_sealed(channel, pack_frame(FRAME_ACK, dict(ack, done=False, error="hash mismatch")), addr)
+                return
+            if header.get("bundle"):
+                received = await self.loop.run_in_executor(self.disk_pool, self._commit_bundle, transfer.staged)
+            else:
+                await self.loop.run_in_executor(self.disk_pool, transfer.staged.commit, self._project_path(filename))
+                received = [filename]
         except Exception as e:
+            self._completed.pop(key, None)
+            if transfer.staged:
+                self.disk_pool.submit(transfer.staged.discard)
             print(f"Transfer error: {e}")
+            return
+        for name in received:
+            print(f"[SUCCESS] Received {name}")
+        self._send_sealed(channel, pack_frame(FRAME_ACK, dict(ack, done=True)), addr)
+
+    async def _on_hello(self, header, addr):
+        """Responder half of the handshake. Duplicate HELLOs (sender retries) get the same answer."""
+        sid = header.get("sid")
+        if not isinstance(sid, str) or self.identity_priv_key is None: return
+        channel = self.channels.get(sid)
+        if channel is None:
+            channel = await self.loop.run_in_executor(self.crypto_pool, self._accept_handshake, header)
+            if channel is None:
+                print(f"[HANDSHAKE] Rejected HELLO from {addr[0]}:{addr[1]}")
+                return
+            channel = self.channels.setdefault(sid, channel)
+            self._confirm_path(channel.peer_id, addr)
+        if channel.hello_reply:
+            self._send_frame(channel.hello_reply, addr)
+
+    def _on_ack(self, header, channel=None):
+        """
+        Resolves whoever waits on the ACK's tid, but only from the channel they sent on:
+        an unsealed ACK (channel None) can answer a HELLO or PING and nothing else.
+        """
+        if "rx" in header:
+            window = self._windows.get(header.get("tid"))
+            if window and channel is not None and window.channel is channel:
+                window.update(header["rx"])
+            return
+        waiter, expected = self._ack_waiters.get(header.get("tid"), (None, None))
+        if waiter and expected is channel and not waiter.done():
+            waiter.set_result(header)
+
+    def _remember_completed(self, key):
+        self._completed[key] = time.monotonic()
+        while len(self._completed) > COMPLETED_MEMORY:
+            self._completed.pop(next(iter(self._completed)))
+
+    async def _sweep_incoming(self):
+        """Drops half-received streams whose sender went quiet."""
+        while self.running:
+            await asyncio.sleep(INCOMING_TTL / 4)
+            cutoff = time.monotonic() - INCOMING_TTL
+            for key in [k for k, t in self._incoming.items() if t.last_seen < cutoff]:
+                transfer = self._incoming.pop(key)
+                if transfer.staged:
+                    self.disk_pool.submit(transfer.staged.discard)
+
+            pooled = {s.channel.sid for s in self.sessions.values() if s.channel}
+            cutoff = time.monotonic() - CHANNEL_IDLE_TTL
+            for sid in [k for k, c in self.channels.items() if c.last_seen < cutoff and k not in pooled]:
+                del self.channels[sid]
+
+    def _trusted_peer(self, ghost_id):
+        """Trusted-peer record for a ghost_id (crypto pool), from a cached read of the vault."""
+        loaded_at, by_id = self._trusted
+        age = time.monotonic() - loaded_at
+        # Misses reload too (a peer may have just been added), but at most once a second
+        if age > TRUSTED_PEERS_TTL or (ghost_id not in by_id and age > 1):
+            peers = self.peer_source()
+            by_id = {p["ghost_id"]: p for p in peers.values() if isinstance(p, dict) and p.get("ghost_id")}
+            self._trusted = (time.monotonic(), by_id)
+        return by_id.get(ghost_id)
+
+    def _accept_handshake(self, hello):
+        """
+        Vets a HELLO (trusted ghost_id, valid signature over sid + ephemeral) and builds
+        our answer. Returns the responder's SecureChannel, or None. Runs in the crypto pool.
+        """
+        peer_id, sid, peer_eph = hello.get("from"), hello.get("sid"), hello.get("eph")
+        peer = self._trusted_peer(peer_id)
+        if not peer or not isinstance(peer_eph, str) or not isinstance(hello.get("sig"), str):
+            return None
+        if not verify(peer_id, hello["sig"], transcript_hash(sid, peer_id, peer_eph)):
+            return None
+
+        eph_priv, eph_hex = new_ephemeral()
+        transcript = transcript_hash(sid, peer_id, peer_eph, self.ghost_id, eph_hex)
+        try:
+            eph_secret = ephemeral_secret(eph_priv, peer_eph)
+            static_secret = derive_shared_secret(self.sync_priv_key, peer.get("public_key"))
+        except (ValueError, TypeError):
+            return None
+        to_responder, to_initiator = derive_session_keys(transcript, eph_secret, static_secret)
+
+        offered = hello.get("codecs") or []
+        codec = next((c for c in offered if c in CODECS), None)
+        channel = SecureChannel(sid, peer_id, send_key=to_initiator, recv_key=to_responder)
+        channel.codec = codec
+        rx_rate = hello.get("rx_rate")
+        if isinstance(rx_rate, int) and rx_rate > 0:
+            channel.bucket = TokenBucket(rx_rate)
+        channel.hello_reply = pack_frame(FRAME_ACK, {
+            "tid": sid, "done": True, "codec": codec, "rx_rate": self.download_limit,
+            "from": self.ghost_id, "eph": eph_hex, "sig": sign(self.identity_priv_key, transcript),
+        })
+        return channel
+
+    def _finish_handshake(self, sid, eph_priv, eph_hex, reply, peer_sync_hex, peer_ghost_id=None):
+        """Initiator half: checks who answered and derives the channel (crypto pool)."""
+        peer_id, peer_eph, signature = reply.get("from"), reply.get("eph"), reply.get("sig")
+        if peer_ghost_id and peer_id != peer_ghost_id:
+            raise ConnectionError("Handshake answered by a different identity")
+        peer = self._trusted_peer(peer_id)
+        if not peer or peer.get("public_key") != peer_sync_hex:
+            raise ConnectionError("Handshake answered by an untrusted identity")
+        if not isinstance(peer_eph, str) or not isinstance(signature, str):
+            raise ConnectionError("Malformed handshake reply")
+
+        transcript = transcript_hash(sid, self.ghost_id, eph_hex, peer_id, peer_eph)
+        if not verify(peer_id, signature, transcript):
+            raise ConnectionError("Handshake signature did not verify")
+        eph_secret = ephemeral_secret(eph_priv, peer_eph)
+        static_secret = derive_shared_secret(self.sync_priv_key, peer_sync_hex)
+        to_responder, to_initiator = derive_session_keys(transcript, eph_secret, static_secret)
+        return SecureChannel(sid, peer_id, send_key=to_responder, recv_key=to_initiator)
+
+    def _project_path(self, filename):
+        return os.path.join(self.receive_dir, filename)
+
+    @staticmethod
+    def _stage_name(key):
+        peer_id, tid = key
+        return f"{str(peer_id)[:16]}_{os.path.basename(str(tid))}"
+
+    def _commit_bundle(self, staged):
+        """Unpacks a verified bundle, moving each member into the projects folder atomically (disk pool)."""
+        written = []
+        try:
+            for name, data in unpack_bundle(staged.read()):
+                name = os.path.basename(name)
+                if not name: continue
+                atomic_write(self._project_path(name), data, self.staging_dir, sync_dir=False)
+                written.append(name)
+        finally:
+            staged.discard()
+        if written:
+            fsync_dir(os.path.dirname(self._project_path(written[0])))
+        return written
+
+    # --- SENDER ---
+
+    def _send_frame(self, frame, addr, priority=PRIORITY_CONTROL, bucket=None):
+        """Everything on the sync socket goes through the shaper; control frames by default."""
+        if self.sender:
+            self.sender.send(frame, addr, priority, bucket)
+
+    def _transmit(self, frame, addr):
+        if self.transport:
+            self.transport.sendto(frame, addr)
+
+    def _send_sealed(self, channel, inner, addr, priority=PRIORITY_CONTROL, bucket=None):
+        """
+        Sealed as the frame leaves the shaper, not when it's queued: counters then follow
+        the real send order across priority classes and stay inside the peer's replay window.
+        """
+        if self.sender:
+            self.sender.send(inner, addr, priority, bucket, seal=functools.partial(seal_frame, channel))
+
+    def _punch(self, addr, room_id=None, ack=False):
+        self._send_frame(pack_frame(FRAME_PUNCH, {"from": self.ghost_id, "room": room_id, "ack": ack}), addr)
+
+    def _on_punch(self, header, addr):
+        # Punches are unauthenticated: only answer for rooms we're in, and let the
+        # handshake that follows decide whether the address is really our peer
+        room_id = header.get("room")
+        if room_id not in self._punch_waiters and room_id not in self._registrations: return
+        waiter = self._punch_waiters.get(room_id)
+        if waiter and not waiter.done():
+            # Their packet got through our NAT; the address we saw it from is the one to use
+            waiter.set_result(addr)
+        if not header.get("ack"):
+            self._punch(addr, room_id, ack=True)
+
+    async def _await_ack(self, tid, frame, addr, channel=None):
+        """
+        Sends a control frame (FIN / HELLO / PING) until the peer answers with an ACK header,
+        or gives up with None. With a channel the frame is re-sealed on every attempt.
+        """
+        for _ in range(FIN_RETRIES):
+            waiter = self.loop.create_future()
+            self._ack_waiters[tid] = (waiter, channel)
+            if channel:
+                self._send_sealed(channel, frame, addr)
+            else:
+                self._send_frame(frame, addr)
+            try:
+                return await asyncio.wait_for(waiter, ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                self._ack_waiters.pop(tid, None)
+        return None
+
+    def sync_files(self, targets, file_paths, on_progress=None, bundle=True):
+        """
+        Thread-safe entry point for the scheduler. ``targets`` are dicts with a
+        public_key plus either ip (and optional port) or a ghost_id to resolve
+        through resolve_path; alias is used for reporting. Small files are bundled
+        unless ``bundle`` is False. Returns a concurrent Future that resolves to
+        the aggregate sync stats.
+        """
+        return self.submit(self.scheduler.run(targets, file_paths, on_progress, bundle))
 
     def send_file(self, target_ip, file_path, recipient_sync_hex, progress_callback=None):
-        """Direct P2P Transmission with Progress Tracking."""
-        try:
-            shared_secret = derive_shared_secret(self.sync_priv_key, recipient_sync_hex)
-            sync_fernet = Fernet(base64.urlsafe_b64encode(shared_secret[:32]))
-
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            filename = os.path.basename(file_path)
-            
-            with open(file_path, "rb") as f:
-                raw_data = f.read()
-            
-            encrypted_data = sync_fernet.encrypt(raw_data)
-            header_data = json.dumps({"filename": filename}).ljust(128).encode()
-            id_prefix = f"{self.ghost_id:<32}".encode()
-            
-            full_packet = id_prefix + header_data + encrypted_data
-            total_size = len(full_packet)
-            
-            # Send Hole Punch
-            sock.sendto(b"PUNCH", (target_ip, GHOST_PORT))
-            time.sleep(0.1)
-
-            # Chunked Send (Reliability for larger files)
-            chunk_size = 8192
-            for i in range(0, total_size, chunk_size):
-                chunk = full_packet[i:i + chunk_size]
-                sock.sendto(chunk, (target_ip, GHOST_PORT))
-                if progress_callback:
-                    progress_callback(int((i / total_size) * 100))
-            
-            if progress_callback: progress_callback(100)
-            return True
-        except Exception as e:
-            print(f"Sync failed: {e}")
-            return False
+        """Single file, single peer. Blocks the calling thread, never the loop."""
+        relay = (lambda peer, name, pct: progress_callback(pct)) if progress_callback else None
+        target = {"ip": target_ip, "public_key": recipient_sync_hex}
+        stats = self.sync_files([target], [file_path], relay).result()
+        return not stats["failed"]
+
+    def _read_file(self, file_path):
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    # --- SESSION POOL ---
 
-    def start_broadcast(self):
-        broadcast_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        broadcast_sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        message = f"GHOST_DISCOVERY:{self.ghost_id}".encode()
+    async def get_session(self, target):
+        """
+        Returns the pooled PeerSession for a target, opening one if needed.
+        Concurrent callers for the same peer share a single handshake.
+        """
+        addr = await self.resolve_path(target)
+        if not addr:
+            raise ConnectionError(f"No path to {target.get('alias') or target.get('ghost_id')}")
+        key = target.get("ghost_id") or f"{addr[0]}:{addr[1]}"
+
+        session = self.sessions.get(key)
+        if session and session.alive and session.addr == addr and session.peer_sync_hex == target["public_key"]:
+            session.touch()
+            return session
+        if session:
+            session.close()
+
+        opening = self._opening.get(key)
+        if opening is None:
+            opening = self._opening[key] = self.loop.create_task(
+                PeerSession(self, key, addr, target["public_key"], target.get("ghost_id")).open()
+            )
+            opening.add_done_callback(lambda _: self._opening.pop(key, None))
+        try:
+            session = await asyncio.shield(opening)
+        except Exception:
+            self._drop_path(key, addr)
+            raise
+        self._confirm_path(session.channel.peer_id, addr)
+        self.sessions[key] = session
+        session.touch()
+        return session
+
+    def close_sessions(self):
+        for session in list(self.sessions.values()):
+            session.close()
+
+    # --- SWARM ---
+
+    def swarm_download(self, sha256, name, targets=None):
+        """
+        Thread-safe. Fetches the file with this content hash from every trusted peer
+        that holds it (or from ``targets``, same shape as for sync_files) and saves it
+        as ``name``. Returns a concurrent Future resolving to the download stats.
+        """
+        return self.submit(self._swarm(sha256, name, targets))
+
+    async def _swarm(self, sha256, name, targets=None):
+        started = time.monotonic()
+        name = os.path.basename(name)
+        if targets is None:
+            targets = await self.loop.run_in_executor(self.disk_pool, self._reachable_peers)
+        sessions = await asyncio.gather(*(self.get_session(t) for t in targets), return_exceptions=True)
+        live = [(t.get("alias") or t.get("ghost_id"), s) for t, s in zip(targets, sessions) if isinstance(s, PeerSession)]
+
+        replies = await asyncio.gather(*(self._ask_who_has(s, sha256) for _, s in live))
+        holders, info = [], None
+        for (alias, session), reply in zip(live, replies):
+            if not reply or not reply.get("have"): continue
+            offered = {"size": reply.get("size"), "pieces": reply.get("pieces")}
+            if not isinstance(offered["size"], int) or not isinstance(offered["pieces"], list): continue
+            if len(offered["pieces"]) != piece_layout(offered["size"])[1]: continue
+            info = info or offered
+            if offered == info:
+                holders.append((alias, session))
+        if not holders:
+            raise FileNotFoundError(f"No live peer has {name}")
+
+        download = SwarmDownload(self, sha256, name, info)
+        self._downloads[download.did] = download
+        try:
+            await download.run(holders)
+        finally:
+            del self._downloads[download.did]
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(f"[SUCCESS] Swarmed {name} from {len(download.served)} peer(s)")
+        return {"name": name, "bytes": download.size, "seconds": elapsed, "throughput": download.size / elapsed,
+                "sources": download.served, "bad_pieces": download.bad_pieces}
+
+    def _reachable_peers(self):
+        """Trusted peers we already have a LAN or punched path to (disk pool)."""
+        targets = []
+        for alias, peer in self.peer_source().items():
+            if not isinstance(peer, dict) or not peer.get("ghost_id") or not peer.get("public_key"): continue
+            gid = peer["ghost_id"]
+            if gid in self.punched_paths or self.registry.best_address(gid):
+                targets.append({"alias": alias, "ghost_id": gid, "public_key": peer["public_key"]})
+        return targets
+
+    async def _ask_who_has(self, session, sha256):
+        qid = os.urandom(8).hex()
+        frame = pack_frame(FRAME_WHO_HAS, {"qid": qid, "sha256": sha256})
+        return await self._await_ack(qid, frame, session.addr, session.channel)
+
+    async def _on_who_has(self, channel, header, addr):
+        found = await self.loop.run_in_executor(self.disk_pool, self._find_shared, channel.peer_id, header.get("sha256"))
+        reply = {"tid": header.get("qid"), "done": True, "have": bool(found)}
+        if found:
+            reply.update(size=found[1]["size"], pieces=found[1]["pieces"])
+        self._send_sealed(channel, pack_frame(FRAME_ACK, reply), addr)
+
+    async def _serve_get(self, channel, header, addr):
+        """Streams the requested chunks of a shared file back to the requester."""
+        seqs = header.get("seqs")
+        if not isinstance(seqs, list): return
+        async with self._upload_slots:
+            found = await self.loop.run_in_executor(self.disk_pool, self._find_shared, channel.peer_id, header.get("sha256"))
+            if not found: return
+            path, info = found
+            if len(seqs) > piece_layout(info["size"])[0]: return      # a GET asks for one piece at most
+            total = max(1, -(-info["size"] // CHUNK_SIZE))
+            seqs = [seq for seq in seqs if isinstance(seq, int) and 0 <= seq < total]
+            for start in range(0, len(seqs), SEND_BURST):
+                chunks = await self.loop.run_in_executor(self.disk_pool, _read_chunks, path, seqs[start:start + SEND_BURST])
+                frames = await self.loop.run_in_executor(self.crypto_pool, _pack_pieces, channel.codec, header.get("did"), chunks)
+                for frame in frames:
+                    self._send_sealed(channel, frame, addr, PRIORITY_BULK, channel.bucket)
+                await self.sender.room(PRIORITY_BULK)
+
+    def _find_shared(self, peer_id, sha256):
+        """(path, description) of a project shared with this peer whose content hash matches (disk pool)."""
+        peer = self._trusted_peer(peer_id)
+        if not peer or not isinstance(sha256, str): return None
+        shared = (peer.get("permissions") or {}).get("projects") or []
+        for entry in shared:
+            name = os.path.basename(str(entry))
+            for candidate in (name, name + ".enc"):
+                path = self._project_path(candidate)
+                info = self._describe(path)
+                if info and info["sha256"] == sha256:
+                    return path, info
+        return None
+
+    def _describe(self, path):
+        """describe_file, cached until the file's size or mtime changes."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        cached = self._file_index.get(path)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        info = describe_file(path)
+        self._file_index[path] = ((stat.st_mtime_ns, stat.st_size), info)
+        return info
+
+    # --- CATALOG ---
+
+    def fetch_catalog(self, target):
+        """
+        Thread-safe. Pulls the changes in a peer's catalog since the last exchange and
+        returns a concurrent Future resolving to SyncCatalog.status for that peer.
+        """
+        return self.submit(self._fetch_catalog(target))
+
+    async def _fetch_catalog(self, target):
+        if self.catalog is None:
+            raise RuntimeError("No catalog attached to this node")
+        session = await self.get_session(target)
+        peer_id = session.channel.peer_id
+        while True:
+            since, scope = self.catalog.cursor(peer_id)
+            qid = os.urandom(8).hex()
+            frame = pack_frame(FRAME_CATALOG, {"qid": qid, "since": since, "scope": scope})
+            page = await self._await_ack(qid, frame, session.addr, session.channel)
+            if page is None:
+                raise TimeoutError(f"{target.get('alias') or peer_id[:12]} did not send its catalog")
+            self.catalog.apply_remote(peer_id, page)
+            if not page.get("more"): break
+        await self.loop.run_in_executor(self.disk_pool, self._refresh_catalog, True)
+        return self.catalog.status(peer_id)
+
+    async def _on_catalog_request(self, channel, header, addr):
+        reply = {"tid": header.get("qid"), "done": True}
+        if self.catalog is None:
+            reply.update(changes=[], next=0, more=False, scope=None, reset=False)
+        else:
+            peer = await self.loop.run_in_executor(self.disk_pool, self._refresh_catalog, False, channel.peer_id)
+            try:
+                since = int(header.get("since") or 0)
+            except (TypeError, ValueError):
+                since = 0
+            reply.update(self.catalog.changes_since(since, (peer or {}).get("permissions"), header.get("scope")))
+        self._send_sealed(channel, pack_frame(FRAME_ACK, reply), addr)
+
+    def _refresh_catalog(self, save=False, peer_id=None):
+        """Disk pool: rescans (rate limited inside the catalog) and returns the peer record if asked."""
+        self.catalog.refresh()
+        if save:
+            self.catalog.save()
+        return self._trusted_peer(peer_id) if peer_id else None
+
+    # --- NAT TRAVERSAL ---
+
+    async def resolve_path(self, target):
+        """
+        Picks the address for a sync target: explicit ip, then live LAN discovery, then
+        an already punched path, and finally a matchmaker rendezvous.
+        """
+        if target.get("ip"):
+            return target["ip"], target.get("port", GHOST_PORT)
+        ghost_id = target.get("ghost_id")
+        address = self.registry.best_address(ghost_id) if ghost_id else None
+        if address:
+            return address
+        if ghost_id in self.punched_paths:
+            return self.punched_paths[ghost_id]
+        if MATCHMAKER and target.get("public_key"):
+            return await self.rendezvous(target["public_key"], ghost_id)
+        return None
+
+    async def rendezvous(self, peer_sync_hex, peer_ghost_id=None, matchmaker=None):
+        """
+        Internet path setup through the matchmaker:
+        1. register our sync socket under the shared room id until the partner shows up
+        2. punch simultaneously towards its mapped address until a punch comes back
+        3. hand the address to the handshake; once that succeeds it's kept alive and
+           reused for every later transfer (see _confirm_path)
+        """
+        host, _, port = (matchmaker or MATCHMAKER).partition(":")
+        server = (host, int(port) if port else MATCH_PORT)
+        room_id = generate_shared_room_id(self.sync_pub_hex, peer_sync_hex)
+
+        answer = await self._await_control(
+            self._rendezvous_waiters, room_id, self._registration(room_id, peer_ghost_id),
+            server, RENDEZVOUS_INTERVAL, int(RENDEZVOUS_TIMEOUT / RENDEZVOUS_INTERVAL)
+        )
+        if not answer:
+            return None
+        mapped, partner_id = answer
+        return await self._open_path(room_id, mapped, peer_ghost_id or partner_id)
+
+    def _registration(self, room_id, peer_ghost_id=None):
+        """Register frame for a room. The nonce stays fixed per room so late answers still match."""
+        nonce, expected = self._registrations.get(room_id, (None, None))
+        if nonce is None:
+            nonce = os.urandom(8).hex()
+        self._registrations[room_id] = (nonce, peer_ghost_id or expected)
+        return pack_frame(FRAME_RENDEZVOUS, {"op": "register", "room_id": room_id, "ghost_id": self.ghost_id,
+                                             "nonce": nonce})
+
+    def _open_path(self, room_id, mapped, peer_ghost_id):
+        """Starts the punch for a room, or joins the one already running (both sides may trigger it)."""
+        task = self._path_tasks.get(room_id)
+        if task is None:
+            task = self._path_tasks[room_id] = self.loop.create_task(self._punch_path(room_id, mapped, peer_ghost_id))
+            task.add_done_callback(lambda _: self._path_tasks.pop(room_id, None))
+        return task
+
+    async def _punch_path(self, room_id, mapped, peer_ghost_id):
+        path = await self._await_control(
+            self._punch_waiters, room_id,
+            pack_frame(FRAME_PUNCH, {"from": self.ghost_id, "room": room_id, "ack": False}),
+            mapped, PUNCH_INTERVAL, PUNCH_ATTEMPTS
+        )
+        if not path:
+            print(f"[NAT] Punch to {mapped[0]}:{mapped[1]} failed")
+            return None
+        if peer_ghost_id:
+            self._candidates[peer_ghost_id] = path
+        return path
+
+    def _confirm_path(self, ghost_id, addr):
+        """A signed handshake just went over ``addr``: if it's a path we punched, keep it alive."""
+        if not ghost_id or self._candidates.get(ghost_id) != addr: return
+        del self._candidates[ghost_id]
+        self.punched_paths[ghost_id] = addr
+        if ghost_id not in self._keepalives:
+            self._keepalives[ghost_id] = self.loop.create_task(self._keepalive(ghost_id))
+        print(f"[NAT] Path open to {addr[0]}:{addr[1]}")
+
+    def _drop_path(self, key, addr):
+        """Forgets a punched path that stopped working, so the next sync finds a fresh one."""
+        if self._candidates.get(key) == addr:
+            del self._candidates[key]
+        if self.punched_paths.get(key) != addr: return
+        del self.punched_paths[key]
+        task = self._keepalives.pop(key, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+        print(f"[NAT] Path to {addr[0]}:{addr[1]} expired")
+
+    def _on_rendezvous(self, header):
+        if header.get("op") != "peer": return
+        room_id, peer_id = header.get("room_id"), header.get("ghost_id")
+        nonce, expected = self._registrations.get(room_id, (None, None))
+        # Anyone can send us a datagram; only answers to our own registrations count
+        if nonce is None or header.get("nonce") != nonce: return
+        if expected and peer_id != expected: return
+        try:
+            mapped = (str(header["ip"]), int(header["port"]))
+        except (KeyError, TypeError, ValueError):
+            return
+        waiter = self._rendezvous_waiters.get(room_id)
+        if waiter and not waiter.done():
+            waiter.set_result((mapped, peer_id))
+        elif peer_id not in self.punched_paths:
+            # The partner is dialling us: punch back so its packets get through our NAT
+            self._open_path(room_id, mapped, peer_id)
+
+    async def _advertise_rooms(self):
+        """Keeps a registration alive under the shared room of every trusted peer."""
+        host, _, port = MATCHMAKER.partition(":")
+        server = (host, int(port) if port else MATCH_PORT)
+        while self.running:
+            peers = await self.loop.run_in_executor(self.disk_pool, self.peer_source)
+            for peer in peers.values():
+                if not isinstance(peer, dict) or not peer.get("public_key"): continue
+                if peer.get("ghost_id") in self.punched_paths: continue
+                try:
+                    room_id = generate_shared_room_id(self.sync_pub_hex, peer["public_key"])
+                except ValueError:
+                    continue
+                self._send_frame(self._registration(room_id, peer.get("ghost_id")), server)
+            await asyncio.sleep(ADVERTISE_INTERVAL)
+
+    async def _await_control(self, waiters, key, frame, addr, interval, attempts):
+        """Re-sends ``frame`` every ``interval`` until ``waiters[key]`` resolves."""
+        waiter = waiters[key] = self.loop.create_future()
+        try:
+            for _ in range(attempts):
+                self._send_frame(frame, addr)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(waiter), interval)
+                except asyncio.TimeoutError:
+                    continue
+            return None
+        finally:
+            waiters.pop(key, None)
+
+    async def _keepalive(self, key):
+        """Pings a punched path to hold the NAT mapping open, and drops the path once it goes quiet."""
+        misses = 0
+        while self.running and key in self.punched_paths:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+            addr = self.punched_paths.get(key)
+            if addr is None: break
+            nonce = os.urandom(6).hex()
+            pong = await self._await_ack(nonce, pack_frame(FRAME_PING, {"from": self.ghost_id, "nonce": nonce}), addr)
+            misses = 0 if pong else misses + 1
+            if misses >= KEEPALIVE_MISSES:
+                self._drop_path(key, addr)
+                break
+        if self._keepalives.get(key) is asyncio.current_task():
+            del self._keepalives[key]
+
+    # --- DISCOVERY ---
+
+    async def start_broadcast(self):
+        try:
+            transport, _ = await self.loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol, local_addr=('0.0.0.0', 0), allow_broadcast=True
+            )
+        except Exception as e:
+            print(f"Broadcast error: {e}")
+            return
+        self._endpoints.append(transport)
+        self._broadcast_transport = transport
         while self.running:
-            try: broadcast_sock.sendto(message, ('<broadcast>', 5556))
+            try:
+                announcement = self._announcement()
+                transport.sendto(announcement, ('<broadcast>', DISCOVERY_PORT))
+                self.sender.charge(len(announcement))
             except: pass
-            time.sleep(10)
+            await asyncio.sleep(self.registry.next_announce_interval())
 
-    def listen_for_peers(self):
+    def _announcement(self):
+        return f"GHOST_DISCOVERY:{self.ghost_id}:{self.port}".encode()
+
+    async def listen_for_peers(self):
+        # Several nodes on one machine (or a restart) may share the discovery port
         listen_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        listen_sock.bind(('', 5556))
-        while self.running:
-            data, addr = listen_sock.recvfrom(1024)
+        listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            try: listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            except OSError: pass
+        try:
+            listen_sock.bind(('', DISCOVERY_PORT))
+            transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: _DiscoveryProtocol(self), sock=listen_sock
+            )
+            self._endpoints.append(transport)
+        except Exception as e:
+            listen_sock.close()
+            print(f"Discovery error: {e}")
+
+    def _handle_discovery(self, data, addr):
+        try:
             msg = data.decode()
-            if msg.startswith("GHOST_DISCOVERY:"):
-                peer_id = msg.split(":")[1]
-                self.discovered_peers[peer_id] = addr[0]
\ No newline at end of file
+        except UnicodeDecodeError:
+            return
+        if not msg.startswith("GHOST_DISCOVERY:"): return
+
+        # GHOST_DISCOVERY:<ghost_id>[:<sync port>] (older nodes omit the port)
+        parts = msg.split(":")
+        peer_id = parts[1]
+        try:
+            port = int(parts[2]) if len(parts) > 2 else GHOST_PORT
+        except ValueError:
+            return
+        if peer_id == self.ghost_id and port == self.port: return
+
+        if self.registry.observe(peer_id, addr[0], port):
+            # New face: measure it now and answer directly so it learns about us too
+            self._ping(peer_id, addr[0], port)
+            if self._broadcast_transport:
+                self._broadcast_transport.sendto(self._announcement(), (addr[0], DISCOVERY_PORT))
+
+    def _ping(self, ghost_id, ip, port):
+        nonce = os.urandom(6).hex()
+        self.registry.ping_sent(nonce, ghost_id, ip, port)
+        self._send_frame(pack_frame(FRAME_PING, {"from": self.ghost_id, "nonce": nonce}), (ip, port))
+
+    async def _check_liveness(self):
+        """Pings every known address and evicts the ones that stopped answering."""
+        while self.running:
+            await asyncio.sleep(PING_INTERVAL)
+            for ghost_id, key in self.registry.evict_stale():
+                print(f"[DISCOVERY] Lost {ghost_id[:12]} at {key[0]}:{key[1]}")
+            for ghost_id, ip, port in self.registry.live_addresses():
+                self._ping(ghost_id, ip, port)
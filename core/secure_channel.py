@@ -0,0 +1,213 @@
+# secure_channel.py
+
+import hashlib
+import threading
+import time
+from cryptography.exceptions import InvalidSignature, InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, x25519
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+# Noise-style handshake: both sides send an ephemeral X25519 key signed with their
+# Ed25519 identity (the ghost_id). Session keys come from HKDF over the ephemeral
+# DH mixed with the static sync-key DH, salted with the transcript hash.
+PROTOCOL_LABEL = b"GhostDrive-Handshake-v1"
+
+# Data frames: ChaCha20-Poly1305 with the frame counter as nonce. Keys are ratcheted
+# forward into a new epoch after REKEY_AFTER_FRAMES frames or REKEY_AFTER_SECONDS.
+REPLAY_WINDOW = 1024
+REKEY_AFTER_FRAMES = 1 << 20
+REKEY_AFTER_SECONDS = 900
+REKEY_GRACE = 30            # seconds the retired receive epoch still opens stragglers
+MAX_EPOCH_SKIP = 4          # rotations a receiver can catch up on at once (earlier frames lost)
+MAX_COUNTER = (1 << 64) - 1
+
+
+def public_hex(private_key):
+    return private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+    ).hex()
+
+
+def new_ephemeral():
+    """Returns a fresh X25519 key and its public hex."""
+    key = x25519.X25519PrivateKey.generate()
+    return key, public_hex(key)
+
+
+def transcript_hash(*fields):
+    """Length-prefixed hash of the handshake fields, so no two transcripts collide."""
+    hasher = hashlib.sha256(PROTOCOL_LABEL)
+    for field in fields:
+        data = field.encode() if isinstance(field, str) else field
+        hasher.update(len(data).to_bytes(4, "big"))
+        hasher.update(data)
+    return hasher.digest()
+
+
+def sign(identity_priv, digest):
+    return identity_priv.sign(digest).hex()
+
+
+def verify(ghost_id, signature_hex, digest):
+    """Checks a signature against the ghost_id (the hex Ed25519 identity key)."""
+    try:
+        key = ed25519.Ed25519PublicKey.from_public_bytes(bytes.fromhex(ghost_id))
+        key.verify(bytes.fromhex(signature_hex), digest)
+        return True
+    except (InvalidSignature, ValueError, TypeError):
+        return False
+
+
+def ephemeral_secret(eph_priv, peer_eph_hex):
+    return eph_priv.exchange(x25519.X25519PublicKey.from_public_bytes(bytes.fromhex(peer_eph_hex)))
+
+
+def derive_session_keys(transcript, eph_secret, static_secret):
+    """Returns (initiator -> responder key, responder -> initiator key)."""
+    okm = HKDF(algorithm=hashes.SHA256(), length=64, salt=transcript, info=PROTOCOL_LABEL + b" keys").derive(
+        eph_secret + static_secret
+    )
+    return okm[:32], okm[32:]
+
+
+def _next_key(key):
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=PROTOCOL_LABEL + b" rekey").derive(key)
+
+
+def _nonce(counter):
+    return bytes(4) + counter.to_bytes(8, "big")
+
+
+class ReplayWindow:
+    """Sliding bitmap over the newest REPLAY_WINDOW counters. Checks and updates are O(1)."""
+
+    def __init__(self, size=REPLAY_WINDOW):
+        self.size = size
+        self.mask = (1 << size) - 1
+        self.top = -1
+        self.bits = 0
+
+    def seen(self, counter):
+        """True for counters already accepted or too old to tell."""
+        if counter > self.top:
+            return False
+        offset = self.top - counter
+        return offset >= self.size or bool((self.bits >> offset) & 1)
+
+    def accept(self, counter):
+        if self.seen(counter):
+            return False
+        if counter > self.top:
+            shift = counter - self.top
+            self.bits = ((self.bits << shift) | 1) & self.mask if shift < self.size else 1
+            self.top = counter
+        else:
+            self.bits |= 1 << (self.top - counter)
+        return True
+
+
+class _KeyState:
+    """One direction of one epoch: key, cipher, counter and replay window."""
+
+    def __init__(self, key, epoch=0):
+        self.key = key
+        self.epoch = epoch
+        self.aead = ChaCha20Poly1305(key)
+        self.counter = 0
+        self.window = ReplayWindow()
+        self.started = time.monotonic()
+
+    def next(self):
+        return _KeyState(_next_key(self.key), self.epoch + 1)
+
+    def expired(self):
+        return self.counter >= REKEY_AFTER_FRAMES or time.monotonic() - self.started > REKEY_AFTER_SECONDS
+
+
+class SecureChannel:
+    """
+    Per-session AEAD state for one peer. Frames are opened in the crypto pool and
+    sealed on the network loop as they leave the shaper, so counters and windows
+    sit behind a lock; the AEAD work doesn't.
+    """
+
+    def __init__(self, sid, peer_id, send_key, recv_key):
+        self.sid = sid
+        self.peer_id = peer_id
+        self.last_seen = time.monotonic()
+        self.rejected = 0
+        self.hello_reply = None     # responder side: the handshake answer, re-sent for duplicate HELLOs
+        self.codec = None           # set by the network layer: negotiated compression
+        self.bucket = None          # and the peer's advertised download cap, for traffic we originate
+        self._send = _KeyState(send_key)
+        self._recv = _KeyState(recv_key)
+        self._previous = None       # last receive epoch, for frames still in flight across a rekey
+        self._retired = 0.0         # when it was retired
+        self._upcoming = {}         # derived but not yet used receive epochs
+        self._lock = threading.Lock()
+
+    @property
+    def epochs(self):
+        return self._send.epoch, self._recv.epoch
+
+    def _aad(self, epoch):
+        return f"{self.sid}:{epoch}".encode()
+
+    def seal(self, plaintext):
+        """Returns (epoch, counter, ciphertext), rotating the send key when it's due."""
+        with self._lock:
+            if self._send.expired():
+                self._send = self._send.next()
+            state = self._send
+            counter = state.counter
+            state.counter += 1
+        return state.epoch, counter, state.aead.encrypt(_nonce(counter), plaintext, self._aad(state.epoch))
+
+    def open(self, epoch, counter, ciphertext):
+        """Authenticates one frame. Returns None for forgeries, replays and unknown epochs."""
+        if not 0 <= counter <= MAX_COUNTER:
+            return None
+        with self._lock:
+            state = self._receive_state(epoch)
+            if state is None or state.window.seen(counter):
+                self.rejected += 1
+                return None
+        try:
+            plaintext = state.aead.decrypt(_nonce(counter), ciphertext, self._aad(epoch))
+        except InvalidTag:
+            with self._lock:
+                self.rejected += 1
+            return None
+        with self._lock:
+            # Re-checked under the lock: two rx workers may have raced on the same counter
+            if not state.window.accept(counter):
+                self.rejected += 1
+                return None
+            if state.epoch > self._recv.epoch:
+                # The peer rotated; keep the old epoch around for its stragglers
+                self._previous, self._recv = self._recv, state
+                self._retired = time.monotonic()
+                self._upcoming = {e: s for e, s in self._upcoming.items() if e > state.epoch}
+            self.last_seen = time.monotonic()
+        return plaintext
+
+    def _receive_state(self, epoch):
+        if epoch == self._recv.epoch:
+            return self._recv
+        if self._previous and epoch == self._previous.epoch:
+            if time.monotonic() - self._retired <= REKEY_GRACE:
+                return self._previous
+            self._previous = None
+            return None
+        if 0 < epoch - self._recv.epoch <= MAX_EPOCH_SKIP:
+            state = self._upcoming.get(epoch)
+            if state is None:
+                # Ratchet forward; the steps in between stay cached for their own frames
+                state = self._recv
+                while state.epoch < epoch:
+                    state = self._upcoming.get(state.epoch + 1) or state.next()
+                    self._upcoming[state.epoch] = state
+            return state
+        return None
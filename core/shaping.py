@@ -0,0 +1,136 @@
+# shaping.py
+
+import asyncio
+import time
+from collections import deque
+
+# Send classes, drained strictly in this order
+PRIORITY_CONTROL = 0    # handshakes, FIN / ACK, pings, punches, rendezvous
+PRIORITY_SMALL = 1      # bundles and small files
+PRIORITY_BULK = 2       # big file streams
+PRIORITY_CLASSES = (PRIORITY_CONTROL, PRIORITY_SMALL, PRIORITY_BULK)
+
+BURST_SECONDS = 0.25    # bucket depth, as seconds of traffic at the capped rate
+MIN_BURST = 64 * 1024   # never shallower than a handful of datagrams
+QUEUE_LIMIT = 256       # frames per class before data senders are made to wait
+
+
+class TokenBucket:
+    """
+    Byte-rate limiter. A rate of None or 0 means unlimited. Frames bigger than the
+    bucket are allowed once it's full and simply leave it in debt.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate or None
+        self.capacity = burst or max(int((rate or 0) * BURST_SECONDS), MIN_BURST)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, size):
+        """Seconds until ``size`` bytes may go out (0.0 = now). Doesn't consume."""
+        if not self.rate: return 0.0
+        self._refill()
+        return max(0.0, (min(size, self.capacity) - self.tokens) / self.rate)
+
+    def consume(self, size):
+        if self.rate:
+            self.tokens -= size
+
+
+class PrioritySender:
+    """
+    Send path shared by everything on the sync socket. Frames go straight out while
+    nothing is queued and the buckets allow it; otherwise they wait in their class
+    queue and the pump drains the highest class first. ``bucket`` is an optional
+    second limiter, e.g. the rate a receiver asked for in its handshake, and ``seal``
+    an optional callable applied to the frame as it leaves, so per-channel counters
+    follow the order frames really go out in rather than the order they were queued.
+    """
+
+    def __init__(self, transmit, upload_limit=None):
+        self.transmit = transmit
+        self.upload = TokenBucket(upload_limit)
+        self.queues = [deque() for _ in PRIORITY_CLASSES]
+        self.sent_bytes = [0 for _ in PRIORITY_CLASSES]
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+
+    def set_upload_limit(self, rate):
+        self.upload = TokenBucket(rate)
+        self._wakeup.set()
+
+    def send(self, frame, addr, priority=PRIORITY_CONTROL, bucket=None, seal=None):
+        if not any(self.queues) and self._wait_time(len(frame), bucket) == 0.0:
+            self._transmit(frame, addr, priority, bucket, seal)
+            return
+        self.queues[priority].append((frame, addr, bucket, seal))
+        self._wakeup.set()
+
+    def marker(self, priority):
+        """Future that resolves once everything queued so far in ``priority`` has gone out."""
+        done = asyncio.get_running_loop().create_future()
+        if self.queues[priority]:
+            self.queues[priority].append((None, done, None, None))
+        else:
+            done.set_result(True)
+        return done
+
+    def charge(self, size):
+        """Accounts for traffic sent outside the queue (discovery broadcasts)."""
+        self.upload.consume(size)
+
+    async def room(self, priority):
+        """Waits until the class queue has space, so data senders don't buffer whole files."""
+        while len(self.queues[priority]) > QUEUE_LIMIT:
+            self._drained.clear()
+            await self._drained.wait()
+
+    def backlog(self):
+        return [sum(1 for frame, *_ in q if frame is not None) for q in self.queues]
+
+    async def pump(self):
+        while True:
+            priority = next((p for p in PRIORITY_CLASSES if self.queues[p]), None)
+            if priority is None:
+                self._drained.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            queue = self.queues[priority]
+            frame, addr, bucket, seal = queue[0]
+            if frame is None:
+                queue.popleft()
+                if not addr.done(): addr.set_result(True)
+                continue
+            delay = self._wait_time(len(frame), bucket)
+            if delay > 0:
+                # Re-pick afterwards: a higher class may have arrived meanwhile
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            queue.popleft()
+            self._transmit(frame, addr, priority, bucket, seal)
+            if len(queue) <= QUEUE_LIMIT // 2:
+                self._drained.set()
+
+    def _wait_time(self, size, bucket):
+        delay = self.upload.wait_time(size)
+        return max(delay, bucket.wait_time(size)) if bucket else delay
+
+    def _transmit(self, frame, addr, priority, bucket, seal=None):
+        if seal:
+            frame = seal(frame)
+        self.upload.consume(len(frame))
+        if bucket:
+            bucket.consume(len(frame))
+        self.sent_bytes[priority] += len(frame)
+        self.transmit(frame, addr)
@@ -0,0 +1,100 @@
+# staging.py
+
+import hashlib
+import os
+import time
+
+STAGING_SUFFIX = ".part"
+STALE_STAGING_AGE = 24 * 3600   # leftovers from a crash, swept on start
+
+
+def fsync_dir(path):
+    """Makes a rename durable. Not every platform can open a directory, so it's best effort."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class StagedFile:
+    """
+    One incoming file written sequentially into a staging folder, hashed as it goes,
+    and only moved over the live file (os.replace) once it's complete, fsynced and
+    verified. All methods do blocking I/O and belong in the disk pool.
+    """
+
+    def __init__(self, staging_dir, name):
+        os.makedirs(staging_dir, exist_ok=True)
+        self.path = os.path.join(staging_dir, name + STAGING_SUFFIX)
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = open(self.path, "wb")
+
+    def write(self, data):
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def finish(self, expected_sha256=None):
+        """Flushes to disk. Returns False (and discards the file) when the hash doesn't match."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if expected_sha256 and self._hash.hexdigest() != expected_sha256:
+            self.discard()
+            return False
+        return True
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def commit(self, final_path, sync_dir=True):
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(self.path, final_path)
+        if sync_dir:
+            fsync_dir(os.path.dirname(final_path))
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def atomic_write(final_path, data, staging_dir, sync_dir=True):
+    """
+    Whole-buffer variant of StagedFile for small files (bundle members). Callers
+    writing many files into one folder can pass sync_dir=False and fsync it once.
+    """
+    name = f"{os.path.basename(final_path)}.{os.urandom(4).hex()}"
+    staged = StagedFile(staging_dir, name)
+    try:
+        staged.write(data)
+        staged.finish()
+        staged.commit(final_path, sync_dir)
+    except Exception:
+        staged.discard()
+        raise
+
+
+def sweep_staging(staging_dir, max_age=STALE_STAGING_AGE):
+    """Removes partial files a crashed or killed receiver left behind."""
+    if not os.path.isdir(staging_dir): return 0
+    cutoff, removed = time.time() - max_age, 0
+    for entry in os.scandir(staging_dir):
+        if entry.name.endswith(STAGING_SUFFIX) and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
@@ -0,0 +1,267 @@
+# sync_catalog.py
+
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from core.paths import EVERYTHING_ELSE
+
+# What a node can share: projects/<user>/* and the inventory sheets in inventory/<user>/
+SHARED_FOLDERS = ("projects", "inventory")
+INVENTORY_EXTENSIONS = (".enc", ".csv", ".json")
+
+RESCAN_INTERVAL = 5         # seconds; peers asking in a burst share one folder scan
+CATALOG_PAGE = 32           # entries per catalog datagram
+
+# How a file compares against a peer's catalog
+IN_SYNC = "in_sync"
+LOCAL_NEWER = "local_newer"
+PEER_NEWER = "peer_newer"
+CONFLICT = "conflict"
+LOCAL_ONLY = "local_only"
+PEER_ONLY = "peer_only"
+
+
+def catalog_path(username):
+    return os.path.join(EVERYTHING_ELSE, "inventory", f"sync_catalog_{username}.enc")
+
+
+def clock_compare(a, b):
+    """Vector clocks: 'equal', 'before' (a happened before b), 'after' or 'concurrent'."""
+    a_ahead = any(n > b.get(k, 0) for k, n in a.items())
+    b_ahead = any(n > a.get(k, 0) for k, n in b.items())
+    if a_ahead and b_ahead: return "concurrent"
+    if a_ahead: return "after"
+    if b_ahead: return "before"
+    return "equal"
+
+
+def clock_merge(a, b):
+    return {k: max(a.get(k, 0), b.get(k, 0)) for k in set(a) | set(b)}
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _shared_ids(permissions):
+    """File ids a peer's permissions cover. Entries may name projects with or without '.enc'."""
+    permissions = permissions or {}
+    allowed = set()
+    for folder in SHARED_FOLDERS:
+        for name in permissions.get(folder) or []:
+            name = os.path.basename(str(name))
+            allowed.add(f"{folder}/{name}")
+            if folder == "projects" and not name.endswith(".enc"):
+                allowed.add(f"{folder}/{name.replace(' ', '_')}.enc")
+    return allowed
+
+
+class SyncCatalog:
+    """
+    Versioned catalog of the files this node shares, plus what it last heard of each
+    peer's. Every local change gets the next catalog version and a vector-clock tick,
+    so a peer holding version N only needs the entries after it: changes_since walks
+    a version-ordered log instead of the whole folder. Thread-safe; the folder scan
+    and persistence do blocking I/O and belong in the disk pool.
+    """
+
+    def __init__(self, username, node_id, fernet=None, path=None, root=EVERYTHING_ELSE):
+        self.username = username
+        self.node_id = node_id
+        self.fernet = fernet
+        self.path = path or catalog_path(username)
+        self.root = root
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._scanned = 0.0
+
+        state = self._load()
+        self.catalog_id = state.get("catalog_id") or os.urandom(8).hex()
+        self.version = state.get("version", 0)
+        self.entries = state.get("entries", {})
+        self.remote = state.get("remote", {})
+        self._log = sorted((e["version"], fid) for fid, e in self.entries.items())
+        self._versions = [v for v, _ in self._log]
+
+    # --- PERSISTENCE ---
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            return json.loads(self.fernet.decrypt(raw) if self.fernet else raw)
+        except Exception:
+            print("[CATALOG] Unreadable catalog, starting a new one")
+            return {}
+
+    def save(self):
+        with self._lock:
+            state = {"catalog_id": self.catalog_id, "version": self.version,
+                     "entries": self.entries, "remote": self.remote}
+            raw = json.dumps(state, separators=(",", ":")).encode()
+        if self.fernet:
+            raw = self.fernet.encrypt(raw)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(raw)
+        os.replace(tmp_path, self.path)
+
+    # --- LOCAL CHANGES ---
+
+    def refresh(self, force=False):
+        """Rescans the shared folders, hashing only files whose size or mtime moved. Returns the change count."""
+        with self._scan_lock:
+            if not force and time.monotonic() - self._scanned < RESCAN_INTERVAL:
+                return 0
+            changed, seen = 0, set()
+            for folder in SHARED_FOLDERS:
+                base = os.path.join(self.root, folder, self.username)
+                if not os.path.isdir(base): continue
+                for dirent in os.scandir(base):
+                    if not dirent.is_file() or dirent.name.startswith("."): continue
+                    if folder == "inventory" and not dirent.name.endswith(INVENTORY_EXTENSIONS): continue
+                    file_id = f"{folder}/{dirent.name}"
+                    seen.add(file_id)
+                    changed += self._observe(file_id, dirent)
+            for file_id, entry in list(self.entries.items()):
+                if file_id not in seen and not entry["deleted"]:
+                    self._record(file_id, None, 0, 0, 0)
+                    changed += 1
+            self._scanned = time.monotonic()
+        if changed:
+            self.save()
+        return changed
+
+    def _observe(self, file_id, dirent):
+        stat = dirent.stat()
+        entry = self.entries.get(file_id)
+        if entry and not entry["deleted"] and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return 0
+        sha256 = _hash_file(dirent.path)
+        if entry and not entry["deleted"] and entry["sha256"] == sha256:
+            with self._lock:
+                entry["mtime_ns"] = stat.st_mtime_ns    # touched, not changed
+            return 0
+        self._record(file_id, sha256, stat.st_size, stat.st_mtime, stat.st_mtime_ns)
+        return 1
+
+    def _record(self, file_id, sha256, size, mtime, mtime_ns):
+        with self._lock:
+            entry = self.entries.get(file_id)
+            clock = dict(entry["clock"]) if entry else {}
+            # Content that arrived from a peer carries the peer's history, not a new local edit
+            origin = next((r["entries"][file_id]["clock"] for r in self.remote.values()
+                           if sha256 and r["entries"].get(file_id, {}).get("sha256") == sha256), None)
+            if origin:
+                clock = clock_merge(clock, origin)
+            else:
+                clock[self.node_id] = clock.get(self.node_id, 0) + 1
+            self.version += 1
+            self.entries[file_id] = {
+                "id": file_id, "sha256": sha256, "size": size, "mtime": mtime, "mtime_ns": mtime_ns,
+                "clock": clock, "version": self.version, "deleted": sha256 is None,
+            }
+            self._log.append((self.version, file_id))
+            self._versions.append(self.version)
+            if len(self._log) > 2 * len(self.entries) + 64:
+                self._log = sorted((e["version"], fid) for fid, e in self.entries.items())
+                self._versions = [v for v, _ in self._log]
+
+    # --- CHANGE FEED ---
+
+    def scope(self, permissions):
+        """Identifies what a peer is allowed to see; a changed scope means its cursor is void."""
+        shared = ",".join(sorted(_shared_ids(permissions)))
+        return hashlib.sha256(f"{self.catalog_id}|{shared}".encode()).hexdigest()[:16]
+
+    def changes_since(self, since, permissions, scope=None, limit=CATALOG_PAGE):
+        """
+        One page of entries a peer may see with a version above ``since``. A peer whose
+        scope doesn't match (new catalog or changed permissions) is reset to version 0.
+        """
+        allowed = _shared_ids(permissions)
+        with self._lock:
+            current = self.scope(permissions)
+            reset = scope != current
+            since = 0 if reset else max(0, int(since))
+            changes, cursor = [], since
+            for version, file_id in self._log[bisect.bisect_right(self._versions, since):]:
+                if len(changes) >= limit: break
+                cursor = version
+                entry = self.entries.get(file_id)
+                if entry is None or entry["version"] != version or file_id not in allowed: continue
+                changes.append({k: v for k, v in entry.items() if k != "mtime_ns"})
+            more = cursor < self.version and len(changes) >= limit
+            return {"changes": changes, "next": cursor if more else self.version, "more": more,
+                    "scope": current, "reset": reset}
+
+    # --- PEER VIEWS ---
+
+    def cursor(self, peer_id):
+        remote = self.remote.get(peer_id) or {}
+        return remote.get("since", 0), remote.get("scope")
+
+    def apply_remote(self, peer_id, page):
+        with self._lock:
+            remote = self.remote.setdefault(peer_id, {"since": 0, "scope": None, "entries": {}})
+            if page.get("reset"):
+                remote["entries"] = {}
+            for entry in page.get("changes") or []:
+                if isinstance(entry, dict) and isinstance(entry.get("id"), str) and isinstance(entry.get("clock"), dict):
+                    remote["entries"][entry["id"]] = entry
+            remote["since"] = int(page.get("next", remote["since"]))
+            remote["scope"] = page.get("scope")
+
+    def status(self, peer_id):
+        """file_id -> IN_SYNC / LOCAL_NEWER / PEER_NEWER / CONFLICT / LOCAL_ONLY / PEER_ONLY."""
+        with self._lock:
+            theirs = (self.remote.get(peer_id) or {}).get("entries", {})
+            result = {}
+            for file_id in set(self.entries) | set(theirs):
+                mine, other = self.entries.get(file_id), theirs.get(file_id)
+                mine_hash = mine["sha256"] if mine else None
+                other_hash = other.get("sha256") if other and not other.get("deleted") else None
+                if mine_hash is None and other_hash is None: continue
+                if mine_hash == other_hash:
+                    result[file_id] = IN_SYNC
+                    continue
+                order = clock_compare(mine["clock"] if mine else {}, other["clock"] if other else {})
+                if order == "after":
+                    result[file_id] = LOCAL_NEWER if other_hash else LOCAL_ONLY
+                elif order == "before":
+                    result[file_id] = PEER_NEWER if mine_hash else PEER_ONLY
+                elif mine_hash and other_hash:
+                    result[file_id] = CONFLICT
+                else:
+                    result[file_id] = LOCAL_ONLY if mine_hash else PEER_ONLY
+            return result
+
+    def pullable(self, peer_id, folder="projects"):
+        """[(file_id, sha256), ...] of the peer's files in ``folder`` that are newer than ours or missing here."""
+        status = self.status(peer_id)
+        with self._lock:
+            theirs = (self.remote.get(peer_id) or {}).get("entries", {})
+            wanted = []
+            for file_id, state in status.items():
+                entry = theirs.get(file_id) or {}
+                if state in (PEER_NEWER, PEER_ONLY) and file_id.startswith(folder + "/") \
+                        and entry.get("sha256") and not entry.get("deleted"):
+                    wanted.append((file_id, entry["sha256"]))
+            return sorted(wanted)
+
+    def holders(self, sha256):
+        """Peers whose last catalog lists live content with this hash, i.e. swarm sources for it."""
+        with self._lock:
+            return sorted(peer_id for peer_id, remote in self.remote.items()
+                          if any(e.get("sha256") == sha256 and not e.get("deleted")
+                                 for e in remote["entries"].values()))
@@ -24,7 +24,7 @@ from PySide6.QtGui import QTextCursor, QTextOption, QFont, QPixmap, QKeyEvent
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Everything_else'))
 from Everything_else.command_checker import check_for_commands
 from Everything_else.jynx_operator_ui import execute_command, get_random_prompt, soul_vent, soul_vent_summon
-from Everything_else.model_registry import load_model_from_config, get_model_config, get_visual_description
+from Everything_else.model_registry import get_model_config, get_visual_description, MODEL_PRELOADER, enable_state_store
 from Everything_else.ai_council import run_council_streaming
 
 # =====================================================================
@@ -69,17 +69,32 @@ class StreamWorker(QObject):
         except Exception as e:
             self.error.emit(str(e))
 
+class ModelLoadSignals(QObject):
+    """Carries preloader results (a Future callback on its worker thread) onto the GUI thread."""
+    ready = Signal(object, object)
+    failed = Signal(str)
+
+    def watch(self, future):
+        future.add_done_callback(self._emit)
+
+    def _emit(self, future):
+        try:
+            self.ready.emit(*future.result())
+        except Exception as e:
+            self.failed.emit(str(e))
+
 class CouncilStreamWorker(QObject):
     token_received = Signal(object)
     finished = Signal()
     error = Signal(str)
 
-    def __init__(self, user_prompt, image_path=None, username="Operator", fernet=None):
+    def __init__(self, user_prompt, image_path=None, username="Operator", fernet=None, use_cache=True):
         super().__init__()
         self.user_prompt = user_prompt
         self.image_path = image_path
         self.username = username 
         self.fernet = fernet 
+        self.use_cache = use_cache
 
     def run(self):
         try:
@@ -87,7 +102,8 @@ class CouncilStreamWorker(QObject):
                 self.user_prompt, 
                 image_path=self.image_path, 
                 username=self.username, 
-                fernet=self.fernet
+                fernet=self.fernet,
+                use_cache=self.use_cache
             ):
                 self.token_received.emit(event)
             self.finished.emit()
@@ -95,6 +111,42 @@ class CouncilStreamWorker(QObject):
             self.error.emit(str(e))
 
 
+class ExpertBlocks:
+    """
+    Where each expert's text goes in the chat display. In parallel mode tokens of
+    earlier experts keep arriving after later ones have started, so every expert
+    keeps a cursor at the end of its own block. Qt moves a cursor along with text
+    inserted at its position, and a new header lands right at the last block's
+    end, so starting a block puts the existing cursors back where they were.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self._ends = {}                    # expert name -> cursor at the end of its text
+
+    def start(self, name, header_html):
+        # Everything goes in at the end, after every block's end, so saved positions stay valid
+        saved = [(cursor, cursor.position()) for cursor in self._ends.values()]
+        self.view.moveCursor(QTextCursor.End)
+        self.view.insertHtml(header_html)
+        for cursor, position in saved:
+            cursor.setPosition(position)
+        end = QTextCursor(self.view.document())
+        end.movePosition(QTextCursor.End)
+        self._ends[name] = end
+
+    def append(self, name, text):
+        end = self._ends.get(name)
+        if end is None:
+            self.view.moveCursor(QTextCursor.End)
+            self.view.insertPlainText(text)
+        else:
+            end.insertText(text)
+
+    def clear(self):
+        self._ends.clear()
+
+
 # =====================================================================
 # Dialog Components (Parent must come before Child)
 # =====================================================================
@@ -211,6 +263,8 @@ class ChatPage(QWidget):
         self.llm = None
         self.current_image_path = None 
         self.model_config = get_model_config("jynx_default")
+        # Evaluated operator preambles survive restarts, encrypted with this user's key
+        enable_state_store(self.username, self.fernet)
 
         # --- ADD THESE LINES ---
         self.max_tokens = self.model_config.get("max_tokens", 2048)
@@ -219,6 +273,10 @@ class ChatPage(QWidget):
         self._active_thread = None
         self._active_worker = None
 
+        self.model_signals = ModelLoadSignals()
+        self.model_signals.ready.connect(self.on_model_ready)
+        self.model_signals.failed.connect(self.on_model_failed)
+
         self.setAcceptDrops(True)
         self.init_ui()
         QTimer.singleShot(500, self.deferred_load)
@@ -384,15 +442,25 @@ class ChatPage(QWidget):
 
         # Reset the summary tracker for the new council session
         self._summary_started = False 
+        self._expert_blocks = ExpertBlocks(self.chat_area)
         
         self.loading_label.setText("REASONING...")
+
+        # The council swaps models through the pool; holding the chat model here would keep
+        # it in RAM after the pool evicts it. restore_default_model brings it back afterwards.
+        self.llm = None
+        self.send_button.setEnabled(False)
         
         self._active_thread = QThread()
-        self._active_worker = CouncilStreamWorker(prompt, image_path, username=self.username, fernet=self.fernet)
+        # Shift+REASON asks the council again instead of replaying a cached answer
+        fresh = bool(QApplication.keyboardModifiers() & Qt.ShiftModifier)
+        self._active_worker = CouncilStreamWorker(prompt, image_path, username=self.username, fernet=self.fernet, use_cache=not fresh)
         self._active_worker.moveToThread(self._active_thread)
         
         self._active_worker.token_received.connect(self._handle_council_event)
         self._active_worker.error.connect(lambda e: self.append_message("SYSTEM", f"ERROR: {e}"))
+        self._active_worker.error.connect(lambda e: self.restore_default_model())
+        self._active_worker.error.connect(self._active_thread.quit)
         
         self._active_worker.finished.connect(self._active_thread.quit)
         self._active_worker.finished.connect(self._active_worker.deleteLater)
@@ -420,13 +488,14 @@ class ChatPage(QWidget):
             self._summary_started = False 
             expert_name = str(event[1]).upper()
             # Use COLOR_FG (Off-White) to make Expert names pop against the Green/Dark BG
-            self.chat_area.insertHtml(f"<br><br><b style='color:{COLOR_FG};'>{expert_name}:</b> ")
+            self._expert_blocks.start(event[1], f"<br><br><b style='color:{COLOR_FG};'>{expert_name}:</b> ")
             
         elif etype == "expert_token":
             if len(event) >= 3:
-                self.chat_area.insertPlainText(event[2])
+                self._expert_blocks.append(event[1], event[2])
 
         elif etype == "verdict_start":
+            self._expert_blocks.clear()
             self.chat_area.insertHtml(f"<br><br><b style='color:{COLOR_PROTOCOL};'>FINAL VERDICT:</b> ")
 
         elif etype == "verdict_token":
@@ -444,14 +513,21 @@ class ChatPage(QWidget):
         self.chat_area.moveCursor(QTextCursor.End)
 
     def deferred_load(self):
-        try:
-            self.llm, _ = load_model_from_config("jynx_default")
-            self.send_button.setEnabled(True)
-            self.reason_button.setEnabled(True)
-            self.protocol_button.setEnabled(True)
-            self.status_label.setText("● AI ENGINE ONLINE")
-        except Exception as e:
-            self.status_label.setText(f"○ OFFLINE: {str(e)}")
+        # Loads and warms up on the preloader thread; the UI stays responsive meanwhile
+        self.status_label.setText("○ AI ENGINE LOADING...")
+        self.model_signals.watch(MODEL_PRELOADER.preload("jynx_default"))
+
+    def on_model_ready(self, llm, config):
+        self.llm, self.model_config = llm, config
+        self.max_tokens = self.model_config.get("max_tokens", 2048)
+        self.temperature = self.model_config.get("temperature", 0.7)
+        self.send_button.setEnabled(True)
+        self.reason_button.setEnabled(True)
+        self.protocol_button.setEnabled(True)
+        self.status_label.setText("● AI ENGINE ONLINE")
+
+    def on_model_failed(self, error):
+        self.status_label.setText(f"○ OFFLINE: {error}")
 
     def eventFilter(self, obj, event):
         if obj == self.input_line and event.type() == QEvent.KeyPress:
@@ -493,9 +569,8 @@ class ChatPage(QWidget):
         if path: self.process_attachment(path)
 
     def restore_default_model(self):
-        self.llm, self.model_config = load_model_from_config("jynx_default")
-        self.max_tokens = self.model_config.get("max_tokens", 2048)
-        self.temperature = self.model_config.get("temperature", 0.7)
+        # Usually still resident; if the council pushed it out it reloads in the background
+        self.model_signals.watch(MODEL_PRELOADER.preload("jynx_default"))
         gc.collect()
 
 
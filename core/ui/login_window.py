@@ -150,6 +150,7 @@ class LoginWindow(QWidget):
             app = QApplication.instance()
             app.ghost_id = identity_data["identity_pub_hex"]
             app.private_key = identity_data["sync_priv"]
+            app.identity_key = identity_data["identity_priv"]
 
             # --- THE COOL SUCCESS ANIMATION ---
             self.run_transition(
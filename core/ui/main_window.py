@@ -185,7 +185,8 @@ class GhostDriveMainWindow(QMainWindow):
             "Password Vault": VaultPage(username, passphrase, fernet),
             "Projects": ProjectsPage(username, passphrase, fernet),
             "Inventory": InventoryPage(username, passphrase, fernet),
-            "Sync": SyncPage(username, fernet, self.ghost_id, getattr(app, "private_key", None))
+            "Sync": SyncPage(username, fernet, self.ghost_id, getattr(app, "private_key", None),
+                             getattr(app, "identity_key", None))
         }
 
         for page in self.pages.values(): 
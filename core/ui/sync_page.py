@@ -1,11 +1,10 @@
 import json
 import os
-import threading
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                              QLineEdit, QPushButton, QListWidget, QListWidgetItem,
                              QFrame, QApplication, QCheckBox, QStackedWidget, QProgressBar,  
-                             QDialog, QScrollArea)
-from PySide6.QtCore import Qt
+                             QDialog, QScrollArea, QAbstractItemView)
+from PySide6.QtCore import Qt, QObject, Signal
 
 # Style and Path Imports
 from ui.style_config import (COLOR_BG, COLOR_FG, COLOR_ACCENT, COLOR_BUTTON, 
@@ -13,26 +12,59 @@ from ui.style_config import (COLOR_BG, COLOR_FG, COLOR_ACCENT, COLOR_BUTTON,
                            COLOR_BORDER, FONT_FAMILY, STYLE_BUTTON, STYLE_INPUT,
                            TacticalDialog, ghost_alert) # Added Tactical imports
 from core.paths import EVERYTHING_ELSE
-from core.network_manager import GhostNetwork 
+from core.network_manager import GhostNetwork, GHOST_PORT, MATCHMAKER
+from core.sync_catalog import (SyncCatalog, IN_SYNC, LOCAL_NEWER, PEER_NEWER, CONFLICT,
+                               LOCAL_ONLY, PEER_ONLY)
 
 # Logic Imports
 from core.peers_manager import delete_peer, load_peers, save_peer
 
+class SyncSignals(QObject):
+    """Carries scheduler callbacks from the network loop onto the GUI thread."""
+    file_progress = Signal(str, str, int)
+    sync_finished = Signal(object)
+    catalog_ready = Signal(str, object)
+    pull_finished = Signal(object)
+
+
+# How each catalog status reads next to a file
+STATUS_LABELS = {
+    IN_SYNC: "SYNCED",
+    LOCAL_NEWER: "PEER OUTDATED",
+    PEER_NEWER: "PEER NEWER",
+    CONFLICT: "CONFLICT",
+    LOCAL_ONLY: "NOT ON PEER",
+}
+
+
 class SyncPage(QWidget):
-    def __init__(self, username, fernet, ghost_id, private_key):
+    def __init__(self, username, fernet, ghost_id, private_key, identity_key=None):
         super().__init__()
         self.username = username
         self.fernet = fernet
         self.ghost_id = ghost_id
         self.private_key = private_key
+        self.identity_key = identity_key
+
+        self.signals = SyncSignals()
+        self.signals.file_progress.connect(self.on_file_progress)
+        self.signals.sync_finished.connect(self.on_sync_finished)
+        self.signals.catalog_ready.connect(self.on_catalog_ready)
+        self.signals.pull_finished.connect(self.on_pull_finished)
+        self._stream_progress = {}
+        self._expected_streams = 0
+        self._pullable = []
+        self._pull_results = []
+        self._pending_pulls = 0
         
         # 1. INITIALIZE NETWORK
-        self.network = GhostNetwork(self.username, self.fernet, self.ghost_id, self.private_key)
+        # The catalog is what peers see of our shared files, filtered by their permissions
+        self.catalog = SyncCatalog(self.username, self.ghost_id, self.fernet)
+        self.network = GhostNetwork(self.username, self.fernet, self.ghost_id, self.private_key,
+                                    identity_priv_key=self.identity_key, catalog=self.catalog)
         
-        # Start background threads
-        threading.Thread(target=self.network.start_server, daemon=True).start()
-        threading.Thread(target=self.network.start_broadcast, daemon=True).start()
-        threading.Thread(target=self.network.listen_for_peers, daemon=True).start()
+        # Receiver, broadcaster and discovery all run on the network's own event loop
+        self.network.start()
         
         self.setStyleSheet(f"background-color: {COLOR_PAGE_BG}; font-family: '{FONT_FAMILY}';")
         self.init_ui()
@@ -103,6 +135,7 @@ class SyncPage(QWidget):
             QListWidget::item {{ padding: 15px; border-bottom: 1px solid {COLOR_BORDER}; }}
             QListWidget::item:selected {{ background-color: {COLOR_HIGHLIGHT}; color: {COLOR_FG}; border-left: 3px solid {COLOR_ACCENT}; }}
         """)
+        self.peer_list_widget.setSelectionMode(QAbstractItemView.ExtendedSelection) # Ctrl/Shift to fan out
         self.peer_list_widget.currentRowChanged.connect(self.display_peer_details)
         side_layout.addWidget(self.peer_list_widget)
 
@@ -164,12 +197,24 @@ class SyncPage(QWidget):
         self.progress_bar.hide()
         config_layout.addWidget(self.progress_bar)
 
+        self.sync_status = QLabel("")
+        self.sync_status.setStyleSheet(f"color: {COLOR_PROTOCOL}; font-size: 10px; border: none;")
+        config_layout.addWidget(self.sync_status)
+
         self.save_btn = QPushButton("INITIALIZE HANDSHAKE")
         self.save_btn.setStyleSheet(STYLE_BUTTON)
         self.save_btn.setFixedHeight(50)
         self.save_btn.clicked.connect(self.initiate_handshake)
         config_layout.addWidget(self.save_btn)
 
+        # Shown once the peer's catalog lists projects we don't have (or have older)
+        self.pull_btn = QPushButton("PULL FROM NETWORK")
+        self.pull_btn.setStyleSheet(STYLE_BUTTON)
+        self.pull_btn.setFixedHeight(50)
+        self.pull_btn.clicked.connect(self.pull_updates)
+        self.pull_btn.hide()
+        config_layout.addWidget(self.pull_btn)
+
         self.right_stack.addWidget(self.config_view)
         content_row.addWidget(self.right_stack)
         main_layout.addLayout(content_row)
@@ -179,51 +224,92 @@ class SyncPage(QWidget):
         self.my_ip_display.setText(ip)
         self.my_ip_display.setStyleSheet(f"color: {COLOR_ACCENT}; border: none; background: transparent; font-weight: bold;")
 
-    def initiate_handshake(self):
-        current_item = self.peer_list_widget.currentItem()
-        if not current_item: return
-        
-        alias = current_item.text()
+    def resolve_targets(self, aliases, manual_ip=""):
+        """Turns peer aliases into network targets. Returns (targets, offline aliases)."""
         peers = load_peers(self.username, self.fernet)
-        peer_data = peers.get(alias)
-        peer_gid = peer_data["ghost_id"]
-        recipient_sync_hex = peer_data.get("public_key")
+        targets, offline = [], []
+        for alias in aliases:
+            peer_data = peers.get(alias)
+            if not peer_data: continue
+            peer_gid = peer_data["ghost_id"]
+
+            # Manual IP only makes sense for a single peer; otherwise take the fastest live address
+            if manual_ip and len(aliases) == 1:
+                address = (manual_ip, GHOST_PORT)
+            else:
+                address = self.network.registry.best_address(peer_gid)
+
+            target = {"alias": alias, "ghost_id": peer_gid, "public_key": peer_data.get("public_key")}
+            if address:
+                target.update(ip=address[0], port=address[1])
+            elif not (MATCHMAKER or peer_gid in self.network.punched_paths):
+                offline.append(alias)
+                continue
+            # No LAN address: the network reuses a punched path or rendezvouses via the matchmaker
+            targets.append(target)
+        return targets, offline
+
+    def initiate_handshake(self):
+        selected = self.peer_list_widget.selectedItems()
+        if not selected: return
 
-        target_ip = self.manual_ip_input.text().strip()
-        if not target_ip:
-            target_ip = self.network.discovered_peers.get(peer_gid)
+        manual_ip = self.manual_ip_input.text().strip()
+        targets, offline = self.resolve_targets([item.text() for item in selected], manual_ip)
 
-        if not target_ip:
+        if not targets:
             err_diag = ghost_alert(self, "OFFLINE", "PEER NOT FOUND ON NETWORK. PLEASE ENTER A MANUAL IP.")
             if err_diag:
                 err_diag.setStyleSheet("QWidget, QLabel { background: transparent; border: none; }")
                 err_diag.exec()
             return
 
+        # Gather Project files (widgets are only touched on the GUI thread)
+        files_to_send = []
+        for i in range(self.project_container.count()):
+            cb = self.project_container.itemAt(i).widget()
+            if isinstance(cb, QCheckBox) and cb.isChecked():
+                label = cb.property("file_name") or cb.text()
+                file_name = label if label.endswith(".enc") else f"{label.replace(' ', '_')}.enc"
+                file_path = os.path.join(EVERYTHING_ELSE, "projects", self.username, file_name)
+                if os.path.exists(file_path):
+                    files_to_send.append(file_path)
+        if not files_to_send: return
+
+        self._stream_progress = {}
+        self._expected_streams = len(targets) * len(files_to_send)
         self.progress_bar.show()
         self.progress_bar.setValue(0)
-        
-        def run_sync_thread():
-            files_to_send = []
-            # Gather Project files
-            for i in range(self.project_container.count()):
-                cb = self.project_container.itemAt(i).widget()
-                if isinstance(cb, QCheckBox) and cb.isChecked():
-                    file_name = f"{cb.text().replace(' ', '_')}.enc"
-                    file_path = os.path.join(EVERYTHING_ELSE, "projects", self.username, file_name)
-                    if os.path.exists(file_path):
-                        files_to_send.append(file_path)
-
-            for path in files_to_send:
-                self.network.send_file(target_ip, path, recipient_sync_hex, 
-                                     progress_callback=self.update_progress_safe)
-            
-            self.progress_bar.hide()
-
-        threading.Thread(target=run_sync_thread, daemon=True).start()
-
-    def update_progress_safe(self, value):
-        self.progress_bar.setValue(value)
+        self.save_btn.setEnabled(False)
+        self.sync_status.setText(f"UPLINK ACTIVE // {len(files_to_send)} FILES -> {len(targets)} PEERS"
+                                 + (f" // OFFLINE: {', '.join(offline)}" if offline else ""))
+
+        future = self.network.sync_files(targets, files_to_send, on_progress=self.signals.file_progress.emit)
+        future.add_done_callback(self._emit_sync_result)
+
+    def _emit_sync_result(self, future):
+        # Runs on the network thread; the signal hops back to the GUI thread
+        try:
+            self.signals.sync_finished.emit(future.result())
+        except Exception as e:
+            self.signals.sync_finished.emit(e)
+
+    def on_file_progress(self, peer, name, value):
+        self._stream_progress[(peer, name)] = value
+        if self._expected_streams:
+            self.progress_bar.setValue(int(sum(self._stream_progress.values()) / self._expected_streams))
+
+    def on_sync_finished(self, stats):
+        self.progress_bar.hide()
+        self.save_btn.setEnabled(True)
+        if isinstance(stats, Exception):
+            self.sync_status.setText(f"UPLINK FAILED // {stats}")
+            return
+        summary = (f"SYNCED {stats['ok']}/{stats['files']} FILES // "
+                   f"{stats['bytes'] / 1048576:.2f} MB @ {stats['throughput'] / 1048576:.2f} MB/s // "
+                   f"WIRE {stats['compression_ratio'] * 100:.0f}%")
+        if stats["failed"]:
+            summary += f" // {len(stats['failed'])} FAILED"
+        self.sync_status.setText(summary)
 
     def add_peer_dialog(self):
         # 1. Define a transparency fix for labels and inputs inside the popup
@@ -290,6 +376,7 @@ class SyncPage(QWidget):
         for item in os.listdir(path):
             if filter_ext and not item.endswith(('.enc', '.csv', '.json')): continue
             cb = QCheckBox(item)
+            cb.setProperty("file_name", item)
             cb.setStyleSheet(f"""
                 QCheckBox {{ padding: 12px; border: 1px solid {COLOR_BORDER}; border-radius: 6px; background: {COLOR_BG}; color: {COLOR_FG}; margin-bottom: 2px; }}
                 QCheckBox::indicator {{ width: 18px; height: 18px; border: 1px solid {COLOR_ACCENT}; border-radius: 4px; }}
@@ -302,9 +389,98 @@ class SyncPage(QWidget):
             self.right_stack.setCurrentIndex(0)
             return
         self.right_stack.setCurrentIndex(1)
+        self._pullable = []
+        self.pull_btn.hide()
         self.peer_title.setText(f"CONFIGURING: {self.peer_list_widget.currentItem().text().upper()}")
         self.populate_assets(self.project_container, "projects")
         self.populate_assets(self.inventory_container, "inventory", filter_ext=True)
+        self.request_catalog(self.peer_list_widget.currentItem().text())
+
+    def request_catalog(self, alias):
+        """Asks the peer for its catalog changes; the answer annotates the file list."""
+        targets, _ = self.resolve_targets([alias])
+        if not targets:
+            self.sync_status.setText(f"{alias.upper()} OFFLINE // CATALOG UNAVAILABLE")
+            return
+        self.sync_status.setText(f"COMPARING CATALOG WITH {alias.upper()}...")
+        future = self.network.fetch_catalog(targets[0])
+        future.add_done_callback(lambda f: self._emit_catalog(alias, f))
+
+    def _emit_catalog(self, alias, future):
+        # Runs on the network thread; the signal hops back to the GUI thread
+        try:
+            self.signals.catalog_ready.emit(alias, future.result())
+        except Exception as e:
+            self.signals.catalog_ready.emit(alias, e)
+
+    def on_catalog_ready(self, alias, status):
+        current = self.peer_list_widget.currentItem()
+        if current is None or current.text() != alias: return   # the user moved on
+        if isinstance(status, Exception):
+            self.sync_status.setText(f"CATALOG FROM {alias.upper()} FAILED // {status}")
+            return
+        for folder, container in (("projects", self.project_container), ("inventory", self.inventory_container)):
+            for i in range(container.count()):
+                cb = container.itemAt(i).widget()
+                if not isinstance(cb, QCheckBox): continue
+                file_name = cb.property("file_name") or cb.text()
+                label = STATUS_LABELS.get(status.get(f"{folder}/{file_name}"))
+                cb.setText(f"{file_name}  //  {label}" if label else file_name)
+        states = list(status.values())
+        stale = states.count(LOCAL_NEWER) + states.count(LOCAL_ONLY)
+        summary = f"{alias.upper()} // {stale} TO SEND // {states.count(PEER_ONLY)} ONLY ON PEER"
+        if CONFLICT in states:
+            summary += f" // {states.count(CONFLICT)} CONFLICTS"
+        self.sync_status.setText(summary)
+
+        peer_id = (load_peers(self.username, self.fernet).get(alias) or {}).get("ghost_id")
+        self._pullable = self.catalog.pullable(peer_id) if peer_id else []
+        if self._pullable and not self._pending_pulls:
+            self.pull_btn.setText(f"PULL {len(self._pullable)} FILES FROM NETWORK")
+            self.pull_btn.show()
+
+    def pull_updates(self):
+        """
+        Fetches what the peer has newer. Every trusted peer whose catalog lists the same
+        content hash is a source, so a file held by several peers is swarmed from all of them.
+        """
+        if not self._pullable or self._pending_pulls: return
+        peers = load_peers(self.username, self.fernet)
+        alias_of = {p["ghost_id"]: alias for alias, p in peers.items() if isinstance(p, dict) and p.get("ghost_id")}
+
+        self._pull_results = []
+        self._pending_pulls = len(self._pullable)
+        self.pull_btn.setEnabled(False)
+        self.sync_status.setText(f"DOWNLINK ACTIVE // {len(self._pullable)} FILES")
+        for file_id, sha256 in self._pullable:
+            holders = [alias_of[gid] for gid in self.catalog.holders(sha256) if gid in alias_of]
+            targets, _ = self.resolve_targets(holders)
+            future = self.network.swarm_download(sha256, os.path.basename(file_id), targets)
+            future.add_done_callback(self._emit_pull_result)
+
+    def _emit_pull_result(self, future):
+        # Runs on the network thread; the signal hops back to the GUI thread
+        try:
+            self.signals.pull_finished.emit(future.result())
+        except Exception as e:
+            self.signals.pull_finished.emit(e)
+
+    def on_pull_finished(self, result):
+        self._pull_results.append(result)
+        self._pending_pulls -= 1
+        if self._pending_pulls > 0: return
+
+        done = [r for r in self._pull_results if not isinstance(r, Exception)]
+        sources = {alias for r in done for alias in r["sources"]}
+        summary = f"PULLED {len(done)}/{len(self._pull_results)} FILES FROM {len(sources)} PEERS"
+        if len(done) < len(self._pull_results):
+            summary += f" // {len(self._pull_results) - len(done)} FAILED"
+        self.sync_status.setText(summary)
+        self.pull_btn.setEnabled(True)
+        self.pull_btn.hide()
+        current = self.peer_list_widget.currentItem()
+        if current:
+            self.request_catalog(current.text())    # re-compare now that the files are here
 
     def delete_selected_peer(self):
         current = self.peer_list_widget.currentItem()
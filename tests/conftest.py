@@ -0,0 +1,95 @@
+import os
+import shutil
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# The app imports its modules both as core.<name> and Everything_else.<name>
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (ROOT, os.path.join(ROOT, "core")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Node helpers are shared with the benchmarks
+from benchmarks.loopback import make_node, target_of, trust
+
+
+@pytest.fixture
+def ghost_nodes(tmp_path):
+    """Factory for started nodes that all trust each other; stopped at teardown."""
+    peers, nodes = {}, []
+
+    def spawn(name, **kwargs):
+        node = make_node(str(tmp_path), name, peers, **kwargs)
+        trust(peers, name, node)
+        node.start()
+        nodes.append(node)
+        return node
+
+    spawn.peers = peers
+    yield spawn
+    for node in nodes:
+        node.stop()
+    shutil.rmtree(str(tmp_path), ignore_errors=True)
+
+
+class FakeLlama:
+    """
+    Stands in for llama_cpp.Llama where a test needs no weights: one token per
+    character, eval only records tokens, and every completion answers ``reply``.
+    Completions keep the evaluated start they share with the last one, as Llama does.
+    """
+    reply = "Noted."
+
+    def __init__(self, model_path=None, chat_handler=None, n_ctx=4096, n_gpu_layers=-1, verbose=False):
+        self.model_path = model_path
+        self.input_ids = np.zeros(n_ctx, dtype=np.intc)
+        self.n_tokens = 0
+        self.evaluated = 0
+        self.loads = 0
+        self.prompts = []          # (prompt, tokens evaluated for it since the last completion)
+        self._mark = 0
+
+    @property
+    def _input_ids(self):
+        return self.input_ids[:self.n_tokens]
+
+    def n_ctx(self):
+        return len(self.input_ids)
+
+    def tokenize(self, text, special=False):
+        return [ord(c) for c in text.decode("utf-8")]
+
+    def eval(self, tokens):
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = tokens
+        self.n_tokens += len(tokens)
+        self.evaluated += len(tokens)
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def save_state(self):
+        body = self._input_ids.tobytes()
+        return SimpleNamespace(input_ids=self.input_ids.copy(), scores=np.zeros((1, 8), dtype=np.single),
+                               n_tokens=self.n_tokens, llama_state=body, llama_state_size=len(body), seed=0)
+
+    def load_state(self, state):
+        self.loads += 1
+        self.input_ids[:state.n_tokens] = state.input_ids[:state.n_tokens]
+        self.n_tokens = state.n_tokens
+
+    def __call__(self, prompt, stream=False, max_tokens=16, **kwargs):
+        tokens = self.tokenize(prompt.encode("utf-8"))
+        shared = 0
+        for a, b in zip(self._input_ids, tokens):
+            if a != b: break
+            shared += 1
+        self.n_tokens = shared
+        self.eval(tokens[shared:])
+        self.prompts.append((prompt, self.evaluated - self._mark))
+        self.eval(self.tokenize(self.reply.encode("utf-8")))
+        self._mark = self.evaluated
+        chunk = {"choices": [{"text": self.reply}]}
+        return iter([chunk]) if stream else chunk
@@ -0,0 +1,102 @@
+import ctypes
+
+import pytest
+
+llama_cpp = pytest.importorskip("llama_cpp")
+import Everything_else.ai_council as ai_council
+import Everything_else.model_registry as model_registry
+from conftest import FakeLlama
+from Everything_else.model_registry import BATCH_API, BATCH_FUNCTIONS, BatchEngines, ModelPool, batching_supported
+
+
+class FakeEngine:
+    def __init__(self, llm, n_seq):
+        self.llm = llm
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_registry, "Llama", FakeLlama)
+    pool = ModelPool(max_models=3, ram_budget=3000)
+    engines = BatchEngines(n_seq=4, pool=pool)
+    monkeypatch.setattr(model_registry, "BATCH_ENGINES", engines)
+    monkeypatch.setattr(model_registry, "BatchEngine", FakeEngine)
+    monkeypatch.setattr(model_registry, "_kv_bytes", lambda llm, n_tokens: 1500)
+
+    def load(name, size=1000):
+        path = tmp_path / f"{name}.gguf"
+        path.write_bytes(b"\0" * size)
+        weights = {"model_path": str(path), "clip_path": None}
+        return weights, (str(path), None), pool.acquire(str(path))
+    pool.load = load
+    pool.engines = engines
+    return pool
+
+
+def test_reservation_evicts_other_models_and_counts_against_the_budget(pool):
+    _, key_a, llm_a = pool.load("a")
+    pool.load("b")
+    assert pool.reserve(key_a, llm_a, 1500)
+    assert pool.stats()["resident"] == ["a.gguf"] and pool.used() == 2500
+    pool.release(key_a, llm_a)
+    assert pool.used() == 1000
+
+
+def test_reservation_refuses_what_cannot_fit_or_a_replaced_instance(pool):
+    _, key_a, llm_a = pool.load("a")
+    assert not pool.reserve(key_a, llm_a, 2500)
+    assert not pool.reserve(key_a, FakeLlama(), 10)
+    assert pool.used() == 1000
+
+
+def test_batch_engine_context_is_reserved_once_and_dropped_with_its_model(pool):
+    weights_a, key_a, llm_a = pool.load("a")
+    pool.load("b")
+    engine = pool.engines.get(weights_a, llm_a)
+    assert pool.engines.get(weights_a, llm_a) is engine
+    assert pool.used() == 2500 and pool.stats()["resident"] == ["a.gguf"]
+
+    pool.load("c", 600)                     # over the budget again: a and its engine go
+    assert engine.closed and pool.stats()["resident"] == ["c.gguf"]
+
+
+def test_no_engine_without_room_for_its_context(pool, monkeypatch):
+    monkeypatch.setattr(model_registry, "_kv_bytes", lambda llm, n_tokens: 5000)
+    weights_a, _, llm_a = pool.load("a")
+    with pytest.raises(MemoryError):
+        pool.engines.get(weights_a, llm_a)
+    assert pool.engines._engines == {} and pool.used() == 1000
+
+
+def test_batching_needs_every_internal_it_calls(monkeypatch):
+    for name, methods in BATCH_API.items():
+        monkeypatch.setattr(model_registry, name, type(name, (), {m: None for m in methods}))
+    for name in BATCH_FUNCTIONS:
+        monkeypatch.setattr(llama_cpp, name, lambda *args: None, raising=False)
+    params = type("llama_context_params", (ctypes.Structure,), {"_fields_": [("n_seq_max", ctypes.c_uint32)]})
+    monkeypatch.setattr(llama_cpp, "llama_context_params", params, raising=False)
+    assert batching_supported()
+
+    monkeypatch.delattr(model_registry.LlamaContext, "kv_cache_seq_rm")
+    assert not batching_supported()
+    monkeypatch.setattr(model_registry, "LlamaContext", None)
+    assert not batching_supported()
+
+
+def test_experts_take_turns_when_batching_is_unavailable(monkeypatch):
+    monkeypatch.setattr(model_registry, "BATCHING", False)
+    with pytest.raises(RuntimeError):
+        model_registry.stream_batch([("jynx_expert_finance", "prompt", {})])
+
+    monkeypatch.setattr(ai_council, "BATCHING", False)
+    monkeypatch.setattr(ai_council, "resolve_model", lambda expert_id: ({"model_path": "shared.gguf"}, {}, None))
+    monkeypatch.setattr(ai_council, "stream_batch", lambda requests: pytest.fail("batched without support"))
+    monkeypatch.setattr(ai_council, "_expert_tokens", lambda expert_id, *args: iter([expert_id[-4:]]))
+    events = list(ai_council._run_experts_parallel(["jynx_expert_math", "jynx_expert_cyber"], "profile", "notes", True))
+    assert [e for e in events if e[0] == "expert_done"] == [
+        ("expert_done", "Math Expert", "math"), ("expert_done", "Cybersecurity Expert", "yber")
+    ]
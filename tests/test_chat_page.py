@@ -0,0 +1,99 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PySide6")
+pytest.importorskip("llama_cpp")
+from PySide6.QtWidgets import QApplication, QTextEdit
+
+import core.ui.chat_page as chat_page
+from core.ui.chat_page import ChatPage, ExpertBlocks
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def _blocks(text):
+    """Expert name -> its text, from the display's plain text."""
+    blocks = {}
+    for part in text.split("\n\n")[1:]:
+        name, _, body = part.partition(": ")
+        blocks[name] = body
+    return blocks
+
+
+def test_interleaved_tokens_stay_in_their_own_block(app):
+    view = QTextEdit()
+    blocks = ExpertBlocks(view)
+    blocks.start("A", "<br><br><b>A:</b> ")
+    blocks.append("A", "a0 ")
+    blocks.start("B", "<br><br><b>B:</b> ")
+    blocks.append("A", "a1 ")
+    blocks.append("B", "b1 ")
+    blocks.start("C", "<br><br><b>C:</b> ")
+    blocks.append("C", "c1 ")
+    blocks.append("A", "a2 ")
+    blocks.append("B", "b2 ")
+    blocks.append("C", "c2")
+    blocks.append("A", "a3")
+
+    assert _blocks(view.toPlainText()) == {"A": "a0 a1 a2 a3", "B": "b1 b2 ", "C": "c1 c2"}
+
+
+def test_tokens_of_a_block_without_output_yet_go_in_before_the_next_header(app):
+    view = QTextEdit()
+    blocks = ExpertBlocks(view)
+    blocks.start("A", "<br><br><b>A:</b> ")
+    blocks.start("B", "<br><br><b>B:</b> ")
+    blocks.append("B", "b")
+    blocks.append("A", "ünïcode 😀")
+    blocks.append("B", "b")
+    assert _blocks(view.toPlainText()) == {"A": "ünïcode 😀", "B": "bb"}
+
+
+def test_council_events_from_parallel_experts_render_per_expert(app):
+    page = SimpleNamespace(chat_area=QTextEdit(), _summary_started=False)
+    page._expert_blocks = ExpertBlocks(page.chat_area)
+    events = [("expert_start", "Finance Expert"), ("expert_start", "Coding Expert"),
+              ("expert_token", "Finance Expert", "Save "), ("expert_token", "Coding Expert", "Use "),
+              ("expert_token", "Finance Expert", "more."), ("expert_token", "Coding Expert", "cron."),
+              ("expert_done", "Finance Expert", "Save more."), ("expert_done", "Coding Expert", "Use cron."),
+              ("verdict_start", ""), ("verdict_token", "Both.")]
+    for event in events:
+        ChatPage._handle_council_event(page, event)
+
+    assert _blocks(page.chat_area.toPlainText()) == {
+        "FINANCE EXPERT": "Save more.", "CODING EXPERT": "Use cron.", "FINAL VERDICT": "Both."
+    }
+
+
+@pytest.mark.parametrize("outcome", ["done", "error"])
+def test_council_runs_without_holding_the_chat_model(app, monkeypatch, outcome):
+    def council(*args, **kwargs):
+        assert page.llm is None
+        if outcome == "error":
+            raise RuntimeError("no weights")
+        yield ("done",)
+
+    monkeypatch.setattr(chat_page, "run_council_streaming", council)
+    page = ChatPage("tester", "pw", None)
+    restored = []
+    page.restore_default_model = lambda: restored.append(True)
+    page.llm = object()
+    page.send_button.setEnabled(True)
+    page.input_line.setPlainText("Should I refinance?")
+
+    page.handle_reason()
+    assert page.llm is None and not page.send_button.isEnabled()
+    stopped = []
+    page._active_thread.finished.connect(lambda: stopped.append(True))
+    deadline = time.monotonic() + 5
+    while not (restored and stopped) and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    assert restored == [True] and stopped
@@ -0,0 +1,92 @@
+import os
+import zlib
+
+import pytest
+
+from conftest import make_node, trust
+from core.network_manager import (
+    CHUNK_SIZE, CODECS, FRAME_CHUNK, _open_sealed, _pack_chunks, compress_chunk, decompress_chunk,
+    pack_frame, seal_frame, unpack_frame
+)
+from core.secure_channel import SecureChannel, new_ephemeral, sign, transcript_hash
+
+TEXT = b"the quick brown fox jumps over the lazy dog\n" * 400
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_compress_round_trip(codec):
+    packed = compress_chunk(codec, TEXT)
+    assert len(packed) < len(TEXT)
+    assert decompress_chunk(codec, packed, limit=len(TEXT)) == TEXT
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_inflating_past_the_limit_is_refused(codec):
+    bomb = compress_chunk(codec, b"\0" * (CHUNK_SIZE + 1))
+    with pytest.raises(Exception):
+        decompress_chunk(codec, bomb)
+    assert decompress_chunk(codec, compress_chunk(codec, b"\0" * CHUNK_SIZE)) == b"\0" * CHUNK_SIZE
+
+
+def test_unknown_codec_is_refused():
+    with pytest.raises(ValueError):
+        decompress_chunk("lz4", zlib.compress(TEXT))
+
+
+def test_incompressible_chunks_go_out_raw():
+    noise = os.urandom(CHUNK_SIZE)
+    packed, wire_bytes, _ = _pack_chunks(noise + TEXT[:CHUNK_SIZE], codec="zlib")
+    (first, first_codec), (second, second_codec) = packed
+    assert first == noise and first_codec is None
+    assert second_codec == "zlib" and len(second) < CHUNK_SIZE
+    assert wire_bytes == len(first) + len(second)
+
+
+def test_no_codec_leaves_every_chunk_raw():
+    packed, wire_bytes, _ = _pack_chunks(TEXT)
+    assert all(codec is None for _, codec in packed)
+    assert wire_bytes == len(TEXT)
+
+
+def test_compressed_chunk_is_inflated_when_opened():
+    key_a, key_b = os.urandom(32), os.urandom(32)
+    a, b = SecureChannel("sid", "b", key_a, key_b), SecureChannel("sid", "a", key_b, key_a)
+    inner = pack_frame(FRAME_CHUNK, {"tid": "t", "seq": 0, "z": "zlib"}, compress_chunk("zlib", TEXT[:CHUNK_SIZE]))
+    _, header, body = unpack_frame(seal_frame(a, inner))
+    assert _open_sealed(b, header, body)[2] == TEXT[:CHUNK_SIZE]
+
+
+# --- Negotiation ---
+
+@pytest.fixture
+def responder(tmp_path):
+    peers = {}
+    node, initiator = make_node(str(tmp_path), "responder", peers), make_node(str(tmp_path), "initiator", peers)
+    trust(peers, "initiator", initiator)
+    yield node, initiator
+    node.stop()
+    initiator.stop()
+
+
+def _hello(node, codecs):
+    _, eph_hex = new_ephemeral()
+    signature = sign(node.identity_priv_key, transcript_hash("s1", node.ghost_id, eph_hex))
+    return {"from": node.ghost_id, "sid": "s1", "eph": eph_hex, "sig": signature, "codecs": codecs}
+
+
+def _agreed(channel):
+    return unpack_frame(channel.hello_reply)[1]["codec"]
+
+
+def test_responder_takes_the_first_offered_codec_it_supports(responder):
+    node, initiator = responder
+    channel = node._accept_handshake(_hello(initiator, ["lz4", "zlib"]))
+    assert channel.codec == "zlib" and _agreed(channel) == "zlib"
+    assert node._accept_handshake(_hello(initiator, list(CODECS))).codec == CODECS[0]
+
+
+def test_no_common_codec_means_uncompressed(responder):
+    node, initiator = responder
+    channel = node._accept_handshake(_hello(initiator, ["lz4"]))
+    assert channel.codec is None and _agreed(channel) is None
+    assert node._accept_handshake(_hello(initiator, None)).codec is None
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+pytest.importorskip("llama_cpp")
+from Everything_else.model_registry import ConfigError, ConfigRegistry, ModelConfig
+
+MODELS = """
+models:
+  jynx_default:
+    path: base.gguf
+    n_ctx: 2048
+    temperature: 0.7
+    persona: You are Jynx.
+  jynx_finance:
+    path: base.gguf
+    n_ctx: 8192
+    system_prompt: You are a finance expert.
+  jynx_vision:
+    path: vision.gguf
+    clip_path: clip.gguf
+  broken:
+    path: broken.gguf
+    max_tokens: lots
+"""
+
+
+def _registry(tmp_path, text=MODELS):
+    path = tmp_path / "models.yaml"
+    path.write_text(text)
+    return ConfigRegistry(str(path)), path
+
+
+def _rewrite(path, text):
+    stat = os.stat(path)
+    path.write_text(text)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_entries_are_validated_and_bad_ones_skipped(tmp_path):
+    registry, _ = _registry(tmp_path)
+    assert sorted(registry.all()) == ["jynx_default", "jynx_finance", "jynx_vision"]
+    config = registry.get("jynx_default")
+    assert config.n_ctx == 2048 and config.sampling == {"temperature": 0.7}
+    assert config.persona == "You are Jynx."
+    assert registry.get("jynx_finance").persona == "You are a finance expert."
+    with pytest.raises(ValueError):
+        registry.get("broken")
+
+
+@pytest.mark.parametrize("raw", [
+    "not a mapping",
+    {"n_ctx": 2048},
+    {"path": "  "},
+    {"path": "m.gguf", "n_ctx": 20.5},
+    {"path": "m.gguf", "top_k": True},
+    {"path": "m.gguf", "stop": "User:"},
+])
+def test_model_config_rejects_malformed_entries(raw):
+    with pytest.raises(ConfigError):
+        ModelConfig("m", raw)
+
+
+def test_entries_on_one_file_share_the_largest_context(tmp_path):
+    registry, _ = _registry(tmp_path)
+    default, finance = registry.get("jynx_default"), registry.get("jynx_finance")
+    assert default.weights_key == finance.weights_key
+    assert registry.shared_context(default) == registry.shared_context(finance) == 8192
+    assert sorted(registry.shared_weights()[default.model_path]) == ["jynx_default", "jynx_finance"]
+    vision = registry.get("jynx_vision")
+    assert vision.weights_key[1] and registry.shared_context(vision) == vision.n_ctx
+
+
+def test_edits_are_picked_up_and_unchanged_files_are_not_reparsed(tmp_path, monkeypatch):
+    registry, path = _registry(tmp_path)
+    registry.get("jynx_default")
+    parses = []
+    original = ConfigRegistry._parse
+    monkeypatch.setattr(ConfigRegistry, "_parse", lambda self: parses.append(1) or original(self))
+
+    registry.get("jynx_default")
+    assert parses == []
+    _rewrite(path, MODELS.replace("temperature: 0.7", "temperature: 0.2"))
+    assert registry.get("jynx_default").sampling == {"temperature": 0.2}
+    assert parses == [1]
+
+
+def test_a_broken_edit_keeps_the_last_good_models(tmp_path):
+    registry, path = _registry(tmp_path)
+    registry.get("jynx_default")
+    _rewrite(path, "models: [unclosed")
+    assert registry.get("jynx_default").n_ctx == 2048
+    _rewrite(path, "nothing: here")
+    assert "jynx_vision" in registry.all()
+
+
+def test_a_broken_file_on_first_read_raises(tmp_path):
+    registry, _ = _registry(tmp_path, "nothing: here")
+    with pytest.raises(ConfigError):
+        registry.get("jynx_default")
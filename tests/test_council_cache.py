@@ -0,0 +1,122 @@
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+from Everything_else.council_cache import CouncilCache, council_cache
+
+EVENTS = [("expert_start", "Finance"), ("expert_token", "Finance", "Buy low."), ("done",)]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CouncilCache(Fernet(Fernet.generate_key()), str(tmp_path / "cache"))
+
+
+def _key(prompt="What should I invest in?", image=None, profile="profile", models="models", **settings):
+    return CouncilCache.key(prompt, image, profile, models, **settings)
+
+
+def test_key_ignores_case_and_spacing_of_the_request():
+    assert _key("What should  I invest in?") == _key("  what should i\ninvest in? ")
+
+
+def test_key_changes_with_everything_the_output_depends_on(tmp_path):
+    image = tmp_path / "chart.png"
+    image.write_bytes(b"first")
+    with_image = _key(image=str(image))
+    keys = {_key(), with_image, _key(profile="other"), _key(models="other"), _key(parallel=True),
+            _key("What should I sell?")}
+    assert len(keys) == 6
+    image.write_bytes(b"second")
+    assert _key(image=str(image)) != with_image
+
+
+def test_saved_run_replays_as_tuples(cache):
+    key = _key()
+    assert cache.load(key) is None
+    cache.save(key, EVENTS)
+    assert cache.load(key) == EVENTS
+    assert cache.stats() == {"hits": 1, "misses": 1, "writes": 1}
+
+
+def test_entry_sealed_with_another_key_is_dropped(cache):
+    key = _key()
+    cache.save(key, EVENTS)
+    stranger = CouncilCache(Fernet(Fernet.generate_key()), cache.directory)
+    assert stranger.load(key) is None
+    assert not os.listdir(cache.directory)
+
+
+def test_least_recently_used_runs_are_evicted_over_capacity(cache):
+    keys = [_key(f"request {i}") for i in range(3)]
+    cache.save(keys[0], EVENTS)
+    cache.save(keys[1], EVENTS)
+    os.utime(cache._file(keys[0]), (1000, 1000))
+    os.utime(cache._file(keys[1]), (2000, 2000))
+    cache.load(keys[0])                                     # touched: now the newest of the two
+    cache.capacity = 2 * os.path.getsize(cache._file(keys[0]))
+    cache.save(keys[2], EVENTS)
+    assert cache.load(keys[1]) is None
+    assert cache.load(keys[0]) == EVENTS and cache.load(keys[2]) == EVENTS
+
+
+def test_clear_removes_only_cache_entries(cache):
+    cache.save(_key(), EVENTS)
+    other = os.path.join(cache.directory, "notes.txt")
+    open(other, "w").close()
+    cache.clear()
+    assert os.listdir(cache.directory) == ["notes.txt"]
+
+
+def test_no_cache_without_an_encryption_key():
+    assert council_cache("Operator", None) is None
+
+
+# --- run_council_streaming ---
+
+@pytest.fixture
+def council(cache, monkeypatch):
+    pytest.importorskip("llama_cpp")
+    import Everything_else.ai_council as ai_council
+
+    runs = []
+
+    def fake_run(user_prompt, image_path, user_context, parallel):
+        runs.append(user_prompt)
+        yield from fake_run.events
+
+    fake_run.events = EVENTS
+    monkeypatch.setattr(ai_council, "council_cache", lambda username, fernet: cache)
+    monkeypatch.setattr(ai_council, "get_user_profile_context", lambda username, fernet: "profile")
+    monkeypatch.setattr(ai_council, "config_fingerprint", lambda names: "models")
+    monkeypatch.setattr(ai_council, "_run_council", fake_run)
+
+    def run(prompt, **kwargs):
+        return list(ai_council.run_council_streaming(prompt, fernet=cache.fernet, **kwargs))
+
+    run.runs, run.council = runs, fake_run
+    return run
+
+
+def test_repeated_request_is_replayed_without_running_the_council(council):
+    assert council("Should I buy a house?") == EVENTS
+    assert council("should I  buy a house?") == EVENTS
+    assert council.runs == ["Should I buy a house?"]
+
+
+def test_use_cache_false_reruns_and_replaces_the_answer(council):
+    council("Should I buy a house?")
+    council.council.events = EVENTS[:1] + [("expert_token", "Finance", "Rent."), ("done",)]
+    assert council("Should I buy a house?", use_cache=False) == council.council.events
+    assert council("Should I buy a house?") == council.council.events
+    assert len(council.runs) == 2
+
+
+def test_failed_or_unfinished_runs_are_not_recorded(council):
+    council.council.events = [("expert_start", "Finance"), ("expert_token", "Finance", "[error: boom]"), ("done",)]
+    council("Should I buy a house?")
+    council.council.events = EVENTS[:2]
+    council("Should I buy a house?")
+    council("Should I buy a house?")
+    assert len(council.runs) == 3
@@ -0,0 +1,96 @@
+import pytest
+
+import core.discovery as discovery
+from core.discovery import ANNOUNCE_FAST, ANNOUNCE_SLOW, FAST_ANNOUNCES, PING_TIMEOUT, RTT_SMOOTHING, DiscoveryRegistry
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Pins discovery's monotonic clock; advance it with ``clock.now += seconds``."""
+    class Clock:
+        now = 1000.0
+    monkeypatch.setattr(discovery.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def _ping(registry, clock, nonce, rtt, ghost_id="a", addr=("10.0.0.1", 5000)):
+    registry.ping_sent(nonce, ghost_id, *addr)
+    clock.now += rtt
+    return registry.pong_received(nonce)
+
+
+def test_rtt_starts_at_the_first_sample_then_smooths(clock):
+    registry = DiscoveryRegistry()
+    registry.observe("a", "10.0.0.1", 5000)
+    assert _ping(registry, clock, "n1", 0.100) == pytest.approx(0.100)
+    assert registry.snapshot()["a"][0]["rtt_ms"] == 100.0
+    _ping(registry, clock, "n2", 0.500)
+    expected = (1 - RTT_SMOOTHING) * 0.100 + RTT_SMOOTHING * 0.500
+    assert registry.snapshot()["a"][0]["rtt_ms"] == round(expected * 1000, 1)
+
+
+def test_unknown_or_repeated_pongs_are_ignored(clock):
+    registry = DiscoveryRegistry()
+    registry.observe("a", "10.0.0.1", 5000)
+    assert registry.pong_received("never-sent") is None
+    _ping(registry, clock, "n1", 0.050)
+    assert registry.pong_received("n1") is None
+    registry.ping_sent("n2", "gone", "10.0.0.9", 5000)
+    assert registry.pong_received("n2") is None
+
+
+def test_best_address_prefers_the_fastest_measured_one(clock):
+    registry = DiscoveryRegistry()
+    for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+        registry.observe("a", ip, 5000)
+    _ping(registry, clock, "slow", 0.300, addr=("10.0.0.1", 5000))
+    _ping(registry, clock, "fast", 0.020, addr=("10.0.0.2", 5000))
+    assert registry.best_address("a") == ("10.0.0.2", 5000)
+    assert registry.best_address("nobody") is None
+
+
+def test_addresses_expire_after_the_ttl(clock):
+    registry = DiscoveryRegistry(ttl=45)
+    registry.observe("a", "10.0.0.1", 5000)
+    registry.observe("b", "10.0.0.2", 5000)
+    clock.now += 30
+    registry.observe("a", "10.0.0.1", 5000)        # seen again: its TTL restarts
+    clock.now += 20
+    assert registry.evict_stale() == [("b", ("10.0.0.2", 5000))]
+    assert list(registry.snapshot()) == ["a"]
+    clock.now += 46
+    registry.evict_stale()
+    assert registry.snapshot() == {} and registry.live_addresses() == []
+
+
+def test_a_pong_keeps_an_address_alive(clock):
+    registry = DiscoveryRegistry(ttl=45)
+    registry.observe("a", "10.0.0.1", 5000)
+    clock.now += 40
+    _ping(registry, clock, "n1", 0.010)
+    clock.now += 40
+    assert registry.evict_stale() == []
+
+
+def test_unanswered_pings_are_forgotten(clock):
+    registry = DiscoveryRegistry()
+    registry.observe("a", "10.0.0.1", 5000)
+    registry.ping_sent("lost", "a", "10.0.0.1", 5000)
+    clock.now += PING_TIMEOUT + 1
+    registry.evict_stale()
+    assert registry.pong_received("lost") is None
+
+
+def test_announces_back_off_and_reset_on_a_new_address():
+    registry = DiscoveryRegistry()
+    intervals = [registry.next_announce_interval() for _ in range(FAST_ANNOUNCES + 8)]
+    assert intervals[:FAST_ANNOUNCES] == [ANNOUNCE_FAST] * FAST_ANNOUNCES
+    assert intervals[FAST_ANNOUNCES:FAST_ANNOUNCES + 3] == [ANNOUNCE_FAST * 2, ANNOUNCE_FAST * 4, ANNOUNCE_FAST * 8]
+    assert intervals[-1] == ANNOUNCE_SLOW
+
+    assert registry.observe("a", "10.0.0.1", 5000)
+    assert registry.next_announce_interval() == ANNOUNCE_FAST
+    registry.observe("a", "10.0.0.1", 5000)        # a known address is not a change
+    for _ in range(FAST_ANNOUNCES - 1):
+        registry.next_announce_interval()
+    assert registry.next_announce_interval() == ANNOUNCE_FAST * 2
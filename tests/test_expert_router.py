@@ -0,0 +1,82 @@
+import pytest
+
+pytest.importorskip("llama_cpp")
+from Everything_else.ai_council import EXPERT_MAP, FIELD_DESCRIPTIONS
+from Everything_else.expert_router import ExpertRouter
+
+
+FIELDS = {k: v for k, v in FIELD_DESCRIPTIONS.items() if k in EXPERT_MAP.values()}
+
+
+@pytest.fixture(scope="module")
+def router():
+    return ExpertRouter(FIELDS)
+
+
+CLEAR = [
+    ("How should I budget my salary and invest for retirement?", "jynx_expert_finance"),
+    ("My python script throws an exception when it queries the database", "jynx_expert_coding"),
+    ("I clicked a phishing link and now my password and wifi router may be hacked", "jynx_expert_cyber"),
+    ("I have had a fever and pain for three days, what medication should I take?", "jynx_expert_medical"),
+    ("My anxiety and panic attacks keep getting worse and I am burned out from stress",
+     "jynx_expert_mental_health"),
+]
+
+SPANNING = [
+    ("How will the election and new government policy move the stock market and inflation?",
+     {"jynx_expert_finance", "jynx_expert_politics"}),
+    ("I feel sad and lonely after the breakup and my anxiety and stress are overwhelming",
+     {"jynx_expert_emotion", "jynx_expert_mental_health"}),
+]
+
+AMBIGUOUS = [
+    "fever",                                # one known word, however clear
+    "I feel lost",                          # emotion or survival, equally
+    "the party",                            # people or politics
+    "Hello",
+    "What is the meaning of life?",
+]
+
+
+@pytest.mark.parametrize("prompt,expert", CLEAR)
+def test_clear_requests_go_straight_to_their_expert(router, prompt, expert):
+    picked, confidence = router.route(prompt)
+    assert picked and picked[0] == expert
+    assert confidence >= router.threshold
+
+
+@pytest.mark.parametrize("prompt,experts", SPANNING)
+def test_requests_spanning_fields_go_to_each_of_them(router, prompt, experts):
+    picked, confidence = router.route(prompt)
+    assert set(picked) == experts
+    assert confidence >= router.threshold
+
+
+def test_a_field_named_by_a_single_word_is_not_picked(router):
+    picked, _ = router.route("How will the stock market react to inflation and the election?")
+    assert picked == ["jynx_expert_finance"]
+
+
+def test_a_field_left_out_by_max_experts_counts_against_confidence():
+    narrow = ExpertRouter(FIELDS, max_experts=1)
+    picked, confidence = narrow.route(SPANNING[0][0])
+    assert picked == [] and confidence < narrow.threshold
+
+
+@pytest.mark.parametrize("prompt", AMBIGUOUS)
+def test_ambiguous_requests_defer_to_the_summarizer(router, prompt):
+    picked, confidence = router.route(prompt)
+    assert picked == []
+    assert confidence < router.threshold
+
+
+def test_more_known_terms_raise_confidence(router):
+    _, two = router.route("budget and salary")
+    _, four = router.route("budget, salary, mortgage and retirement")
+    assert 0 < two < four == 1.0
+
+
+def test_a_close_runner_up_lowers_confidence(router):
+    _, clear = router.route("my salary, budget and mortgage")
+    _, split = router.route("my salary, budget and python code")
+    assert split < clear
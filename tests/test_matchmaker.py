@@ -0,0 +1,138 @@
+import asyncio
+import json
+import socket
+import time
+import urllib.request
+
+from core.matchmaker import (
+    GhostMatchmaker, MatchStats, RoomStore, pack_rendezvous, read_frame, request_match, unpack_rendezvous, write_frame
+)
+
+
+def _peer(ghost_id):
+    return {"ghost_id": ghost_id, "ip": "10.0.0.1", "port": 1000}
+
+
+def test_second_join_matches_the_waiter():
+    async def scenario():
+        store = RoomStore(ttl=60, stats=MatchStats())
+        outcome, room = store.join("room", _peer("a"))
+        assert outcome == "wait" and len(store) == 1
+        outcome, partner = store.join("room", _peer("b"))
+        assert outcome == "match" and partner["ghost_id"] == "a"
+        assert room["partner"].result()["ghost_id"] == "b"
+        assert len(store) == 0 and store.stats.matches == 1
+
+    asyncio.run(scenario())
+
+
+def test_rejoin_by_the_same_peer_retires_the_old_waiter():
+    async def scenario():
+        store = RoomStore(ttl=60, stats=MatchStats())
+        _, first = store.join("room", _peer("a"))
+        outcome, second = store.join("room", _peer("a"))
+        assert outcome == "wait"
+        assert first["partner"].result() is None
+        assert not store.leave("room", first)      # the old waiter no longer owns the room
+        assert store.leave("room", second)
+
+    asyncio.run(scenario())
+
+
+def test_rooms_expire_after_their_ttl():
+    async def scenario():
+        store = RoomStore(ttl=60, stats=MatchStats())
+        _, old = store.join("old", _peer("a"))
+        _, fresh = store.join("fresh", _peer("b"))
+        old["created"] = time.monotonic() - 61
+        assert store.expire() == 1
+        assert old["partner"].result() is None
+        assert not fresh["partner"].done() and len(store) == 1
+
+    asyncio.run(scenario())
+
+
+def test_request_match_pairs_two_clients():
+    async def scenario():
+        server = GhostMatchmaker(host="127.0.0.1", port=0, stats_port=None)
+        await server.serve()
+        first = asyncio.ensure_future(request_match("127.0.0.1", "room", "a", port=server.port, timeout=5))
+        await asyncio.sleep(0.05)
+        second = await request_match("127.0.0.1", "room", "b", port=server.port, timeout=5)
+        assert second["ghost_id"] == "a"
+        assert (await first)["ghost_id"] == "b"
+        server._server.close()
+
+    asyncio.run(scenario())
+
+
+def test_connections_per_ip_are_capped():
+    async def scenario():
+        server = GhostMatchmaker(host="127.0.0.1", port=0, max_per_ip=1, stats_port=None)
+        await server.serve()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        await write_frame(writer, {"room_id": "held", "ghost_id": "a"})
+        assert (await read_frame(reader))["status"] == "waiting"
+
+        reader2, writer2 = await asyncio.open_connection("127.0.0.1", server.port)
+        assert (await read_frame(reader2))["status"] == "busy"
+        assert server.stats.rejected == 1
+        writer.close()
+        writer2.close()
+        server._server.close()
+
+    asyncio.run(scenario())
+
+
+def test_udp_rendezvous_introduces_both_sides():
+    async def scenario():
+        server = GhostMatchmaker(host="127.0.0.1", port=0, stats_port=None)
+        await server.serve()
+        socks = []
+        for _ in range(2):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("127.0.0.1", 0))
+            sock.settimeout(2)
+            socks.append(sock)
+        for ghost_id, sock in zip("ab", socks):
+            sock.sendto(pack_rendezvous({"op": "register", "room_id": "r", "ghost_id": ghost_id}),
+                        ("127.0.0.1", server.port))
+            await asyncio.sleep(0.05)
+        loop = asyncio.get_running_loop()
+        replies = [unpack_rendezvous(await loop.run_in_executor(None, sock.recv, 2048)) for sock in socks]
+        assert replies[0]["ghost_id"] == "b" and replies[0]["port"] == socks[1].getsockname()[1]
+        assert replies[1]["ghost_id"] == "a" and replies[1]["port"] == socks[0].getsockname()[1]
+        for sock in socks:
+            sock.close()
+        server._server.close()
+
+    asyncio.run(scenario())
+
+
+def test_stats_endpoint_reports_the_counters():
+    async def scenario():
+        server = GhostMatchmaker(host="127.0.0.1", port=0, stats_port=0)
+        await server.serve()
+        first = asyncio.ensure_future(request_match("127.0.0.1", "room", "a", port=server.port, timeout=5))
+        await asyncio.sleep(0.05)
+        await request_match("127.0.0.1", "room", "b", port=server.port, timeout=5)
+        await first
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        await write_frame(writer, {"room_id": "lonely", "ghost_id": "c"})
+        assert (await read_frame(reader))["status"] == "waiting"
+
+        url = f"http://127.0.0.1:{server.stats_port}/stats"
+        response = await asyncio.get_running_loop().run_in_executor(None, urllib.request.urlopen, url)
+        assert response.headers["Content-Type"] == "application/json"
+        stats = json.loads(response.read())
+        writer.close()
+        server._server.close()
+        server._stats_server.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["joins"] == 3 and stats["matches"] == 1 and stats["rejected"] == 0
+    assert stats["waiting_rooms"] == 1 and stats["open_connections"] == 1
+    assert stats["joins_per_sec"] > 0 and stats["uptime"] >= 0
+    latency = stats["match_latency_ms"]
+    assert latency["p50"] is not None and latency["p50"] <= latency["p95"] <= latency["p99"]
@@ -0,0 +1,117 @@
+import os
+import threading
+import weakref
+
+import pytest
+
+pytest.importorskip("llama_cpp")
+import Everything_else.model_registry as model_registry
+from conftest import FakeLlama
+from Everything_else.model_registry import ModelPool, ModelPreloader
+
+
+@pytest.fixture
+def weights(tmp_path, monkeypatch):
+    """Factory for weights files of a given size, with Llama swapped for the fake."""
+    monkeypatch.setattr(model_registry, "Llama", FakeLlama)
+
+    def make(name, size=1024):
+        path = tmp_path / f"{name}.gguf"
+        path.write_bytes(b"\0" * size)
+        return str(path)
+    return make
+
+
+def test_single_model_is_resident_by_default(weights):
+    if "JYNX_MAX_MODELS" not in os.environ:
+        assert model_registry.MAX_RESIDENT_MODELS == 1
+    pool = ModelPool()
+    first = pool.acquire(weights("a"))
+    pool.acquire(weights("b"))
+    assert pool.stats()["resident"] == ["b.gguf"] and pool.evictions == 1
+    assert pool.acquire(weights("a")) is not first
+
+
+def test_eviction_releases_the_model_once_no_one_holds_it(weights):
+    pool = ModelPool()
+    evicted = weakref.ref(pool.acquire(weights("a")))
+    pool.acquire(weights("b"))
+    assert evicted() is None
+
+
+def test_hits_reuse_the_instance_and_refresh_its_recency(weights):
+    pool = ModelPool(max_models=2)
+    a, b, c = weights("a"), weights("b"), weights("c")
+    llm_a = pool.acquire(a)
+    pool.acquire(b)
+    assert pool.acquire(a) is llm_a and pool.hits == 1
+    pool.acquire(c)                         # b is now the least recently used
+    assert pool.stats()["resident"] == ["a.gguf", "c.gguf"]
+
+
+def test_ram_budget_evicts_until_the_newcomer_fits(weights):
+    pool = ModelPool(max_models=4, ram_budget=2500)
+    pool.acquire(weights("a", 1000))
+    pool.acquire(weights("b", 1000))
+    pool.acquire(weights("c", 1000))
+    assert pool.stats()["resident"] == ["b.gguf", "c.gguf"] and pool.used() == 2000
+
+
+def test_larger_context_reloads_and_keeps_the_larger_size(weights):
+    pool = ModelPool(max_models=2)
+    path = weights("a")
+    small = pool.acquire(path, n_ctx=1024)
+    large = pool.acquire(path, n_ctx=4096)
+    assert large is not small and large.n_ctx() == 4096
+    assert pool.acquire(path, n_ctx=2048) is large
+
+
+def test_concurrent_callers_share_one_load(weights, monkeypatch):
+    release = threading.Event()
+
+    class SlowLlama(FakeLlama):
+        def __init__(self, *args, **kwargs):
+            release.wait(5)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(model_registry, "Llama", SlowLlama)
+    pool, path, results = ModelPool(), weights("a"), []
+    threads = [threading.Thread(target=lambda: results.append(pool.acquire(path))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert pool.loads == 1 and len({id(r) for r in results}) == 1
+
+
+def test_preloader_never_pushes_out_the_kept_model(weights, monkeypatch):
+    monkeypatch.setattr(model_registry, "resolve_model",
+                        lambda model_id: ({"model_path": weights(model_id), "clip_path": None}, {}, None))
+    preloader = ModelPreloader(pool=ModelPool(max_models=1))
+    preloaded = []
+    monkeypatch.setattr(preloader, "preload", lambda model_id: preloaded.append(model_id))
+    preloader.ahead(["expert_a", "expert_b"])
+    assert preloaded == []                  # the default single slot: nothing to load into
+
+    preloader.pool = ModelPool(max_models=2)
+    preloader.ahead(["expert_a", "expert_b"])
+    assert preloaded == ["expert_a"]
+
+    preloaded.clear()
+    preloader.pool = ModelPool(max_models=3)
+    preloader.ahead(["expert_a", "expert_b", "expert_c"])
+    assert preloaded == ["expert_a", "expert_b"]
+
+
+def test_preloaded_expert_is_a_hit_next_to_the_model_in_use(weights, monkeypatch):
+    monkeypatch.setattr(model_registry, "resolve_model",
+                        lambda model_id: ({"model_path": weights(model_id), "clip_path": None}, {}, None))
+    pool = ModelPool(max_models=2)
+    preloader = ModelPreloader(pool=pool)
+    monkeypatch.setattr(preloader, "preload", lambda model_id: pool.acquire(weights(model_id)))
+    summarizer = pool.acquire(weights("summarizer"))
+    preloader.ahead(["expert_a", "expert_b"])
+    assert pool.stats()["resident"] == ["summarizer.gguf", "expert_a.gguf"]
+    pool.acquire(weights("expert_a"))
+    assert pool.hits == 1 and pool.acquire(weights("summarizer")) is summarizer
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import core.network_manager as network_manager
+from core.matchmaker import GhostMatchmaker
+from core.network_manager import GhostNetwork
+
+
+@pytest.fixture
+def matchmaker():
+    """A matchmaker on its own loop thread; yields its "host:port"."""
+    loop = asyncio.new_event_loop()
+    server = GhostMatchmaker(host="127.0.0.1", port=0, stats_port=None)
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.serve(), loop).result(timeout=5)
+    yield f"127.0.0.1:{server.port}"
+
+    async def shutdown():
+        server._server.close()
+        server._udp.close()
+        for task in asyncio.all_tasks(loop) - {asyncio.current_task()}:
+            task.cancel()
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def internet_nodes(ghost_nodes, matchmaker, monkeypatch):
+    """Two nodes that can only find each other through the matchmaker."""
+    monkeypatch.setattr(network_manager, "MATCHMAKER", matchmaker)
+    monkeypatch.setattr(GhostNetwork, "_handle_discovery", lambda self, data, addr: None)
+    return ghost_nodes("nat_a"), ghost_nodes("nat_b")
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _on_loop(node, fn, *args):
+    async def call():
+        return fn(*args)
+    return node.submit(call()).result(timeout=5)
+
+
+def test_punched_path_is_kept_after_the_handshake(internet_nodes):
+    a, b = internet_nodes
+    target = {"alias": "nat_b", "ghost_id": b.ghost_id, "public_key": b.sync_pub_hex}
+
+    session = a.submit(a.get_session(target)).result(timeout=15)
+
+    assert session.addr == ("127.0.0.1", b.port)
+    assert a.punched_paths[b.ghost_id] == ("127.0.0.1", b.port)
+    assert b.ghost_id in a._keepalives
+
+
+def test_spoofed_rendezvous_answers_are_ignored(internet_nodes):
+    a, b = internet_nodes
+    room_id = "f" * 16
+    spoof = {"op": "peer", "room_id": room_id, "ghost_id": b.ghost_id, "ip": "203.0.113.9", "port": 4000}
+
+    _on_loop(a, a._on_rendezvous, dict(spoof, nonce="guess"))
+    assert room_id not in a._path_tasks
+
+    _on_loop(a, a._registration, room_id, b.ghost_id)
+    nonce = a._registrations[room_id][0]
+    _on_loop(a, a._on_rendezvous, dict(spoof, nonce=nonce, ghost_id="someone-else"))
+    assert room_id not in a._path_tasks
+
+
+def test_punches_for_unknown_rooms_get_no_answer(internet_nodes):
+    a, b = internet_nodes
+    sent = []
+    stranger = ("203.0.113.9", 4000)
+    a.sender.send = lambda frame, addr, *rest: sent.append(addr)
+    _on_loop(a, a._on_punch, {"from": b.ghost_id, "room": "not-ours", "ack": False}, stranger)
+    assert stranger not in sent
+
+
+def test_punched_path_expires_when_the_peer_goes_quiet(internet_nodes, monkeypatch):
+    a, b = internet_nodes
+    monkeypatch.setattr(network_manager, "KEEPALIVE_INTERVAL", 0.05)
+    monkeypatch.setattr(network_manager, "ACK_TIMEOUT", 0.2)
+    target = {"alias": "nat_b", "ghost_id": b.ghost_id, "public_key": b.sync_pub_hex}
+    a.submit(a.get_session(target)).result(timeout=15)
+    time.sleep(0.3)
+    assert b.ghost_id in a.punched_paths      # answered keepalives keep it
+
+    b.stop()
+    assert _wait_for(lambda: b.ghost_id not in a.punched_paths)
+    assert b.ghost_id not in a._keepalives
+
+
+def test_failed_session_drops_the_path(internet_nodes):
+    a, b = internet_nodes
+    addr = ("127.0.0.1", 9)
+    _on_loop(a, a.punched_paths.__setitem__, b.ghost_id, addr)
+    target = {"alias": "nat_b", "ghost_id": b.ghost_id, "public_key": b.sync_pub_hex}
+    a.registry = type(a.registry)()
+
+    with pytest.raises(ConnectionError):
+        a.submit(a.get_session(target)).result(timeout=15)
+    assert b.ghost_id not in a.punched_paths
+
+
+def test_lan_discovery_wins_over_a_punched_path(internet_nodes):
+    a, b = internet_nodes
+    _on_loop(a, a.punched_paths.__setitem__, b.ghost_id, ("198.51.100.7", 5555))
+    a.registry.observe(b.ghost_id, "127.0.0.1", b.port)
+    path = a.submit(a.resolve_path({"ghost_id": b.ghost_id, "public_key": b.sync_pub_hex})).result(timeout=5)
+    assert path == ("127.0.0.1", b.port)
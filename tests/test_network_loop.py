@@ -0,0 +1,51 @@
+import asyncio
+import os
+
+from conftest import target_of
+from core.network_manager import (
+    FRAME_CHUNK, pack_bundle, pack_frame, unpack_bundle, unpack_frame
+)
+
+
+def test_frame_round_trip():
+    frame = pack_frame(FRAME_CHUNK, {"tid": "abc", "seq": 3}, b"payload")
+    assert unpack_frame(frame) == (FRAME_CHUNK, {"tid": "abc", "seq": 3}, b"payload")
+
+
+def test_unpack_frame_rejects_foreign_datagrams():
+    assert unpack_frame(b"PUNCH") is None
+    assert unpack_frame(b"XX" + pack_frame(FRAME_CHUNK, {})[2:]) is None
+    assert unpack_frame(b"GDC\x00\x05{bad}") is None
+
+
+def test_bundle_round_trip():
+    files = [("a.enc", b"alpha"), ("b.enc", b""), ("c.enc", os.urandom(300))]
+    assert list(unpack_bundle(pack_bundle(files))) == files
+
+
+def test_submit_runs_on_the_network_loop(ghost_nodes):
+    node = ghost_nodes("loop_a")
+
+    async def which_loop():
+        return asyncio.get_running_loop()
+
+    assert node.submit(which_loop()).result(timeout=5) is node.loop
+    assert node.port != 0
+
+
+def test_loopback_sync(ghost_nodes, tmp_path):
+    sender, receiver = ghost_nodes("sync_a"), ghost_nodes("sync_b")
+    paths, contents = [], {}
+    for name, size in (("small.enc", 2000), ("tiny.enc", 10), ("big.enc", 300 * 1024)):
+        data = os.urandom(size)
+        path = tmp_path / name
+        path.write_bytes(data)
+        paths.append(str(path))
+        contents[name] = data
+
+    stats = sender.sync_files([target_of("sync_b", receiver)], paths).result(timeout=30)
+
+    assert stats["ok"] == 3 and not stats["failed"]
+    for name, data in contents.items():
+        with open(os.path.join(receiver.receive_dir, name), "rb") as f:
+            assert f.read() == data
@@ -0,0 +1,94 @@
+import pytest
+
+pytest.importorskip("llama_cpp")
+import Everything_else.ai_council as ai_council
+import Everything_else.model_registry as model_registry
+from conftest import FakeLlama
+from Everything_else.model_registry import ConfigRegistry, ModelPool, PrefixCache, _text_prompt
+
+KEY = ("weights.gguf", None)
+P, S, M = "p" * 40, "s" * 40, "m" * 40
+
+
+def test_persona_follows_the_shared_start():
+    assert _text_prompt("Be brief.", "profile|request") == "User: Be brief.\n\nprofile|request\nAssistant:"
+    assert _text_prompt("Be brief.", "profile|request", "profile|") == "User: profile|Be brief.\n\nrequest\nAssistant:"
+    assert _text_prompt(None, "profile|request", "profile|") == "User: profile|request\nAssistant:"
+
+
+def test_live_state_reaching_further_beats_a_shorter_snapshot():
+    llm, cache = FakeLlama(), PrefixCache()
+    cache.prime(llm, KEY, P + "tail", [P])
+    llm(P + S + "!")                                    # the completion leaves P + S evaluated
+
+    before = llm.evaluated
+    cache.prime(llm, KEY, P + S + M + "tail", [P, P + S + M])
+    assert llm.loads == 0
+    assert llm.evaluated - before == len(M)
+    assert list(llm._input_ids) == llm.tokenize((P + S + M).encode())
+    assert cache.stats()["partial"] == 1
+
+
+def test_snapshot_reaching_further_beats_the_live_state():
+    llm, cache = FakeLlama(), PrefixCache()
+    cache.prime(llm, KEY, P + S + "tail", [P, P + S])
+    llm("something else entirely")
+
+    before = llm.evaluated
+    cache.prime(llm, KEY, P + S + "other tail", [P, P + S])
+    assert llm.loads == 1 and llm.evaluated == before
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["tokens_saved"] == len(P + S)
+
+
+def test_prefixes_too_short_to_snapshot_are_left_alone():
+    llm, cache = FakeLlama(), PrefixCache()
+    cache.prime(llm, KEY, "short prefix, long prompt", ["short"])
+    assert llm.evaluated == 0 and cache.stats()["entries"] == 0
+
+
+# --- Council stages ---
+
+MODELS = """
+models:
+  jynx_summarizer: {{path: "{path}", persona: "PERSONA-summarizer"}}
+  jynx_expert_finance: {{path: "{path}", persona: "PERSONA-finance"}}
+  jynx_expert_coding: {{path: "{path}", persona: "PERSONA-coding"}}
+"""
+
+
+@pytest.fixture
+def council(tmp_path, monkeypatch):
+    """The council on one fake model that every stage shares, routed by the summarizer."""
+    weights = tmp_path / "base.gguf"
+    weights.write_bytes(b"\0" * 64)
+    models = tmp_path / "models.yaml"
+    models.write_text(MODELS.format(path=weights))
+    cache, pool = PrefixCache(), ModelPool(max_models=1)
+    monkeypatch.setattr(model_registry, "CONFIGS", ConfigRegistry(str(models)))
+    monkeypatch.setattr(model_registry, "Llama", FakeLlama)
+    monkeypatch.setattr(model_registry, "MODEL_POOL", pool)
+    monkeypatch.setattr(model_registry, "PREFIX_CACHE", cache)
+    monkeypatch.setattr(ai_council, "PREFIX_CACHE", cache)
+    monkeypatch.setattr(ai_council.MODEL_PRELOADER, "ahead", lambda *args, **kwargs: None)
+    monkeypatch.setattr(ai_council.ROUTER, "route", lambda prompt: ([], 0.0))
+    monkeypatch.setattr(FakeLlama, "reply", "***SUMMARY*** savings ***EXPERTS*** Finance, Coding")
+    return lambda: pool.acquire(str(weights)), cache
+
+
+def test_each_stage_extends_the_last_and_only_evaluates_what_is_new(council):
+    get_llm, cache = council
+    profile = "\n[OPERATOR NEURAL MAP]\nCallsign: op\n" + "Goal: retire early\n" * 20
+    events = list(ai_council._run_council("Plan my savings and the script for it", None, profile, parallel=False))
+    assert events[-1] == ("done", "")
+
+    prompts = get_llm().prompts
+    assert len(prompts) == 4                    # summarizer, two experts, verdict
+    heads = [text[:text.index("PERSONA-")] for text, _ in prompts]
+    for i, head in enumerate(heads):
+        assert profile in head
+        assert all(text.startswith(head) for text, _ in prompts[i + 1:])
+
+    for (text, evaluated), previous in zip(prompts[1:], heads):
+        assert evaluated <= len(text) - len(previous)
+    assert cache.stats()["tokens_saved"] >= 3 * len(profile)
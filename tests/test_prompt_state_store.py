@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+pytest.importorskip("llama_cpp")
+from cryptography.fernet import Fernet
+
+from conftest import FakeLlama
+from Everything_else.model_registry import PrefixCache, PromptStateStore
+
+PREAMBLE = "User: \n[OPERATOR NEURAL MAP]\nCallsign: op\n" + "Goal: retire early\n" * 4
+
+
+@pytest.fixture
+def weights_key(tmp_path):
+    path = tmp_path / "base.gguf"
+    path.write_bytes(os.urandom(4096))
+    return str(path), None
+
+
+def _evaluated(text):
+    llm = FakeLlama()
+    llm.eval(llm.tokenize(text.encode()))
+    return llm, llm.save_state()
+
+
+def _flush(store):
+    store._writer.submit(lambda: None).result(timeout=5)
+
+
+def test_saved_state_loads_back_for_the_same_model_and_prefix(tmp_path, weights_key):
+    store = PromptStateStore(Fernet(Fernet.generate_key()), str(tmp_path / "states"))
+    llm, state = _evaluated(PREAMBLE)
+    tokens = llm.tokenize(PREAMBLE.encode())
+    store.save(llm, weights_key, tokens, state)
+    _flush(store)
+
+    loaded = store.load(FakeLlama(), weights_key, tokens)
+    assert loaded.n_tokens == len(tokens)
+    assert list(loaded.input_ids[:len(tokens)]) == tokens
+    assert store.load(FakeLlama(), weights_key, tokens[:-1]) is None
+    assert store.stats() == {"hits": 1, "misses": 1, "writes": 1}
+
+
+def test_states_are_keyed_by_the_model_they_came_from(tmp_path, weights_key):
+    store = PromptStateStore(Fernet(Fernet.generate_key()), str(tmp_path / "states"))
+    llm, state = _evaluated(PREAMBLE)
+    tokens = llm.tokenize(PREAMBLE.encode())
+    store.save(llm, weights_key, tokens, state)
+    _flush(store)
+
+    other = tmp_path / "other.gguf"
+    other.write_bytes(os.urandom(4096))
+    assert store.load(FakeLlama(), (str(other), None), tokens) is None
+    assert store.load(FakeLlama(n_ctx=8192), weights_key, tokens) is None
+
+
+def test_files_under_another_key_are_dropped(tmp_path, weights_key):
+    directory = str(tmp_path / "states")
+    llm, state = _evaluated(PREAMBLE)
+    tokens = llm.tokenize(PREAMBLE.encode())
+    writer = PromptStateStore(Fernet(Fernet.generate_key()), directory)
+    writer.save(llm, weights_key, tokens, state)
+    _flush(writer)
+
+    reader = PromptStateStore(Fernet(Fernet.generate_key()), directory)
+    assert reader.load(FakeLlama(), weights_key, tokens) is None
+    assert os.listdir(directory) == []
+
+
+def test_least_recently_used_states_go_over_the_cap(tmp_path, weights_key):
+    store = PromptStateStore(Fernet(Fernet.generate_key()), str(tmp_path / "states"))
+    texts = [PREAMBLE + f"variant {i}\n" for i in range(3)]
+    for i, text in enumerate(texts):
+        llm, state = _evaluated(text)
+        store.save(llm, weights_key, llm.tokenize(text.encode()), state)
+        _flush(store)
+        path = store._path(llm, weights_key, llm.tokenize(text.encode()))
+        os.utime(path, (1000 + i, 1000 + i))
+    size = os.path.getsize(path)
+
+    store.capacity = 2 * size
+    store._evict()
+    first = FakeLlama()
+    assert store.load(first, weights_key, first.tokenize(texts[0].encode())) is None
+    assert all(store.load(FakeLlama(), weights_key, FakeLlama().tokenize(t.encode())) for t in texts[1:])
+
+
+def test_persisted_preamble_is_not_evaluated_again_after_a_restart(tmp_path, weights_key):
+    fernet = Fernet(Fernet.generate_key())
+    prompt = PREAMBLE + "User Request: hello\nAssistant:"
+
+    cache = PrefixCache()
+    cache.store = PromptStateStore(fernet, str(tmp_path / "states"))
+    cache.prime(FakeLlama(), weights_key, prompt, [PREAMBLE], PREAMBLE)
+    _flush(cache.store)
+
+    restarted = PrefixCache()
+    restarted.store = PromptStateStore(fernet, str(tmp_path / "states"))
+    llm = FakeLlama()
+    restarted.prime(llm, weights_key, prompt, [PREAMBLE], PREAMBLE)
+    assert llm.evaluated == 0 and llm.n_tokens == len(PREAMBLE)
+    assert restarted.stats()["disk"]["hits"] == 1
@@ -0,0 +1,183 @@
+import asyncio
+import os
+
+import pytest
+
+import core.secure_channel as secure_channel
+from conftest import make_node, trust
+from core.network_manager import FRAME_ACK, _SendWindow, pack_frame, unpack_frame
+from core.secure_channel import (
+    MAX_EPOCH_SKIP, ReplayWindow, SecureChannel, new_ephemeral, sign, transcript_hash
+)
+
+
+def _pair():
+    send_key, recv_key = os.urandom(32), os.urandom(32)
+    return SecureChannel("sid", "b", send_key, recv_key), SecureChannel("sid", "a", recv_key, send_key)
+
+
+# --- ReplayWindow ---
+
+def test_replay_window_accepts_each_counter_once():
+    window = ReplayWindow(size=8)
+    assert window.accept(0) and window.accept(2) and window.accept(1)
+    assert not window.accept(1)
+    assert not window.accept(2)
+
+
+def test_replay_window_takes_late_frames_inside_the_window_only():
+    window = ReplayWindow(size=8)
+    assert window.accept(10)
+    assert window.accept(3)             # 7 behind the top: still inside
+    assert not window.accept(2)         # 8 behind: too old to tell
+    assert window.seen(2)
+
+
+def test_replay_window_survives_a_jump_past_its_size():
+    window = ReplayWindow(size=8)
+    window.accept(1)
+    assert window.accept(100)
+    assert not window.seen(99)
+    assert window.seen(1) and window.seen(100)
+
+
+# --- SecureChannel ---
+
+def test_seal_open_round_trip_and_replay_rejection():
+    a, b = _pair()
+    epoch, counter, ciphertext = a.seal(b"hello")
+    assert b.open(epoch, counter, ciphertext) == b"hello"
+    assert b.open(epoch, counter, ciphertext) is None
+    assert b.rejected == 1
+
+
+def test_tampered_and_misaddressed_frames_are_rejected():
+    a, b = _pair()
+    epoch, counter, ciphertext = a.seal(b"hello")
+    assert b.open(epoch, counter, ciphertext[:-1] + bytes([ciphertext[-1] ^ 1])) is None
+    assert b.open(epoch, counter + 1, ciphertext) is None
+    other = SecureChannel("other-sid", "a", a._send.key, b._recv.key)
+    assert other.open(epoch, counter, ciphertext) is None
+
+
+def _rotate(channel):
+    channel._send.counter = secure_channel.REKEY_AFTER_FRAMES
+
+
+def test_receiver_follows_a_rekey_and_keeps_stragglers_of_the_old_epoch():
+    a, b = _pair()
+    straggler = a.seal(b"old")
+    _rotate(a)
+    fresh = a.seal(b"new")
+    assert fresh[0] == 1
+    assert b.open(*fresh) == b"new"
+    assert b.epochs[1] == 1
+    assert b.open(*straggler) == b"old"
+
+
+def test_receiver_catches_up_on_several_rotations():
+    a, b = _pair()
+    for _ in range(MAX_EPOCH_SKIP):
+        _rotate(a)
+        a.seal(b"lost")
+    frame = a.seal(b"after")
+    assert frame[0] == MAX_EPOCH_SKIP
+    assert b.open(*frame) == b"after"
+
+
+def test_epochs_beyond_the_skip_limit_are_refused():
+    a, b = _pair()
+    for _ in range(MAX_EPOCH_SKIP + 1):
+        _rotate(a)
+        a.seal(b"lost")
+    assert b.open(*a.seal(b"too far")) is None
+
+
+def test_retired_epoch_closes_after_the_grace_window(monkeypatch):
+    a, b = _pair()
+    straggler = a.seal(b"old")
+    _rotate(a)
+    assert b.open(*a.seal(b"new")) == b"new"
+    monkeypatch.setattr(secure_channel, "REKEY_GRACE", -1)
+    assert b.open(*straggler) is None
+
+
+# --- Handshake vetting ---
+
+@pytest.fixture
+def handshake_nodes(tmp_path):
+    peers = {}
+    responder = make_node(str(tmp_path), "responder", peers)
+    initiator = make_node(str(tmp_path), "initiator", peers)
+    trust(peers, "initiator", initiator)
+    trust(peers, "responder", responder)
+    yield responder, initiator, peers
+    responder.stop()
+    initiator.stop()
+
+
+def _hello(node, sid="s1"):
+    eph_priv, eph_hex = new_ephemeral()
+    signature = sign(node.identity_priv_key, transcript_hash(sid, node.ghost_id, eph_hex))
+    return {"from": node.ghost_id, "sid": sid, "eph": eph_hex, "sig": signature, "codecs": ["zlib"]}, eph_priv, eph_hex
+
+
+def test_handshake_completes_between_trusted_peers(handshake_nodes):
+    responder, initiator, _ = handshake_nodes
+    hello, eph_priv, eph_hex = _hello(initiator)
+    channel = responder._accept_handshake(hello)
+    assert channel is not None and channel.peer_id == initiator.ghost_id
+
+    _, reply, _ = unpack_frame(channel.hello_reply)
+    mine = initiator._finish_handshake("s1", eph_priv, eph_hex, reply, responder.sync_pub_hex, responder.ghost_id)
+    assert channel.open(*mine.seal(b"ping")) == b"ping"
+
+
+def test_handshake_from_an_untrusted_identity_is_rejected(handshake_nodes):
+    responder, initiator, peers = handshake_nodes
+    del peers["initiator"]
+    responder._trusted = (0.0, {})
+    assert responder._accept_handshake(_hello(initiator)[0]) is None
+
+
+def test_handshake_with_a_bad_signature_is_rejected(handshake_nodes):
+    responder, initiator, _ = handshake_nodes
+    hello = _hello(initiator)[0]
+    hello["eph"] = new_ephemeral()[1]           # signature no longer covers the ephemeral key
+    assert responder._accept_handshake(hello) is None
+    assert responder._accept_handshake(dict(_hello(initiator)[0], sig="00" * 64)) is None
+
+
+def test_handshake_reply_from_the_wrong_identity_is_rejected(handshake_nodes):
+    responder, initiator, _ = handshake_nodes
+    hello, eph_priv, eph_hex = _hello(initiator)
+    _, reply, _ = unpack_frame(responder._accept_handshake(hello).hello_reply)
+    with pytest.raises(ConnectionError):
+        initiator._finish_handshake("s1", eph_priv, eph_hex, reply, responder.sync_pub_hex, "f" * 64)
+    reply["sig"] = "00" * 64
+    with pytest.raises(ConnectionError):
+        initiator._finish_handshake("s1", eph_priv, eph_hex, reply, responder.sync_pub_hex, responder.ghost_id)
+
+
+def test_unsealed_acks_only_answer_handshakes_and_pings(handshake_nodes):
+    node = handshake_nodes[0]
+    channel, other = _pair()
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        fin, hello = loop.create_future(), loop.create_future()
+        node._ack_waiters.update({"fin": (fin, channel), "sid": (hello, None)})
+        window = node._windows["fin"] = _SendWindow(channel)
+
+        for forged in ({"tid": "fin", "done": True}, {"tid": "fin", "rx": 64}):
+            await node.handle_incoming_udp(pack_frame(FRAME_ACK, forged), ("203.0.113.9", 4000))
+        node._on_ack({"tid": "fin", "done": True}, other)       # sealed, but by someone else
+        node._on_ack({"tid": "fin", "rx": 64}, other)
+        assert not fin.done() and window.received == 0
+
+        node._on_ack({"tid": "fin", "rx": 64}, channel)
+        node._on_ack({"tid": "fin", "done": True}, channel)
+        await node.handle_incoming_udp(pack_frame(FRAME_ACK, {"tid": "sid", "done": True}), ("127.0.0.1", 4000))
+        return fin.done(), window.received, hello.done()
+
+    assert asyncio.run(scenario()) == (True, 64, True)
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import time
+
+from core.staging import STAGING_SUFFIX, StagedFile, atomic_write, sweep_staging
+
+
+def test_verified_file_replaces_the_live_one(tmp_path):
+    final = tmp_path / "live" / "project.enc"
+    final.parent.mkdir()
+    final.write_bytes(b"old version")
+
+    staged = StagedFile(str(tmp_path / "staging"), "project")
+    staged.write(b"new ")
+    staged.write(b"version")
+    assert final.read_bytes() == b"old version"         # nothing visible until commit
+    assert staged.finish(hashlib.sha256(b"new version").hexdigest())
+    staged.commit(str(final))
+
+    assert final.read_bytes() == b"new version"
+    assert not os.path.exists(staged.path)
+
+
+def test_hash_mismatch_discards_and_leaves_the_live_file(tmp_path):
+    final = tmp_path / "project.enc"
+    final.write_bytes(b"good")
+    staged = StagedFile(str(tmp_path / "staging"), "project")
+    staged.write(b"corrupt")
+    assert not staged.finish(hashlib.sha256(b"expected").hexdigest())
+    assert not os.path.exists(staged.path)
+    assert final.read_bytes() == b"good"
+
+
+def test_atomic_write_leaves_no_partial_files(tmp_path):
+    staging = tmp_path / "staging"
+    atomic_write(str(tmp_path / "member.enc"), b"data", str(staging))
+    assert (tmp_path / "member.enc").read_bytes() == b"data"
+    assert not [p for p in os.listdir(staging) if p.endswith(STAGING_SUFFIX)]
+
+
+def test_sweep_removes_only_stale_partials(tmp_path):
+    stale = tmp_path / ("old" + STAGING_SUFFIX)
+    fresh = tmp_path / ("new" + STAGING_SUFFIX)
+    other = tmp_path / "keep.enc"
+    for path in (stale, fresh, other):
+        path.write_bytes(b"x")
+    long_ago = time.time() - 48 * 3600
+    os.utime(stale, (long_ago, long_ago))
+    os.utime(other, (long_ago, long_ago))
+
+    assert sweep_staging(str(tmp_path)) == 1
+    assert not stale.exists() and fresh.exists() and other.exists()
+    assert sweep_staging(str(tmp_path / "missing")) == 0
@@ -0,0 +1,88 @@
+import hashlib
+import os
+
+import pytest
+
+import core.network_manager as network_manager
+from conftest import target_of
+from core.network_manager import CHUNK_SIZE, describe_file, piece_layout
+from core.sync_catalog import SyncCatalog
+
+
+def _with_catalog(node, root):
+    node.catalog = SyncCatalog(node.username, node.ghost_id, path=os.path.join(root, "catalog.json"), root=root)
+    return node
+
+
+def _spawn(ghost_nodes, tmp_path, name):
+    root = str(tmp_path / f"{name}_home")
+    node = ghost_nodes(name, receive_dir=os.path.join(root, "projects", name))
+    os.makedirs(node.receive_dir, exist_ok=True)
+    return _with_catalog(node, root)
+
+
+def test_file_on_two_holders_is_swarmed_from_both(ghost_nodes, tmp_path):
+    puller = _spawn(ghost_nodes, tmp_path, "puller")
+    ghost_nodes.peers["puller"]["permissions"]["projects"] = ["plan.enc"]
+    data = os.urandom(4 * 1024 * 1024)
+    holders = {}
+    for name in ("holder_a", "holder_b"):
+        node = holders[name] = _spawn(ghost_nodes, tmp_path, name)
+        with open(os.path.join(node.receive_dir, "plan.enc"), "wb") as f:
+            f.write(data)
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert piece_layout(len(data))[1] > 2
+
+    # The catalogs are what tell the puller who else holds the same content
+    for name, node in holders.items():
+        puller.fetch_catalog(target_of(name, node)).result(timeout=15)
+    assert puller.catalog.pullable(holders["holder_a"].ghost_id) == [("projects/plan.enc", sha256)]
+    sources = puller.catalog.holders(sha256)
+    assert sources == sorted(node.ghost_id for node in holders.values())
+
+    targets = [target_of(name, node) for name, node in holders.items() if node.ghost_id in sources]
+    stats = puller.swarm_download(sha256, "plan.enc", targets).result(timeout=60)
+
+    assert set(stats["sources"]) == set(holders)
+    assert stats["bad_pieces"] == 0
+    with open(os.path.join(puller.receive_dir, "plan.enc"), "rb") as f:
+        assert f.read() == data
+
+
+def test_pieces_larger_than_the_default_are_served(ghost_nodes, tmp_path, monkeypatch):
+    # Few, small pieces make a 4 MB file need the oversized pieces multi-GB files get
+    monkeypatch.setattr(network_manager, "SWARM_PIECE_CHUNKS", 4)
+    monkeypatch.setattr(network_manager, "SWARM_MAX_PIECES", 2)
+    puller = _spawn(ghost_nodes, tmp_path, "puller")
+    ghost_nodes.peers["puller"]["permissions"]["projects"] = ["plan.enc"]
+    holder = _spawn(ghost_nodes, tmp_path, "holder")
+    data = os.urandom(4 * 1024 * 1024)
+    with open(os.path.join(holder.receive_dir, "plan.enc"), "wb") as f:
+        f.write(data)
+    assert piece_layout(len(data))[0] > 4 * 16
+
+    stats = puller.swarm_download(hashlib.sha256(data).hexdigest(), "plan.enc",
+                                  [target_of("holder", holder)]).result(timeout=60)
+
+    assert stats["sources"] == {"holder": 2} and stats["bad_pieces"] == 0
+    with open(os.path.join(puller.receive_dir, "plan.enc"), "rb") as f:
+        assert f.read() == data
+
+
+@pytest.mark.parametrize("chunks", [0, 1, 64, 64 * 3 + 5])
+def test_describe_file_hashes_pieces_in_blocks(tmp_path, chunks):
+    data = os.urandom(chunks * CHUNK_SIZE + (100 if chunks % 2 else 0))
+    path = tmp_path / "plan.enc"
+    path.write_bytes(data)
+    piece_bytes = piece_layout(len(data))[0] * CHUNK_SIZE
+    pieces = [hashlib.sha256(data[i:i + piece_bytes]).hexdigest()[:32] for i in range(0, max(len(data), 1), piece_bytes)]
+    assert describe_file(str(path)) == {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data), "pieces": pieces}
+
+
+def test_holders_ignore_deleted_and_different_content(tmp_path):
+    catalog = SyncCatalog("me", "node", path=str(tmp_path / "c.json"), root=str(tmp_path))
+    entry = {"id": "projects/x.enc", "clock": {"p": 1}, "sha256": "aa", "deleted": False}
+    catalog.apply_remote("p1", {"changes": [entry], "next": 1, "scope": "s"})
+    catalog.apply_remote("p2", {"changes": [dict(entry, sha256=None, deleted=True)], "next": 1, "scope": "s"})
+    catalog.apply_remote("p3", {"changes": [dict(entry, sha256="bb")], "next": 1, "scope": "s"})
+    assert catalog.holders("aa") == ["p1"]
@@ -0,0 +1,169 @@
+import hashlib
+import os
+
+from conftest import target_of
+from core.sync_catalog import (
+    CONFLICT, IN_SYNC, LOCAL_NEWER, LOCAL_ONLY, PEER_NEWER, PEER_ONLY, SyncCatalog, clock_compare, clock_merge
+)
+
+SHARED = {"projects": ["plan"], "inventory": ["stock.csv"]}
+
+
+def _catalog(tmp_path, name="me", node_id="n1"):
+    root = tmp_path / f"{name}_root"
+    (root / "projects" / name).mkdir(parents=True, exist_ok=True)
+    return SyncCatalog(name, node_id, path=str(root / "catalog.json"), root=str(root))
+
+
+def _write(catalog, file_id, data):
+    folder, name = file_id.split("/")
+    base = os.path.join(catalog.root, folder, catalog.username)
+    os.makedirs(base, exist_ok=True)
+    with open(os.path.join(base, name), "wb") as f:
+        f.write(data)
+
+
+# --- Vector clocks ---
+
+def test_clock_compare_orders_and_detects_concurrency():
+    assert clock_compare({"a": 1}, {"a": 1}) == "equal"
+    assert clock_compare({}, {}) == "equal"
+    assert clock_compare({"a": 1}, {"a": 2}) == "before"
+    assert clock_compare({"a": 2, "b": 1}, {"a": 2}) == "after"
+    assert clock_compare({"a": 2}, {"a": 1, "b": 1}) == "concurrent"
+
+
+def test_clock_merge_takes_the_pointwise_maximum():
+    assert clock_merge({"a": 3, "b": 1}, {"b": 2, "c": 1}) == {"a": 3, "b": 2, "c": 1}
+    merged = clock_merge({"a": 1}, {"b": 1})
+    assert clock_compare(merged, {"a": 1}) == "after" and clock_compare(merged, {"b": 1}) == "after"
+
+
+# --- Change feed ---
+
+def test_refresh_versions_edits_and_deletions(tmp_path):
+    catalog = _catalog(tmp_path)
+    _write(catalog, "projects/plan.enc", b"v1")
+    assert catalog.refresh(force=True) == 1
+    assert catalog.refresh(force=True) == 0             # nothing moved: no rehash, no new version
+    _write(catalog, "projects/plan.enc", b"v2")
+    os.utime(os.path.join(catalog.root, "projects", "me", "plan.enc"), ns=(1, 1))
+    assert catalog.refresh(force=True) == 1
+    entry = catalog.entries["projects/plan.enc"]
+    assert entry["clock"] == {"n1": 2} and entry["version"] == 2
+
+    os.remove(os.path.join(catalog.root, "projects", "me", "plan.enc"))
+    assert catalog.refresh(force=True) == 1
+    assert catalog.entries["projects/plan.enc"]["deleted"]
+
+
+def test_changes_since_pages_through_the_log_and_filters_by_permission(tmp_path, monkeypatch):
+    catalog = _catalog(tmp_path)
+    for i in range(5):
+        _write(catalog, f"projects/p{i}.enc", b"x%d" % i)
+    _write(catalog, "inventory/stock.csv", b"a,b")
+    catalog.refresh(force=True)
+    permissions = {"projects": [f"p{i}.enc" for i in range(5)]}
+
+    page = catalog.changes_since(0, permissions, limit=2)
+    assert page["reset"] and page["more"] and len(page["changes"]) == 2
+    seen = [c["id"] for c in page["changes"]]
+    while page["more"]:
+        page = catalog.changes_since(page["next"], permissions, scope=page["scope"], limit=2)
+        assert not page["reset"]
+        seen += [c["id"] for c in page["changes"]]
+    assert sorted(seen) == [f"projects/p{i}.enc" for i in range(5)]
+    assert "mtime_ns" not in page["changes"][0]
+    assert page["next"] == catalog.version
+
+    # Caught up: nothing left to send until something changes
+    assert catalog.changes_since(page["next"], permissions, scope=page["scope"])["changes"] == []
+
+
+def test_changed_permissions_reset_the_peer_cursor(tmp_path):
+    catalog = _catalog(tmp_path)
+    _write(catalog, "projects/plan.enc", b"v1")
+    _write(catalog, "inventory/stock.csv", b"a,b")
+    catalog.refresh(force=True)
+    first = catalog.changes_since(0, {"projects": ["plan"]})
+    assert [c["id"] for c in first["changes"]] == ["projects/plan.enc"]
+
+    wider = catalog.changes_since(first["next"], SHARED, scope=first["scope"])
+    assert wider["reset"] and wider["scope"] != first["scope"]
+    assert sorted(c["id"] for c in wider["changes"]) == ["inventory/stock.csv", "projects/plan.enc"]
+
+
+# --- Peer views ---
+
+def _remote(file_id, sha256, clock, deleted=False):
+    return {"id": file_id, "sha256": sha256, "clock": clock, "deleted": deleted}
+
+
+def test_status_classifies_every_relationship(tmp_path):
+    catalog = _catalog(tmp_path)
+    for name in ("same", "ahead", "behind", "fork", "mine"):
+        _write(catalog, f"projects/{name}.enc", name.encode())
+    catalog.refresh(force=True)
+    sha = {fid: e["sha256"] for fid, e in catalog.entries.items()}
+    catalog.apply_remote("peer", {"scope": "s", "next": 9, "changes": [
+        _remote("projects/same.enc", sha["projects/same.enc"], {"n1": 1}),
+        _remote("projects/ahead.enc", "old", {}),
+        _remote("projects/behind.enc", "new", {"n1": 1, "peer": 1}),
+        _remote("projects/fork.enc", "theirs", {"peer": 1}),
+        _remote("projects/theirs.enc", "only", {"peer": 1}),
+        _remote("projects/gone.enc", None, {"peer": 2}, deleted=True),
+    ]})
+
+    assert catalog.status("peer") == {
+        "projects/same.enc": IN_SYNC,
+        "projects/ahead.enc": LOCAL_NEWER,
+        "projects/behind.enc": PEER_NEWER,
+        "projects/fork.enc": CONFLICT,
+        "projects/mine.enc": LOCAL_ONLY,
+        "projects/theirs.enc": PEER_ONLY,
+    }
+    assert catalog.pullable("peer") == [("projects/behind.enc", "new"), ("projects/theirs.enc", "only")]
+    assert catalog.cursor("peer") == (9, "s")
+
+
+def test_received_content_adopts_the_senders_clock(tmp_path):
+    catalog = _catalog(tmp_path)
+    catalog.apply_remote("peer", {"scope": "s", "next": 1, "changes": [
+        _remote("projects/plan.enc", hashlib.sha256(b"from peer").hexdigest(), {"peer": 3})
+    ]})
+    _write(catalog, "projects/plan.enc", b"from peer")
+    catalog.refresh(force=True)
+    assert catalog.entries["projects/plan.enc"]["clock"] == {"peer": 3}
+    assert catalog.status("peer") == {"projects/plan.enc": IN_SYNC}
+
+
+def test_catalog_survives_a_reload(tmp_path):
+    catalog = _catalog(tmp_path)
+    _write(catalog, "projects/plan.enc", b"v1")
+    catalog.refresh(force=True)
+    catalog.apply_remote("peer", {"scope": "s", "next": 4, "changes": []})
+    catalog.save()
+
+    again = SyncCatalog("me", "n1", path=catalog.path, root=catalog.root)
+    assert again.catalog_id == catalog.catalog_id and again.version == catalog.version
+    assert again.cursor("peer") == (4, "s")
+    assert [c["id"] for c in again.changes_since(0, SHARED)["changes"]] == ["projects/plan.enc"]
+
+
+def test_fetch_catalog_exchanges_only_shared_files(ghost_nodes, tmp_path):
+    home = ghost_nodes("cat_home")
+    peer = ghost_nodes("cat_peer")
+    ghost_nodes.peers["cat_home"]["permissions"]["projects"] = ["plan"]
+    home.catalog = _catalog(tmp_path, "cat_home", home.ghost_id)
+    peer.catalog = _catalog(tmp_path, "cat_peer", peer.ghost_id)
+    _write(peer.catalog, "projects/plan.enc", b"shared")
+    _write(peer.catalog, "projects/secret.enc", b"private")
+
+    status = home.fetch_catalog(target_of("cat_peer", peer)).result(timeout=15)
+    assert status == {"projects/plan.enc": PEER_ONLY}
+
+    # A second exchange resumes from the cursor and only carries what changed since
+    since, scope = home.catalog.cursor(peer.ghost_id)
+    assert since == peer.catalog.version and scope
+    home.fetch_catalog(target_of("cat_peer", peer)).result(timeout=15)
+    assert home.catalog.cursor(peer.ghost_id) == (since, scope)
@@ -0,0 +1,36 @@
+import asyncio
+import os
+
+from conftest import target_of
+from core.network_manager import CHUNK_SIZE, MAX_PARALLEL_STREAMS, _SendWindow
+
+
+def test_send_window_only_moves_forward():
+    async def scenario():
+        window = _SendWindow()
+        window.update(64)
+        window.update(10)
+        window.update("junk")
+        assert window.received == 64
+        assert not await window.wait(0.01)
+        asyncio.get_running_loop().call_later(0.01, window.update, 128)
+        assert await window.wait(1.0)
+        return window.received
+
+    assert asyncio.run(scenario()) == 128
+
+
+def test_parallel_streams_are_paced_to_the_receiver(ghost_nodes, tmp_path):
+    sender, receiver = ghost_nodes("pace_a"), ghost_nodes("pace_b")
+    paths = []
+    for i in range(MAX_PARALLEL_STREAMS):
+        path = tmp_path / f"bulk_{i}.enc"
+        path.write_bytes(os.urandom(3 * 1024 * 1024))
+        paths.append(str(path))
+
+    stats = sender.sync_files([target_of("pace_b", receiver)], paths).result(timeout=120)
+
+    chunks = len(paths) * 3 * 1024 * 1024 // CHUNK_SIZE
+    assert stats["ok"] == len(paths)
+    assert receiver.rx_dropped == 0
+    assert stats["retransmits"] <= chunks * 0.05